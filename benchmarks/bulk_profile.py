@@ -0,0 +1,91 @@
+##
+# bulk_profile.py
+#
+# Description: Compare loading a synthetic layer with and without the bulk load profile
+#              Usage: python -m benchmarks.bulk_profile "dbname=... host=..." [rows]
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import json
+import random
+import struct
+import sys
+import time
+
+import psycopg2
+
+from fgdb2postgis.copy_loader import CopyLoader
+from fgdb2postgis.postgis import BULK_SESSION_SQL
+
+
+class SyntheticSource:
+    def __init__(self, rows):
+        self.row_count = rows
+
+    def describe(self, layer):
+        fields = [
+            ('OBJECTID', 'OID', 4),
+            ('Shape', 'Geometry', 0),
+            ('NAME', 'String', 50),
+            ('CODE', 'Integer', 4),
+            ('VALUE', 'Double', 8)
+        ]
+        return fields, ('Polygon', False, False)
+
+    def rows(self, layer, cursor_fields, where=None):
+        rnd = random.Random(1)
+        for oid in range(1, self.row_count + 1):
+            x, y = rnd.uniform(0, 100000), rnd.uniform(0, 100000)
+            ring = [x, y, x + 10, y, x + 10, y + 10, x, y + 10, x, y]
+            wkb = b'\x01' + struct.pack('<III', 3, 1, 5) + struct.pack('<10d', *ring)
+            yield (oid, wkb, 'feature {}'.format(oid), rnd.randint(1, 50), rnd.random())
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, round(time.time() - start, 3)
+
+
+def execute(dsn, statements):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    conn.close()
+
+
+def run(dsn, rows, bulk):
+    session_sql = BULK_SESSION_SQL if bulk else []
+    layer = 'bulk_profile_bench'
+    loader = CopyLoader(dsn, SyntheticSource(rows), 3857, unlogged=bulk, session_sql=session_sql)
+
+    result = {'bulk': bulk, 'rows': rows}
+    (returncode, error), result['load'] = timed(loader.load_layer, layer)
+    if returncode != 0:
+        raise RuntimeError(error)
+
+    _, result['index'] = timed(execute, dsn, session_sql + [
+        'CREATE UNIQUE INDEX "{0}_CODE_idx" ON "{0}" ("id", "CODE")'.format(layer)])
+
+    finish = ['ALTER TABLE "{}" SET LOGGED'.format(layer)] if bulk else []
+    _, result['finish'] = timed(execute, dsn, finish + ['ANALYZE "{}"'.format(layer)])
+
+    result['total'] = round(result['load'] + result['index'] + result['finish'], 3)
+    execute(dsn, ['DROP TABLE "{}"'.format(layer)])
+    return result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python -m benchmarks.bulk_profile DSN [rows]')
+        sys.exit(1)
+
+    dsn = sys.argv[1]
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+
+    results = [run(dsn, rows, False), run(dsn, rows, True)]
+    results.append({'speedup': round(results[0]['total'] / results[1]['total'], 2)})
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,59 @@
+##
+# gdbtable_profile.py
+#
+# Description: Compare the COPY encoding of a synthetic .gdbtable layer read row by row
+#              (cursor tuples and field encoders) and read in blocks (copy_blocks)
+#              No database required, the COPY data is read to the end and discarded
+#              Usage: python -m benchmarks.gdbtable_profile [rows] [layer]
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import json
+import sys
+import tempfile
+
+from benchmarks.bulk_profile import timed
+from benchmarks.synthetic_arcpy import SyntheticCatalog
+from benchmarks.synthetic_gdbtable import write_workspace
+from fgdb2postgis.copy_loader import BlockStream, CopyStream, table_columns
+from fgdb2postgis.gdbtable import GdbTableSource
+
+
+def drain(stream):
+    size = 0
+    for data in iter(stream.read, b''):
+        size += len(data)
+
+    return size
+
+
+def run(source, layer, mode):
+    fields, geometry = source.describe(layer)
+    columns = table_columns(fields, geometry, 3857)
+
+    if mode == 'rows':
+        stream = CopyStream(columns, source.rows(layer, [column[2] for column in columns]))
+    else:
+        stream = BlockStream(source.copy_blocks(layer, columns))
+
+    size, duration = timed(drain, stream)
+    return {'mode': mode, 'rows': stream.row_count, 'bytes': size, 'seconds': duration,
+            'rows/s': round(stream.row_count / duration) if duration else None}
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    layer = sys.argv[2] if len(sys.argv) > 2 else 'table_1'
+
+    catalog = SyntheticCatalog(rows=rows, datasets=1, layers=3, root_layers=0, tables=1)
+    with tempfile.TemporaryDirectory() as folder:
+        print('Writing synthetic geodatabase ({} rows per layer) ...'.format(rows))
+        write_workspace(folder, catalog)
+
+        source = GdbTableSource(folder, 'EPSG:3857', 'EPSG:3857')
+        results = [run(source, layer, mode) for mode in ('rows', 'blocks')]
+        source.close()
+
+    results.append({'rows/blocks': round(results[0]['seconds'] / results[1]['seconds'], 2)})
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,88 @@
+##
+# reproject_profile.py
+#
+# Description: Compare client side (pyproj, pool of processes) and server side
+#              (ST_Transform in parallel chunks) reprojection of a synthetic layer
+#              Usage: python -m benchmarks.reproject_profile "dbname=... host=..." [rows] [jobs]
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import json
+import sys
+
+import psycopg2
+
+from benchmarks.bulk_profile import SyntheticSource, timed
+from fgdb2postgis.copy_loader import CopyLoader
+from fgdb2postgis.ddl_executor import DDLExecutor
+from fgdb2postgis.reproject import STAGING_SCHEMA, ClientReprojector, server_graph, staging_tables
+
+A_SRS = 'EPSG:3857'
+T_SRS = 'EPSG:4326'
+LAYER = 'reproject_profile_bench'
+
+
+def execute(dsn, statements):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    conn.close()
+
+
+def load(loader):
+    returncode, error = loader.load_layer(LAYER)
+    if returncode != 0:
+        raise RuntimeError(error)
+
+
+def run_client(dsn, rows, jobs):
+    reprojector = ClientReprojector(A_SRS, T_SRS, jobs)
+    loader = CopyLoader(dsn, SyntheticSource(rows), 4326, reprojector=reprojector)
+
+    result = {'reproject': 'client', 'rows': rows, 'jobs': jobs}
+    _, result['load'] = timed(load, loader)
+    reprojector.close()
+
+    result['transform'] = 0
+    result['total'] = result['load']
+    return result
+
+
+def run_server(dsn, rows, jobs):
+    execute(dsn, ['CREATE SCHEMA IF NOT EXISTS "{}"'.format(STAGING_SCHEMA)])
+    loader = CopyLoader(dsn, SyntheticSource(rows), 3857, schema=STAGING_SCHEMA, spatial_index=False)
+
+    result = {'reproject': 'server', 'rows': rows, 'jobs': jobs}
+    _, result['load'] = timed(load, loader)
+
+    def transform():
+        conn = psycopg2.connect(dsn)
+        tables = staging_tables(conn)
+        conn.close()
+        if DDLExecutor(dsn, jobs).run(server_graph(tables, 4326)):
+            raise RuntimeError('server side reprojection failed')
+
+    _, result['transform'] = timed(transform)
+    result['total'] = round(result['load'] + result['transform'], 3)
+    return result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python -m benchmarks.reproject_profile DSN [rows] [jobs]')
+        sys.exit(1)
+
+    dsn = sys.argv[1]
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+    jobs = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    results = []
+    for run in (run_client, run_server):
+        results.append(run(dsn, rows, jobs))
+        execute(dsn, ['DROP TABLE IF EXISTS "{}"'.format(LAYER)])
+
+    results.append({'server/client': round(results[1]['total'] / results[0]['total'], 2)})
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,184 @@
+##
+# suite.py
+#
+# Description: End-to-end benchmark on a synthetic file geodatabase (no ArcGIS required)
+#              Times the FileGDB.process_* phases and, given a database, the PostGIS phases
+#              Results are written as json, a previous result file can be given to compare
+#
+#              Usage: python -m benchmarks.suite [--datasets=N] [--layers=M] [--rows=K]
+#                     [--tables=T] [--domains=D] [--subtypes=S] [--dsn="dbname=... host=..."]
+#                     [--jobs=J] [--bulk] [--final-data=view|matview|table]
+#                     [--output=results.json] [--compare=previous.json]
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import getopt
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from os import path
+
+from benchmarks import synthetic_arcpy
+
+OPTIONS = ['datasets', 'layers', 'root_layers', 'tables', 'rows', 'domains', 'codes', 'domain_fields',
+           'subtypes', 'orphans']
+
+
+def timed(timings, phase, func, *args):
+    start = time.time()
+    result = func(*args)
+    timings[phase] = round(time.time() - start, 4)
+    print(" {0}: {1:.3f}s".format(phase, timings[phase]))
+    return result
+
+
+# -------------------------------------------------------------------------------
+# FileGDB phases, the sql scripts are written next to the synthetic workspace
+#
+def run_filegdb(folder, timings, final_data=None):
+    from fgdb2postgis.filegdb import FileGDB
+
+    workspace = path.join(folder, 'synthetic.gdb')
+    filegdb = timed(timings, 'filegdb.init', FileGDB, workspace, 'EPSG:3857')
+    timed(timings, 'filegdb.open_files', filegdb.open_files)
+    timed(timings, 'filegdb.process_domains', filegdb.process_domains)
+    timed(timings, 'filegdb.process_subtypes', filegdb.process_subtypes)
+    timed(timings, 'filegdb.process_relations', filegdb.process_relations)
+    timed(timings, 'filegdb.process_schemas', filegdb.process_schemas)
+    if final_data:
+        timed(timings, 'filegdb.process_views', filegdb.process_views, final_data)
+    timed(timings, 'filegdb.close_files', filegdb.close_files)
+
+    return filegdb
+
+
+# -------------------------------------------------------------------------------
+# PostGIS phases, layers are loaded with the copy engine (ogr2ogr cannot read
+# the synthetic workspace)
+#
+def run_postgis(filegdb, dsn, jobs, bulk, timings, final_data=None):
+    from psycopg2.extensions import parse_dsn
+    from fgdb2postgis.postgis import PostGIS
+
+    params = parse_dsn(dsn)
+    postgis = PostGIS(params.get('host', 'localhost'), params.get('port', '5432'),
+                      params.get('user', 'postgres'), params.get('password', ''),
+                      params['dbname'], 'EPSG:3857', bulk)
+    postgis.connect()
+
+    timed(timings, 'postgis.update_views', postgis.update_views)
+    timed(timings, 'postgis.create_schemas', postgis.create_schemas, filegdb)
+    timed(timings, 'postgis.load_lookup_tables', postgis.load_lookup_tables, filegdb)
+    timed(timings, 'postgis.load_database', postgis.load_database, filegdb, jobs, 'copy')
+    timed(timings, 'postgis.check_orphans', postgis.check_orphans, filegdb, jobs)
+    timed(timings, 'postgis.apply_sql', postgis.apply_sql, filegdb, None, jobs)
+    timed(timings, 'postgis.finish_bulk_load', postgis.finish_bulk_load, filegdb, jobs)
+    if final_data:
+        timed(timings, 'postgis.create_final_data', postgis.create_final_data, filegdb, jobs)
+
+    postgis.disconnect()
+
+
+def run(options, dsn=None, jobs=1, bulk=False, final_data=None):
+    sys.modules['arcpy'] = synthetic_arcpy
+    catalog = synthetic_arcpy.configure(**options)
+
+    result = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'options': catalog.options,
+        'jobs': jobs,
+        'bulk': bulk,
+        'final_data': final_data,
+        'layers': len(catalog.layers),
+        'relationships': len(catalog.relationships),
+        'timings': {}
+    }
+
+    start = time.time()
+    with tempfile.TemporaryDirectory() as folder:
+        filegdb = run_filegdb(folder, result['timings'], final_data)
+        result['arcpy_calls'] = filegdb.catalog.arcpy_calls
+
+        if dsn:
+            run_postgis(filegdb, dsn, jobs, bulk, result['timings'], final_data)
+
+    result['total'] = round(time.time() - start, 4)
+    return result
+
+
+# -------------------------------------------------------------------------------
+# Print the phases of two results side by side
+#
+def compare(previous, current):
+    print("\n{0:<32} {1:>10} {2:>10} {3:>8}".format('phase', 'previous', 'current', 'ratio'))
+
+    phases = list(current['timings'])
+    phases += [phase for phase in previous['timings'] if phase not in phases]
+    for phase in phases + ['total']:
+        if phase == 'total':
+            before, after = previous.get('total'), current.get('total')
+        else:
+            before, after = previous['timings'].get(phase), current['timings'].get(phase)
+
+        ratio = '{:.2f}'.format(after / before) if before and after is not None else '-'
+        print("{0:<32} {1:>10} {2:>10} {3:>8}".format(
+            phase, '-' if before is None else before, '-' if after is None else after, ratio))
+
+
+def show_usage():
+    print('Usage: python -m benchmarks.suite [--datasets=N] [--layers=M] [--rows=K] [--tables=T]')
+    print('                                  [--domains=D] [--subtypes=S] [--dsn=DSN] [--jobs=J]')
+    print('                                  [--bulk] [--final-data=view|matview|table]')
+    print('                                  [--output=results.json] [--compare=previous.json]')
+    sys.exit(1)
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, 'h', [o + '=' for o in OPTIONS] + [
+            'dsn=', 'jobs=', 'bulk', 'final-data=', 'output=', 'compare=', 'help'])
+    except getopt.GetoptError:
+        show_usage()
+
+    options = {}
+    dsn, jobs, bulk, final_data = None, 1, False, None
+    output = 'benchmark_{}.json'.format(datetime.now().strftime('%Y%m%d_%H%M%S'))
+    previous = None
+
+    for opt, arg in opts:
+        name = opt[2:]
+        if opt in ('-h', '--help'):
+            show_usage()
+        elif name in OPTIONS:
+            options[name] = synthetic_arcpy.parse_options('{0}={1}'.format(name, arg))[name]
+        elif opt == '--dsn':
+            dsn = arg
+        elif opt == '--jobs':
+            jobs = int(arg)
+        elif opt == '--bulk':
+            bulk = True
+        elif opt == '--final-data':
+            final_data = arg
+        elif opt == '--output':
+            output = arg
+        elif opt == '--compare':
+            previous = arg
+
+    result = run(options, dsn, jobs, bulk, final_data)
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print("\nResults written to {}".format(output))
+
+    if previous:
+        with open(previous, 'r', encoding='utf-8') as f:
+            compare(json.load(f), result)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,316 @@
+##
+# synthetic_arcpy.py
+#
+# Description: Stand-in arcpy module serving a synthetic file geodatabase
+#              N datasets x M feature classes x K rows, stand-alone tables,
+#              coded value domains, subtypes and relationship classes
+#              Install it with sys.modules['arcpy'] before importing fgdb2postgis
+#              Configure with configure(...) or FGDB2POSTGIS_SYNTHETIC="datasets=2,layers=5,rows=1000"
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import random
+import re
+import struct
+import types
+from datetime import datetime, timedelta
+from os import environ
+
+DEFAULTS = {
+    'datasets': 2,      # feature datasets
+    'layers': 5,        # feature classes per dataset
+    'root_layers': 2,   # feature classes outside of datasets
+    'tables': 2,        # stand-alone tables
+    'rows': 1000,       # rows per layer
+    'domains': 3,       # coded value domains
+    'codes': 5,         # coded values per domain
+    'domain_fields': 1, # fields with a coded value domain per layer
+    'subtypes': 3,      # subtypes per layer, 0 for none
+    'orphans': 0.0,     # fraction of feature rows referencing a missing table row
+    'seed': 1
+}
+
+SHAPE_TYPES = ['Point', 'Polyline', 'Polygon']
+
+env = types.SimpleNamespace(workspace=None, overwriteOutput=False)
+
+
+class Field:
+    def __init__(self, name, field_type, length):
+        self.name = name
+        self.type = field_type
+        self.length = length
+
+
+class Domain:
+    def __init__(self, name, domain_type, field_type, coded_values):
+        self.name = name
+        self.domainType = domain_type
+        self.type = field_type
+        self.codedValues = coded_values
+
+
+class Describe:
+    def __init__(self, name):
+        catalog = get_catalog()
+        if name in catalog.relationships:
+            self.__dict__.update(catalog.relationships[name])
+        elif name in catalog.layers:
+            self.__dict__.update(catalog.layers[name])
+        else:
+            raise IOError('"{}" does not exist'.format(name))
+
+
+class Result:
+    def __init__(self, *outputs):
+        self.outputs = outputs
+
+    def getOutput(self, index):
+        return self.outputs[index]
+
+
+class SpatialReference:
+    def __init__(self, code):
+        self.factoryCode = code
+
+
+# -------------------------------------------------------------------------------
+# Synthetic catalog
+#
+class SyntheticCatalog:
+    def __init__(self, **options):
+        self.options = dict(DEFAULTS)
+        self.options.update(options)
+        self.datasets = {}
+        self.layers = {}
+        self.relationships = {}
+        self.domains = []
+        self.build()
+
+    def build(self):
+        opt = self.options
+
+        for d in range(1, opt['domains'] + 1):
+            codes = {c: 'Domain {0} value {1}'.format(d, c) for c in range(1, opt['codes'] + 1)}
+            self.domains.append(Domain('Domain {}'.format(d), 'CodedValue', 'Short', codes))
+        # range domains are not converted to lookup tables
+        self.domains.append(Domain('Range 1', 'Range', 'Double', None))
+
+        tables = ['table_{}'.format(t) for t in range(1, opt['tables'] + 1)]
+        for table in tables:
+            self.add_layer(table, None)
+
+        self.datasets[''] = []
+        for j in range(1, opt['root_layers'] + 1):
+            self.add_layer('fc_{}'.format(j), '', tables)
+
+        for i in range(1, opt['datasets'] + 1):
+            fds = 'Dataset_{}'.format(i)
+            self.datasets[fds] = []
+            for j in range(1, opt['layers'] + 1):
+                self.add_layer('fc_{0}_{1}'.format(i, j), fds, tables)
+
+    def add_layer(self, name, fds, tables=None):
+        index = len(self.layers)
+        fields = [
+            Field('OBJECTID', 'OID', 4),
+            Field('NAME', 'String', 50),
+            Field('SUBTYPE', 'SmallInteger', 2),
+            Field('STATUS', 'SmallInteger', 2),
+            Field('VALUE', 'Double', 8),
+            Field('CREATED', 'Date', 8),
+            Field('TABLE_ID', 'Integer', 4)
+        ]
+        fields += [Field(name, 'SmallInteger', 2) for name in domain_field_names(self.options)[1:]]
+
+        layer = {'name': name, 'fields': fields, 'relationshipClassNames': [], 'dataset': fds, 'index': index}
+
+        if fds is not None:
+            fields.insert(1, Field('Shape', 'Geometry', 0))
+            layer.update(shapeType=SHAPE_TYPES[index % len(SHAPE_TYPES)], hasZ=False, hasM=False)
+            self.datasets[fds].append(name)
+
+            # feature classes are the destination of a relationship with a table
+            if tables:
+                table = tables[index % len(tables)]
+                rel_name = '{0}_{1}_rel'.format(table, name)
+                self.relationships[rel_name] = {
+                    'name': rel_name,
+                    'originClassNames': [table],
+                    'destinationClassNames': [name],
+                    'originClassKeys': [('TABLE_ID', 'OriginPrimary'), ('TABLE_ID', 'OriginForeign')],
+                    'isAttachmentRelationship': False
+                }
+                layer['relationshipClassNames'].append(rel_name)
+                self.layers[table]['relationshipClassNames'].append(rel_name)
+
+        self.layers[name] = layer
+
+    def coded_domain(self, index):
+        coded = [d for d in self.domains if d.domainType == 'CodedValue']
+        return coded[index % len(coded)] if coded else None
+
+    def subtypes(self, name):
+        layer = self.layers[name]
+        domain_fields = domain_field_names(self.options)
+        field_values = {}
+        for field in layer['fields']:
+            domain = None
+            if field.name in domain_fields:
+                domain = self.coded_domain(layer['index'] + domain_fields.index(field.name))
+            field_values[field.name] = (None, domain)
+
+        count = self.options['subtypes']
+        if not count:
+            return {0: {'Name': '', 'Default': True, 'SubtypeField': '', 'FieldValues': field_values}}
+
+        return {code: {'Name': 'Subtype {}'.format(code), 'Default': code == 1,
+                       'SubtypeField': 'SUBTYPE', 'FieldValues': dict(field_values)}
+                for code in range(1, count + 1)}
+
+    # -------------------------------------------------------------------------------
+    # Rows of a layer, values in the order of the cursor fields
+    #
+    def rows(self, name, cursor_fields):
+        opt = self.options
+        layer = self.layers[name]
+        rnd = random.Random('{0}:{1}'.format(opt['seed'], name))
+        shape_type = layer.get('shapeType')
+        start = datetime(2020, 1, 1)
+
+        for oid in range(1, opt['rows'] + 1):
+            if shape_type:
+                table_id = rnd.randint(1, opt['rows'])
+                if rnd.random() < opt['orphans']:
+                    table_id += opt['rows']
+            else:
+                table_id = oid
+
+            values = {
+                'OID@': oid,
+                'OBJECTID': oid,
+                'NAME': '{0} {1}'.format(name, oid),
+                'SUBTYPE': rnd.randint(1, max(opt['subtypes'], 1)),
+                'STATUS': rnd.randint(1, max(opt['codes'], 1)),
+                'VALUE': rnd.random() * 1000,
+                'CREATED': start + timedelta(seconds=rnd.randint(0, 86400 * 365)),
+                'TABLE_ID': table_id
+            }
+            for field in domain_field_names(opt)[1:]:
+                values[field] = rnd.randint(1, max(opt['codes'], 1))
+            if shape_type:
+                values['SHAPE@WKB'] = geometry_wkb(shape_type, rnd)
+
+            yield tuple(values.get(field) for field in cursor_fields)
+
+
+def domain_field_names(options):
+    return ['STATUS'] + ['STATUS_{}'.format(k) for k in range(2, options['domain_fields'] + 1)]
+
+
+def geometry_wkb(shape_type, rnd):
+    x, y = rnd.uniform(0, 100000), rnd.uniform(0, 100000)
+    if shape_type == 'Point':
+        return b'\x01' + struct.pack('<I2d', 1, x, y)
+    if shape_type == 'Polyline':
+        return b'\x01' + struct.pack('<II4d', 2, 2, x, y, x + 10, y + 10)
+
+    ring = [x, y, x + 10, y, x + 10, y + 10, x, y + 10, x, y]
+    return b'\x01' + struct.pack('<III10d', 3, 1, 5, *ring)
+
+
+_catalog = None
+
+
+def parse_options(text):
+    options = {}
+    for item in filter(None, text.split(',')):
+        key, value = item.split('=')
+        key = key.strip()
+        options[key] = float(value) if key == 'orphans' else int(value)
+
+    return options
+
+
+def configure(**options):
+    global _catalog
+    _catalog = SyntheticCatalog(**options)
+    return _catalog
+
+
+def get_catalog():
+    if _catalog is None:
+        configure(**parse_options(environ.get('FGDB2POSTGIS_SYNTHETIC', '')))
+
+    return _catalog
+
+
+# -------------------------------------------------------------------------------
+# arcpy functions used by fgdb2postgis
+#
+def ListDatasets(wild_card=None, feature_type=None):
+    return [fds for fds in get_catalog().datasets if fds]
+
+
+def ListTables(wild_card=None, table_type=None):
+    return [name for name, layer in get_catalog().layers.items() if layer['dataset'] is None]
+
+
+def ListFeatureClasses(wild_card=None, feature_type=None, feature_dataset=None):
+    return list(get_catalog().datasets.get(feature_dataset or '', []))
+
+
+def Exists(name):
+    catalog = get_catalog()
+    return name in catalog.layers or name in catalog.datasets
+
+
+def GetCount_management(name):
+    catalog = get_catalog()
+    if name not in catalog.layers:
+        raise IOError('"{}" does not exist'.format(name))
+
+    return Result(str(catalog.options['rows']))
+
+
+# OBJECTID range where clauses ("OBJECTID" >= a AND "OBJECTID" < b) and
+# ORDER BY OBJECTID DESC are understood, other clauses are ignored
+class SearchCursor:
+    def __init__(self, name, field_names, where_clause=None, spatial_reference=None, sql_clause=(None, None),
+                 **kwargs):
+        rows = get_catalog().rows(name, ['OID@'] + list(field_names))
+
+        bounds = re.findall(r'"?OBJECTID"?\s*(>=|<)\s*(\d+)', where_clause or '')
+        low = max([int(value) for op, value in bounds if op == '>='], default=None)
+        high = min([int(value) for op, value in bounds if op == '<'], default=None)
+        rows = (row[1:] for row in rows
+                if (low is None or row[0] >= low) and (high is None or row[0] < high))
+
+        if 'DESC' in (sql_clause[1] or '').upper():
+            rows = (row for row in list(rows)[::-1])
+        self.rows = rows
+
+    def __iter__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.rows.close()
+
+
+def ListDomains(workspace=None):
+    return list(get_catalog().domains)
+
+
+def ListSubtypes(name):
+    return get_catalog().subtypes(name)
+
+
+da = types.SimpleNamespace(
+    ListDomains=ListDomains,
+    ListSubtypes=ListSubtypes,
+    SearchCursor=SearchCursor
+)
@@ -0,0 +1,311 @@
+##
+# synthetic_gdbtable.py
+#
+# Description: Write .gdbtable/.gdbtablx files (file geodatabase 10.x format) for the tests
+#              and benchmarks of the gdbtable reader, no GDAL or ArcGIS required
+#              write_table writes one table, write_workspace the layers of the synthetic
+#              arcpy catalog with their system catalog (a00000001.gdbtable) and write_items
+#              the GDB_Items system table
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import struct
+import uuid
+from datetime import date, datetime, time, timedelta
+from os import makedirs, path
+
+from fgdb2postgis.gdbtable import GDB_EPOCH, GDB_TYPES, GeometryInfo
+
+TYPE_CODES = {name: code for code, name in GDB_TYPES.items()}
+SHAPE_CODES = {'Point': 1, 'Multipoint': 2, 'Polyline': 3, 'Polygon': 4}
+SYSTEM_TABLES = ['GDB_SystemCatalog', 'GDB_DBTune', 'GDB_SpatialRefs', 'GDB_Items', 'GDB_ItemTypes',
+                 'GDB_ItemRelationships', 'GDB_ItemRelationshipTypes', 'GDB_ReplicaLog']
+
+GEOMETRY_INFO = GeometryInfo(-20037700.0, -30198300.0, 10000.0, -100000.0, 10000.0, -100000.0, 10000.0)
+WKT = 'PROJCS["WGS_1984_Web_Mercator_Auxiliary_Sphere"]'
+
+
+def varuint(value):
+    data = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        data.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(data)
+
+
+def varint(value):
+    data = bytearray([(0x40 if value < 0 else 0) | (abs(value) & 0x3F)])
+    value = abs(value) >> 6
+    while value:
+        data[-1] |= 0x80
+        data.append(value & 0x7F)
+        value >>= 7
+
+    return bytes(data)
+
+
+def utf16(text):
+    return struct.pack('<B', len(text)) + text.encode('utf-16-le')
+
+
+# -------------------------------------------------------------------------------
+# WKB (little endian, 2D or ISO Z/M) to the geometry blob of the file geodatabase
+# Rings and parts are written in the order and orientation of the WKB
+#
+def read_wkb(wkb, offset=0):
+    code = struct.unpack_from('<I', wkb, offset + 1)[0]
+    geom_type, dims = code % 1000, 2 + (code // 1000 in (1, 3)) + (code // 1000 in (2, 3))
+    offset += 5
+
+    def points(offset):
+        count = struct.unpack_from('<I', wkb, offset)[0]
+        values = struct.unpack_from('<{}d'.format(count * dims), wkb, offset + 4)
+        return [values[i:i + dims] for i in range(0, len(values), dims)], offset + 4 + 8 * dims * count
+
+    if geom_type == 1:
+        return 'point', [[struct.unpack_from('<{}d'.format(dims), wkb, offset)]], code, offset + 8 * dims
+    if geom_type == 2:
+        line, offset = points(offset)
+        return 'polyline', [line], code, offset
+
+    # polygon rings, or the parts of a multi geometry
+    count = struct.unpack_from('<I', wkb, offset)[0]
+    offset += 4
+    parts = []
+    for index in range(count):
+        if geom_type == 3:
+            ring, offset = points(offset)
+            parts.append(ring)
+        else:
+            kind, sub_parts, sub_code, offset = read_wkb(wkb, offset)
+            parts += sub_parts
+
+    if geom_type == 4:
+        return 'multipoint', [[part[0] for part in parts]], code, offset
+
+    return {3: 'polygon', 5: 'polyline', 6: 'polygon'}[geom_type], parts, code, offset
+
+
+def encode_shape(wkb, info=GEOMETRY_INFO):
+    kind, parts, code, offset = read_wkb(wkb)
+    has_z, has_m = code // 1000 in (1, 3), code // 1000 in (2, 3)
+    base = {'point': 1, 'multipoint': 8, 'polyline': 3, 'polygon': 5}[kind]
+    shape_type = base if not has_z and not has_m else \
+        {'point': 52, 'multipoint': 53, 'polyline': 50, 'polygon': 51}[kind] | \
+        (0x80000000 if has_z else 0) | (0x40000000 if has_m else 0)
+
+    def quantize(value, origin, scale):
+        return int(round((value - origin) * scale))
+
+    axes = [(info.xorigin, info.xyscale), (info.yorigin, info.xyscale)]
+    if has_z:
+        axes.append((info.zorigin, info.zscale))
+    if has_m:
+        axes.append((info.morigin, info.mscale))
+
+    if kind == 'point':
+        return varuint(shape_type) + b''.join(
+            varuint(quantize(value, origin, scale) + 1) for value, (origin, scale) in zip(parts[0][0], axes))
+
+    coords = [point for part in parts for point in part]
+    xs = [quantize(point[0], info.xorigin, info.xyscale) for point in coords]
+    ys = [quantize(point[1], info.yorigin, info.xyscale) for point in coords]
+
+    data = varuint(shape_type) + varuint(len(coords))
+    if kind != 'multipoint':
+        data += varuint(len(parts))
+    data += varuint(min(xs)) + varuint(min(ys)) + varuint(max(xs) - min(xs)) + varuint(max(ys) - min(ys))
+    data += b''.join(varuint(len(part)) for part in parts[:-1]) if kind != 'multipoint' else b''
+
+    last_x = last_y = 0
+    for x, y in zip(xs, ys):
+        data += varint(x - last_x) + varint(y - last_y)
+        last_x, last_y = x, y
+
+    for axis, (origin, scale) in enumerate(axes[2:], 2):
+        last = 0
+        for point in coords:
+            value = quantize(point[axis], origin, scale)
+            data += varint(value - last)
+            last = value
+
+    return data
+
+
+# -------------------------------------------------------------------------------
+# Field descriptions and values
+# fields: (name, type, width, nullable), geometry: (shape type, has_z, has_m)
+#
+def field_description(name, field_type, width, nullable, geometry=None, info=GEOMETRY_INFO):
+    code = TYPE_CODES[field_type]
+    flags = 1 if nullable else 0
+    data = utf16(name) + utf16('') + struct.pack('<B', code)
+
+    if field_type == 'Geometry':
+        shape_type, has_z, has_m = geometry
+        wkt = WKT.encode('utf-16-le')
+        data += struct.pack('<BBh', 0, flags, len(wkt)) + wkt
+        data += struct.pack('<B', 1 | (2 if has_m else 0) | (4 if has_z else 0))
+        values = [info.xorigin, info.yorigin, info.xyscale]
+        values += [info.morigin, info.mscale] if has_m else []
+        values += [info.zorigin, info.zscale] if has_z else []
+        values += [0.001] + ([0.001] if has_m else []) + ([0.001] if has_z else [])
+        values += [0.0, 0.0, 100000.0, 100000.0] + ([-100.0, 100.0] if has_z else [])
+        data += struct.pack('<{}d'.format(len(values)), *values)
+        data += struct.pack('<Bid', 0, 1, 1000.0)
+    elif field_type == 'String':
+        data += struct.pack('<iB', width, flags) + varuint(0)
+    elif field_type in ('OID', 'Blob', 'GUID', 'GlobalID', 'XML'):
+        data += struct.pack('<BB', width, flags)
+    else:
+        data += struct.pack('<BBB', width, flags, 0)
+
+    return data
+
+
+def days(value):
+    if isinstance(value, datetime):
+        return (value.replace(tzinfo=None) - GDB_EPOCH) / timedelta(days=1)
+    if isinstance(value, date):
+        return (value - GDB_EPOCH.date()).days
+    if isinstance(value, time):
+        return (value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1e6) / 86400
+
+    return value
+
+
+def encode_value(field_type, value, info=GEOMETRY_INFO):
+    if field_type == 'SmallInteger':
+        return struct.pack('<h', value)
+    if field_type == 'Integer':
+        return struct.pack('<i', value)
+    if field_type == 'BigInteger':
+        return struct.pack('<q', value)
+    if field_type == 'Single':
+        return struct.pack('<f', value)
+    if field_type in ('Double', 'Date', 'DateOnly', 'TimeOnly'):
+        return struct.pack('<d', days(value))
+    if field_type == 'TimestampOffset':
+        local = value.replace(tzinfo=None)
+        return struct.pack('<dh', days(local), int(value.utcoffset().total_seconds() // 60))
+    if field_type in ('GUID', 'GlobalID'):
+        return uuid.UUID(value).bytes_le
+    if field_type == 'Geometry':
+        data = encode_shape(value, info)
+    elif field_type in ('String', 'XML'):
+        data = value.encode('utf-8')
+    else:
+        data = bytes(value)
+
+    return varuint(len(data)) + data
+
+
+# -------------------------------------------------------------------------------
+# Write a table, rows are tuples in the order of the fields (the OBJECTID value is
+# the row number), None for deleted rows; sparse omits the empty blocks of 1024 rows
+#
+def write_table(table_path, fields, rows, geometry=None, offset_size=5, sparse=False, info=GEOMETRY_INFO):
+    flags = 0
+    if geometry:
+        shape_type, has_z, has_m = geometry
+        flags = SHAPE_CODES[shape_type] | (0x80000000 if has_z else 0) | (0x40000000 if has_m else 0)
+
+    descriptions = b''.join(field_description(name, field_type, width, nullable, geometry, info)
+                            for name, field_type, width, nullable in fields)
+    section = struct.pack('<iIh', 4, flags, len(fields)) + descriptions
+    body = bytearray(struct.pack('<i', len(section)) + section)
+
+    nullable = [index for index, field in enumerate(fields) if field[3]]
+    offsets = []
+    largest = 0
+    for row in rows:
+        if row is None:
+            offsets.append(0)
+            continue
+
+        null_flags = bytearray(-(-len(nullable) // 8))
+        values = b''
+        for index, (name, field_type, width, is_nullable) in enumerate(fields):
+            if field_type == 'OID':
+                continue
+            if row[index] is None:
+                bit = nullable.index(index)
+                null_flags[bit // 8] |= 1 << (bit % 8)
+                continue
+            values += encode_value(field_type, row[index], info)
+
+        blob = bytes(null_flags) + values
+        offsets.append(40 + len(body))
+        body += struct.pack('<i', len(blob)) + blob
+        largest = max(largest, len(blob))
+
+    header = struct.pack('<iiiiiiqq', 3, len([row for row in rows if row is not None]), largest, 5, 0, 0,
+                         40 + len(body), 40)
+    with open(table_path, 'wb') as f:
+        f.write(header + body)
+
+    blocks = [offsets[start:start + 1024] for start in range(0, len(offsets), 1024)]
+    present = [any(block) or not sparse for block in blocks]
+    tablx = bytearray()
+    for block, kept in zip(blocks, present):
+        if kept:
+            block = block + [0] * (1024 - len(block))
+            tablx += b''.join(offset.to_bytes(offset_size, 'little') for offset in block)
+
+    stored = len([kept for kept in present if kept])
+    if stored != len(blocks):
+        words = -(-len(blocks) // 32)
+        bitmap = sum(1 << index for index, kept in enumerate(present) if kept)
+        trailer = struct.pack('<iiii', words, len(blocks), stored, words) + bitmap.to_bytes(words * 4, 'little')
+    else:
+        trailer = struct.pack('<iiii', 0, 0, 0, 0)
+
+    with open(path.splitext(table_path)[0] + '.gdbtablx', 'wb') as f:
+        f.write(struct.pack('<4i', 3, stored, len(offsets), offset_size) + bytes(tablx) + trailer)
+
+
+def table_file(workspace, oid):
+    return path.join(workspace, 'a{:08x}.gdbtable'.format(oid))
+
+
+# system catalog of the tables, returns the table names in the order of their files
+def write_catalog(workspace, tables):
+    makedirs(workspace, exist_ok=True)
+    names = SYSTEM_TABLES + list(tables)
+
+    write_table(table_file(workspace, 1), [('OBJECTID', 'OID', 4, False), ('Name', 'String', 160, False),
+                                           ('FileFormat', 'Integer', 4, False)],
+                [(oid, name, 0) for oid, name in enumerate(names, 1)])
+
+    return names
+
+
+# GDB_Items system table (a00000004) of (name, path, definition) items
+def write_items(workspace, items):
+    fields = [('ObjectID', 'OID', 4, False), ('Name', 'String', 160, True), ('Path', 'String', 260, True),
+              ('Definition', 'XML', 0, True)]
+    write_table(table_file(workspace, SYSTEM_TABLES.index('GDB_Items') + 1), fields,
+                [(oid,) + tuple(item) for oid, item in enumerate(items, 1)])
+
+
+# -------------------------------------------------------------------------------
+# Write the layers of a synthetic arcpy catalog (see synthetic_arcpy.configure)
+#
+def write_workspace(workspace, catalog):
+    names = write_catalog(workspace, sorted(catalog.layers))
+
+    for oid, name in enumerate(names, 1):
+        if name not in catalog.layers:
+            continue
+
+        layer = catalog.layers[name]
+        fields = [(field.name, field.type, field.length, field.type not in ('OID', 'Geometry'))
+                  for field in layer['fields']]
+        geometry = (layer['shapeType'], False, False) if layer.get('shapeType') else None
+        cursor_fields = ['SHAPE@WKB' if field.type == 'Geometry' else field.name for field in layer['fields']]
+        write_table(table_file(workspace, oid), fields, list(catalog.rows(name, cursor_fields)), geometry)
+
+    return workspace
@@ -8,9 +8,18 @@
 ##
 import getopt
 import sys
+from collections import namedtuple
 
+from fgdb2postgis.catalog import CATALOG_BACKENDS
+from fgdb2postgis.copy_loader import parse_srid
+from fgdb2postgis.ddl import CLUSTER_MODES, FIX_MODES
 from fgdb2postgis.filegdb import FileGDB
+from fgdb2postgis.manifest import Manifest
 from fgdb2postgis.postgis import PostGIS
+from fgdb2postgis.reproject import REPROJECT_MODES
+from fgdb2postgis.scheduler import Scheduler
+from fgdb2postgis.sync import DeltaSync
+from fgdb2postgis.telemetry import Metrics
 from fgdb2postgis.version import get_version
 
 
@@ -26,6 +35,21 @@ def show_usage():
     print("                  --port=port")
     print("                  --user=user")
     print("                  --password=password")
+    print("                  [--jobs=N]")
+    print("                  [--engine=ogr2ogr|copy|gdbtable]")
+    print("                  [--resume]")
+    print("                  [--sync]")
+    print("                  [--bulk]")
+    print("                  [--metrics-file=metrics.jsonl]")
+    print("                  [--monitor=seconds]")
+    print("                  [--final-data=view|matview|table]")
+    print("                  [--fix-orphans=insert|nullify]")
+    print("                  [--reproject=loader|client|server]")
+    print("                  [--cluster=hilbert|gist]")
+    print("                  [--brin=rows]")
+    print("                  [--chunk-rows=rows]")
+    print("                  [--catalog=arcpy|gdal]")
+    print("                  [--cache]")
 
     sys.exit(1)
 
@@ -35,63 +59,256 @@ def show_version():
     sys.exit(1)
 
 
-if len(sys.argv) not in [2, 11]:
-    show_usage()
-else:
+Options = namedtuple('Options', [
+    'fgdb', 'pgdb', 'a_srs', 't_srs', 'host', 'port', 'user', 'password', 'jobs', 'engine', 'resume', 'sync',
+    'bulk', 'metrics_file', 'monitor', 'final_data', 'fix_orphans', 'reproject', 'cluster', 'brin_rows',
+    'schema_prefix', 'chunk_rows', 'catalog', 'cache'], defaults=(None,) * 8 + (
+        1, 'ogr2ogr', False, False, False, None, None, None, None, 'loader', None, None, '', None, 'arcpy', False))
+
+ENGINES = ['ogr2ogr', 'copy', 'gdbtable']
+
+LONG_OPTIONS = ['fgdb=', 'pgdb=', 'a_srs=', 't_srs=', 'host=', 'port=', 'user=', 'password=',
+                'jobs=', 'engine=', 'resume', 'sync', 'bulk', 'metrics-file=', 'monitor=',
+                'final-data=', 'fix-orphans=', 'reproject=', 'cluster=', 'brin=', 'chunk-rows=', 'catalog=', 'cache']
+
+
+# -------------------------------------------------------------------------------
+# Parse the command line options of a conversion
+#
+def parse_args(argv):
+    if len(argv) != 1 and len(argv) < 10:
+        show_usage()
+
     try:
-        options, remainder = getopt.getopt(sys.argv[1:], 'hvf:p:', [
-                                           'fgdb=', 'pgdb=', 'a_srs=', 't_srs=', 'host=', 'port=', 'user=', 'password='])
+        opts, remainder = getopt.getopt(argv, 'hvf:p:', LONG_OPTIONS)
     except getopt.GetoptError as err:
         print(str(err))
         show_usage()
 
-for opt, arg in options:
-    if opt == '-h':
+    return parse_options(opts)
+
+
+def parse_options(opts, options=None):
+    values = (options or Options())._asdict()
+
+    for opt, arg in opts:
+        if opt == '-h':
+            show_usage()
+        elif opt == '-v':
+            show_version()
+        elif opt in ('-f'):
+            values['fgdb'] = arg
+        elif opt in ('-p'):
+            values['pgdb'] = arg
+        elif opt in ('--a_srs'):
+            values['a_srs'] = arg
+        elif opt in ('--t_srs'):
+            values['t_srs'] = arg
+        elif opt in ('--host'):
+            values['host'] = arg
+        elif opt in ('--port'):
+            values['port'] = arg
+        elif opt in ('--user'):
+            values['user'] = arg
+        elif opt in ('--password'):
+            values['password'] = arg
+        elif opt in ('--jobs'):
+            values['jobs'] = int(arg)
+        elif opt in ('--engine'):
+            values['engine'] = arg
+        elif opt in ('--resume'):
+            values['resume'] = True
+        elif opt in ('--sync'):
+            values['sync'] = True
+        elif opt in ('--bulk'):
+            values['bulk'] = True
+        elif opt in ('--metrics-file'):
+            values['metrics_file'] = arg
+        elif opt in ('--monitor'):
+            values['monitor'] = float(arg)
+        elif opt in ('--final-data'):
+            values['final_data'] = arg
+        elif opt in ('--fix-orphans'):
+            values['fix_orphans'] = arg
+        elif opt in ('--reproject'):
+            values['reproject'] = arg
+        elif opt in ('--cluster'):
+            values['cluster'] = arg
+        elif opt in ('--brin'):
+            values['brin_rows'] = int(arg)
+        elif opt in ('--chunk-rows'):
+            values['chunk_rows'] = int(arg)
+        elif opt in ('--catalog'):
+            values['catalog'] = arg
+        elif opt in ('--cache'):
+            values['cache'] = True
+
+    options = Options(**values)
+
+    if options.final_data not in (None, 'view', 'matview', 'table'):
+        show_usage()
+
+    if options.fix_orphans is not None and options.fix_orphans not in FIX_MODES:
+        show_usage()
+
+    if options.cluster is not None and options.cluster not in CLUSTER_MODES:
         show_usage()
-    elif opt == '-v':
-        show_version()
-    elif opt in ('-f'):
-        fgdb = arg
-    elif opt in ('-p'):
-        pgdb = arg
-    elif opt in ('--a_srs'):
-        a_srs = arg
-    elif opt in ('--t_srs'):
-        t_srs = arg
-    elif opt in ('--host'):
-        host = arg
-    elif opt in ('--port'):
-        port = arg
-    elif opt in ('--user'):
-        user = arg
-    elif opt in ('--password'):
-        password = arg
+
+    if options.engine not in ENGINES:
+        show_usage()
+
+    # client side reprojection transforms the rows of the copy and gdbtable engines
+    if options.reproject not in REPROJECT_MODES or (options.reproject == 'client' and options.engine == 'ogr2ogr'):
+        show_usage()
+
+    # sync loads the staging tables with ogr2ogr
+    if options.sync and options.engine != 'ogr2ogr':
+        show_usage()
+
+    # the gdbtable engine does not reproject while reading
+    if options.engine == 'gdbtable' and options.reproject == 'loader' and \
+            options.a_srs and options.t_srs and parse_srid(options.a_srs) != parse_srid(options.t_srs):
+        show_usage()
+
+    # the copy engine reads the rows with arcpy
+    if options.catalog not in CATALOG_BACKENDS or (options.catalog == 'gdal' and options.engine == 'copy'):
+        show_usage()
+
+    return options
+
 
 # -------------------------------------------------------------------------------
-# Main - Instantiate the required database objects and perform the conversion
+# Metadata tasks, the geodatabase is read and the ddl model filled one task at a time
+# The schemas (and partitions) come first so that the data load can start early,
+# the sql files are written last
+# With --cache the ddl model of an unchanged geodatabase is restored after the scan
+# and the processing steps are skipped, the sql files are rendered from the restored model
 #
+def metadata_tasks(scheduler, filegdb, options):
+    # the staging tables of the server side reprojection are copied to plain tables
+    partitions = bool(filegdb.partitions) and not options.sync
+    if partitions and options.reproject == 'server':
+        print("\nPartitions are not created with --reproject=server ...")
+        partitions = False
 
+    # the gdbtable engine reads OBJECTID ranges, not the filters of range and list partitions
+    filtered = sorted(layer for layer, rule in filegdb.partitions.items()
+                      if any(method in (rule or {}) for method in ('range', 'list')))
+    if partitions and options.engine == 'gdbtable' and filtered:
+        print("\nRange and list partitions ({}) can not be loaded with --engine=gdbtable".format(', '.join(filtered)))
+        show_usage()
 
-def main():
+    processing = [('process_schemas', filegdb.process_schemas)]
+    if partitions:
+        processing.append(('process_partitions', filegdb.process_partitions))
+    processing += [
+        ('process_domains', filegdb.process_domains),
+        ('process_subtypes', filegdb.process_subtypes),
+        ('process_relations', filegdb.process_relations)
+    ]
+    if options.cluster or options.brin_rows:
+        processing.append(('process_layout', filegdb.process_layout, options.cluster, options.brin_rows))
+    if options.final_data:
+        processing.append(('process_views', filegdb.process_views, options.final_data))
+
+    steps = [
+        ('scan', filegdb.scan),
+        ('open_files', filegdb.open_files)
+    ]
+    if filegdb.cache is not None:
+        steps.append(('restore_model', filegdb.restore_model, partitions, options.cluster, options.brin_rows,
+                      options.final_data))
+        processing = [(name, filegdb.unless_restored, func, *args) for name, func, *args in processing]
+
+    steps += processing[:1] + [('write_schemas', filegdb.write_sql, 'create_schemas.sql')] + processing[1:]
+    steps.append(('close_files', filegdb.close_files))
+    if filegdb.cache is not None:
+        steps.append(('save_cache', filegdb.save_cache))
+
+    previous = None
+    for name, func, *args in steps:
+        previous = scheduler.add(name, func, *args, deps=[previous], group='filegdb')
+
+    return [step[0] for step in steps]
+
+
+# -------------------------------------------------------------------------------
+# Convert - Instantiate the required database objects and perform the conversion
+# The phases run as a graph of tasks: the data load runs on its own connection as soon
+# as the schemas are created, while the domains, subtypes and relations are processed;
+# the lookup tables wait for the subtypes, the indexes and constraints for the sql files
+# The database views are updated unless update_views is False (batch mode)
+#
+def convert(options, update_views=True):
+    metrics = Metrics(options.metrics_file)
 
-    filegdb = FileGDB(fgdb, a_srs)
+    filegdb = metrics.run('init', FileGDB, options.fgdb, options.a_srs, options.schema_prefix, options.catalog,
+                          options.cache, options.jobs)
+    metrics.catalog = filegdb.catalog
     filegdb.info()
-    filegdb.open_files()
-    filegdb.process_domains()
-    filegdb.process_subtypes()
-    filegdb.process_relations()
-    filegdb.process_schemas()
-    filegdb.close_files()
-
-    postgis = PostGIS(host, port, user, password, pgdb, t_srs)
+
+    postgis = PostGIS(options.host, options.port, options.user, options.password, options.pgdb, options.t_srs,
+                      options.bulk, metrics, options.monitor,
+                      'loader' if options.sync else options.reproject, options.schema_prefix)
     postgis.info()
-    postgis.connect()
-    postgis.update_views()
-    postgis.create_schemas(filegdb)
-    postgis.load_database(filegdb)
-    postgis.apply_sql(filegdb)
-    postgis.disconnect()
 
-    filegdb.cleanup()
+    scheduler = Scheduler(metrics=metrics)
+    metadata = metadata_tasks(scheduler, filegdb, options)
+    connect = scheduler.add('connect', postgis.connect, group='postgis')
+
+    if options.sync:
+        last = scheduler.add('sync_database', DeltaSync(postgis, filegdb).sync_database, options.jobs,
+                             deps=[connect, 'process_subtypes'], group='postgis')
+        if options.final_data == 'matview':
+            scheduler.add('refresh_final_data', postgis.refresh_final_data, filegdb, options.jobs,
+                          deps=[last, 'close_files'], group='postgis')
+        elif options.final_data:
+            scheduler.add('create_final_data', postgis.create_final_data, filegdb, options.jobs,
+                          deps=[last, 'close_files'], group='postgis')
+    else:
+        manifest = Manifest(filegdb.manifest_path, options.resume)
+        loader = postgis.new_session()
+
+        def resumable(name, func, *args, deps=(), group='postgis'):
+            return scheduler.add(name, manifest.run, name, func, *args, deps=deps, group=group)
+
+        views = resumable('update_views', postgis.update_views, deps=[connect]) if update_views else None
+        schemas = resumable('create_schemas', postgis.create_schemas, filegdb, deps=[connect, views, 'write_schemas'])
+        lookups = resumable('load_lookup_tables', postgis.load_lookup_tables, filegdb,
+                            deps=[schemas, 'process_subtypes'])
+
+        # the loader needs the layers, the load schema and the partitions only
+        connect_loader = scheduler.add('connect_loader', loader.connect)
+        partitions = 'process_partitions' if 'process_partitions' in metadata else None
+        last = scheduler.add('load_database', loader.load_database, filegdb, options.jobs, options.engine,
+                             manifest, options.chunk_rows, deps=[connect_loader, schemas, 'scan', partitions])
+
+        if options.reproject == 'server':
+            last = resumable('reproject_layers', postgis.reproject_layers, filegdb, options.jobs, deps=[last])
+        if options.cluster:
+            last = resumable('cluster_layers', postgis.cluster_layers, filegdb, options.jobs,
+                             deps=[last, 'process_layout'])
+        last = resumable('check_orphans', postgis.check_orphans, filegdb, options.jobs, options.fix_orphans,
+                         deps=[last, 'process_relations'])
+        last = scheduler.add('apply_sql', postgis.apply_sql, filegdb, manifest, options.jobs,
+                             deps=[last, lookups, 'close_files'], group='postgis')
+        last = resumable('finish_bulk_load', postgis.finish_bulk_load, filegdb, options.jobs, deps=[last])
+        if options.final_data:
+            resumable('create_final_data', postgis.create_final_data, filegdb, options.jobs, deps=[last])
+
+    try:
+        scheduler.run()
+    finally:
+        if not options.sync:
+            loader.disconnect()
+        postgis.disconnect()
+
+    metrics.summary()
+    metrics.close()
 
     print("\nComplete!")
+    return metrics
+
+
+def main():
+    convert(parse_args(sys.argv[1:]))
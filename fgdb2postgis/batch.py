@@ -0,0 +1,324 @@
+##
+# batch.py
+#
+# Description: Convert many file geodatabases with a pool of processes
+#              Each geodatabase is converted to its own database (naming database) or to its
+#              own prefixed schemas of one database (naming schema); the database connections
+#              of all the conversions are limited by a shared semaphore
+#              Usage: fgdb2postgis-batch -p postgis [--naming=database|schema] [--prefix=prefix]
+#                     [--processes=N] [--max-connections=M] [--summary-file=summary.json]
+#                     [conversion options] filegdb|glob [filegdb|glob ...]
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import getopt
+import glob
+import json
+import multiprocessing
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from os import path
+
+import psycopg2
+from psycopg2 import sql
+
+from fgdb2postgis.__main__ import LONG_OPTIONS, convert, parse_options
+from fgdb2postgis.ddl import MAX_IDENTIFIER
+
+NAMING_RULES = ['database', 'schema']
+BATCH_OPTIONS = ['naming=', 'prefix=', 'processes=', 'max-connections=', 'summary-file=']
+
+# longest schema created by the tool (prefix excluded), see reproject.STAGING_SCHEMA
+LONGEST_SCHEMA = len('fgdb2postgis_reproject')
+
+# connection limit of the worker process: (lock, semaphore, limit)
+_connections = None
+
+
+def show_usage():
+    print("Usage:")
+    print("  fgdb2postgis-batch -p postgis")
+    print("                     --a_srs=a_srs")
+    print("                     --t_srs=t_srs")
+    print("                     --host=host")
+    print("                     --port=port")
+    print("                     --user=user")
+    print("                     --password=password")
+    print("                     [--naming=database|schema]")
+    print("                     [--prefix=prefix]")
+    print("                     [--processes=N]")
+    print("                     [--max-connections=M]")
+    print("                     [--summary-file=summary.json]")
+    print("                     [conversion options, see fgdb2postgis -h]")
+    print("                     filegdb|glob [filegdb|glob ...]")
+
+    sys.exit(1)
+
+
+# -------------------------------------------------------------------------------
+# Geodatabases of the command line, globs are expanded (e.g. "regions/*.gdb")
+#
+def expand_workspaces(patterns):
+    workspaces = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for workspace in matches:
+            workspace = path.normpath(workspace)
+            if workspace not in workspaces:
+                workspaces.append(workspace)
+
+    return workspaces
+
+
+# -------------------------------------------------------------------------------
+# Database name or schema prefix of each geodatabase, from the prefix and the
+# geodatabase name (lowercase, letters, digits and underscores), made unique
+#
+def target_names(workspaces, naming='database', prefix=''):
+    length = MAX_IDENTIFIER if naming == 'database' else MAX_IDENTIFIER - LONGEST_SCHEMA - 1
+    names = {}
+
+    for workspace in workspaces:
+        base = path.splitext(path.basename(workspace))[0]
+        name = re.sub(r'[^a-z0-9_]+', '_', (prefix + base).lower()).strip('_') or 'gdb'
+        name = name[:length]
+
+        unique = name
+        counter = 2
+        while unique in names.values():
+            suffix = '_{}'.format(counter)
+            unique = name[:length - len(suffix)] + suffix
+            counter += 1
+        names[workspace] = unique
+
+    return names
+
+
+def target_options(options, workspace, name, naming):
+    if naming == 'database':
+        return options._replace(fgdb=workspace, pgdb=name)
+
+    return options._replace(fgdb=workspace, schema_prefix=name + '_')
+
+
+def conn_string(options, dbname=None):
+    return "dbname={0} host={1} port={2} user={3} password={4}".format(
+        dbname or options.pgdb, options.host, options.port, options.user, options.password)
+
+
+# -------------------------------------------------------------------------------
+# Shared connection limit, a conversion takes the connections it may open
+# (main, loader, --jobs workers and a monitor for each of main and loader) before it starts
+#
+def init_worker(lock, semaphore, limit):
+    global _connections
+    _connections = (lock, semaphore, limit)
+
+
+def connections_needed(options):
+    return 2 + max(options.jobs, 1) + (2 if options.monitor else 0)
+
+
+@contextmanager
+def connection_slots(count):
+    if _connections is None:
+        yield
+        return
+
+    lock, semaphore, limit = _connections
+    count = min(count, limit)
+
+    # taken under the lock, two conversions never wait on each other's partial slots
+    with lock:
+        for slot in range(count):
+            semaphore.acquire()
+    try:
+        yield
+    finally:
+        for slot in range(count):
+            semaphore.release()
+
+
+def create_database(options, admin_db):
+    conn = psycopg2.connect(conn_string(options, admin_db))
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (options.pgdb,))
+            if cursor.fetchone() is None:
+                cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(options.pgdb)))
+                print("\nCreated database {}".format(options.pgdb))
+    finally:
+        conn.close()
+
+
+# shared objects of naming schema, created once before the conversions
+def prepare_database(options):
+    from fgdb2postgis.postgis import PostGIS
+
+    conn = psycopg2.connect(conn_string(options))
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis SCHEMA public")
+    conn.close()
+
+    postgis = PostGIS(options.host, options.port, options.user, options.password, options.pgdb, options.t_srs)
+    postgis.connect()
+    postgis.update_views()
+    postgis.disconnect()
+
+
+# -------------------------------------------------------------------------------
+# Convert one geodatabase in a worker process, the output goes to <filegdb>.log
+#
+def convert_workspace(options, naming, admin_db):
+    result = {
+        'workspace': options.fgdb,
+        'target': options.pgdb if naming == 'database' else options.schema_prefix,
+        'status': 'failed',
+        'error': None,
+        'duration': None,
+        'layers': 0,
+        'failed_layers': [],
+        'phases': {},
+        'log': '{}.log'.format(path.abspath(options.fgdb))
+    }
+
+    with connection_slots(connections_needed(options)):
+        start = time.time()
+        with open(result['log'], 'w', encoding='utf-8') as log, redirect_stdout(log):
+            try:
+                if naming == 'database':
+                    create_database(options, admin_db)
+
+                metrics = convert(options, update_views=naming == 'database')
+                for event in metrics.events:
+                    if event['layer'] is None:
+                        result['phases'][event['phase']] = event['duration']
+                    elif event['phase'] == 'load_layer':
+                        result['layers'] += 1
+                        if event.get('error'):
+                            result['failed_layers'].append(event['layer'])
+
+                result['status'] = 'failed' if result['failed_layers'] else 'ok'
+            except SystemExit as error:
+                result['error'] = 'exit code {}'.format(error.code)
+            except Exception as error:
+                result['error'] = "{0}: {1}".format(type(error).__name__, error)
+                traceback.print_exc(file=log)
+
+        result['duration'] = round(time.time() - start, 4)
+
+    return result
+
+
+# -------------------------------------------------------------------------------
+# Print the summary of the batch
+#
+def summary(results, duration):
+    print("\nBatch summary:")
+    print(" {0:<40} {1:<30} {2:<8} {3:>10} {4:>8}".format('filegdb', 'target', 'status', 'seconds', 'layers'))
+    for result in results:
+        print(" {0:<40} {1:<30} {2:<8} {3:>10.2f} {4:>8}".format(
+            path.basename(result['workspace']), result['target'], result['status'],
+            result['duration'] or 0, result['layers']))
+        if result['error']:
+            print("  {}".format(result['error']))
+        if result['failed_layers']:
+            print("  Failed layers: {}".format(', '.join(sorted(result['failed_layers']))))
+
+    succeeded = len([result for result in results if result['status'] == 'ok'])
+    print("\n{0} of {1} geodatabases converted in {2:.1f}s".format(succeeded, len(results), duration))
+
+    return succeeded
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    try:
+        opts, args = getopt.getopt(argv, 'hp:', LONG_OPTIONS + BATCH_OPTIONS)
+    except getopt.GetoptError as err:
+        print(str(err))
+        show_usage()
+
+    naming = 'database'
+    prefix = ''
+    processes = multiprocessing.cpu_count()
+    max_connections = None
+    summary_file = 'fgdb2postgis_batch_{}.json'.format(datetime.now().strftime('%Y%m%d_%H%M%S'))
+
+    conversion_opts = []
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            show_usage()
+        elif opt == '--naming':
+            naming = arg
+        elif opt == '--prefix':
+            prefix = arg
+        elif opt == '--processes':
+            processes = int(arg)
+        elif opt == '--max-connections':
+            max_connections = int(arg)
+        elif opt == '--summary-file':
+            summary_file = arg
+        else:
+            conversion_opts.append((opt, arg))
+
+    options = parse_options(conversion_opts)
+    workspaces = expand_workspaces(args)
+    required = (options.pgdb, options.a_srs, options.t_srs, options.host, options.port, options.user)
+    if naming not in NAMING_RULES or not workspaces or None in required:
+        show_usage()
+
+    names = target_names(workspaces, naming, prefix)
+    max_connections = max_connections or processes * connections_needed(options)
+    print("\nConverting {0} geodatabases ({1} processes, {2} connections, one {3} each) ...".format(
+        len(workspaces), processes, max_connections, naming))
+
+    if naming == 'schema':
+        prepare_database(options)
+
+    start = time.time()
+    results = []
+    lock = multiprocessing.Lock()
+    semaphore = multiprocessing.BoundedSemaphore(max_connections)
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker,
+                             initargs=(lock, semaphore, max_connections)) as executor:
+        futures = {}
+        for workspace in workspaces:
+            target = target_options(options, workspace, names[workspace], naming)
+            futures[executor.submit(convert_workspace, target, naming, options.pgdb)] = workspace
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as error:
+                result = {'workspace': futures[future], 'target': names[futures[future]], 'status': 'failed',
+                          'error': "{0}: {1}".format(type(error).__name__, error), 'duration': None,
+                          'layers': 0, 'failed_layers': [], 'phases': {}, 'log': None}
+
+            results.append(result)
+            print(" {0}: {1} ({2:.1f}s)".format(result['workspace'], result['status'], result['duration'] or 0))
+
+    results.sort(key=lambda result: workspaces.index(result['workspace']))
+    duration = time.time() - start
+    succeeded = summary(results, duration)
+
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        json.dump({'naming': naming, 'processes': processes, 'max_connections': max_connections,
+                   'duration': round(duration, 4), 'succeeded': succeeded, 'results': results}, f, indent=2)
+    print("Summary: {}".format(summary_file))
+
+    return 0 if succeeded == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+##
+# cache.py
+#
+# Description: Keep the catalog and the ddl model of a geodatabase between runs (--cache)
+#              The cache is keyed by a fingerprint of the geodatabase schema: the item
+#              definitions of the GDB_Items system table (read with the gdbtable reader) or,
+#              when they can not be read, the sizes and modification times of the workspace files
+#              An unchanged schema restores the catalog without arcpy calls, and the ddl model
+#              without processing when the yaml file and the options are unchanged as well
+#              A changed schema re-reads the changed layers and relationship classes only
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import hashlib
+import pickle
+from os import path, replace, stat, walk
+
+from fgdb2postgis.gdbtable import GdbTable, table_files
+from fgdb2postgis.version import get_version
+
+CACHE_FORMAT = 2
+
+
+def digest(*values):
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()
+
+
+# -------------------------------------------------------------------------------
+# Digest of the path and definition of every item of GDB_Items, by item name (lower case)
+# None when the system tables can not be read (not a 10.x file geodatabase)
+#
+def schema_items(workspace):
+    try:
+        with GdbTable(path.join(workspace, table_files(workspace)['gdb_items'])) as table:
+            oids, columns = table.read(['Name', 'Path', 'Definition'])
+            values = [table.values(columns[name]) for name in ('Name', 'Path', 'Definition')]
+    except Exception:
+        return None
+
+    return {name.lower(): digest(item_path, definition)
+            for name, item_path, definition in zip(*values) if name and definition}
+
+
+# sizes and modification times of the workspace files (lock files excluded)
+def workspace_stats(workspace):
+    stats = []
+    for folder, dirs, files in walk(workspace):
+        for name in files:
+            if name.endswith('.lock'):
+                continue
+            file_path = path.join(folder, name)
+            file_stat = stat(file_path)
+            stats.append((path.relpath(file_path, workspace), file_stat.st_size, file_stat.st_mtime_ns))
+
+    return digest(*sorted(stats))
+
+
+class MetadataCache:
+    def __init__(self, cache_path, workspace, backend='arcpy'):
+        self.path = cache_path
+        self.workspace = workspace
+        self.backend = backend
+        self.items = None
+        self.catalog_key = None
+        self.model_key = None
+        self.data = {}
+
+        if path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as f:
+                    self.data = pickle.load(f)
+            except Exception as error:
+                print(" Cache {0} can not be read, it is rebuilt ({1})".format(self.path, error))
+
+        # caches of other versions are discarded
+        if self.data.get('version') != (CACHE_FORMAT, get_version()):
+            self.data = {'version': (CACHE_FORMAT, get_version())}
+
+    def fingerprint(self):
+        if self.catalog_key is None:
+            self.items = schema_items(self.workspace)
+            self.catalog_key = digest(self.backend, sorted(self.items.items()) if self.items is not None
+                                      else workspace_stats(self.workspace))
+
+        return self.catalog_key
+
+    def save(self, catalog, model_state):
+        self.fingerprint()
+        self.data['catalog'] = {'key': self.catalog_key, 'backend': self.backend, 'items': self.items,
+                                'state': catalog.state()}
+        self.data['model'] = {'key': self.model_key, 'state': model_state}
+
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        replace(tmp_path, self.path)
+
+    # -------------------------------------------------------------------------------
+    # Restore the catalog of an unchanged schema, or let the catalog reuse the
+    # unchanged items of the cached one. Returns True if the catalog was restored
+    #
+    def restore_catalog(self, catalog):
+        self.fingerprint()
+        cached = self.data.get('catalog')
+        if cached is None:
+            print(" No cached catalog")
+            return False
+
+        if cached['key'] == self.catalog_key:
+            catalog.restore(cached['state'])
+            print(" Catalog restored ({} layers)".format(len(catalog.layers)))
+            return True
+
+        if self.items is None or cached['items'] is None or cached['backend'] != self.backend:
+            print(" Geodatabase changed, the catalog is read again")
+            return False
+
+        changed = set(name for name in set(self.items) | set(cached['items'])
+                      if self.items.get(name) != cached['items'].get(name))
+        catalog.reuse(cached['state'], changed)
+        print(" Schema changed, {0} of {1} items read again".format(len(changed), len(self.items)))
+        return False
+
+    # -------------------------------------------------------------------------------
+    # Ddl model state of the same catalog and model key (yaml file, options), or None
+    #
+    def restore_model(self, *key):
+        self.model_key = digest(self.fingerprint(), *key)
+
+        cached = self.data.get('model')
+        if cached is None or cached['key'] != self.model_key:
+            return None
+
+        return cached['state']
@@ -0,0 +1,385 @@
+##
+# catalog.py
+#
+# Description: Walk the file geodatabase once and keep datasets, layers, fields,
+#              subtypes, domains and relationship classes in memory
+#              The arcpy backend reads the workspace with arcpy (imported when the backend is created)
+#              and counts the arcpy calls, see gdb_items.py for the backend without arcpy
+#              and cache.py for the metadata cache
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+
+CATALOG_BACKENDS = ['arcpy', 'gdal']
+# attributes filled by a scan, kept by the metadata cache
+CATALOG_STATE = ['datasets', 'tables', 'feature_classes', 'layers', 'domains', 'relationships', 'names']
+
+Field = namedtuple('Field', 'name type length')
+Domain = namedtuple('Domain', 'name domain_type field_type coded_values')
+Layer = namedtuple('Layer', 'name dataset kind fields subtypes relationship_class_names')
+Relationship = namedtuple(
+    'Relationship', 'name origin destination origin_keys is_attachment')
+
+
+# -------------------------------------------------------------------------------
+# Catalog of the backend, arcpy or gdal (GDB_Items system table read with GDAL)
+# The arcpy catalog describes the layers with a pool of jobs processes
+#
+def open_catalog(workspace, backend='arcpy', jobs=1):
+    if backend == 'gdal':
+        from fgdb2postgis.gdb_items import GdbItemsCatalog
+        return GdbItemsCatalog(workspace)
+
+    print("\nSetting arcpy environment ...")
+    return ArcpyCatalog(workspace, jobs)
+
+
+# -------------------------------------------------------------------------------
+# Lookups shared by the backends, a backend fills the catalog in read() and
+# implements count_rows() and read_oid_range()
+#
+class Catalog(ABC):
+    def __init__(self, workspace):
+        self.workspace = workspace
+        self.arcpy_calls = 0
+        self.scanned = False
+        self.datasets = []
+        self.tables = []
+        self.feature_classes = {}
+        self.layers = {}
+        self.domains = {}
+        self.relationships = {}
+        self.row_counts = {}
+        self.oid_ranges = {}
+        self.names = {}
+        # unchanged items of a cached scan (see reuse)
+        self.cached_layers = {}
+        self.cached_relationships = {}
+        self.cached_domains = None
+
+    # -------------------------------------------------------------------------------
+    # Walk the workspace once
+    #
+    def scan(self):
+        if self.scanned:
+            return
+
+        print("\nScanning file geodatabase ...")
+        self.read()
+
+        self.scanned = True
+        print(" {0} layers, {1} domains, {2} relationship classes ({3} arcpy calls)".format(
+            len(self.layers), len(self.domains), len(self.relationships), self.arcpy_calls))
+
+    # fill datasets, tables, feature_classes, layers, domains and relationships
+    @abstractmethod
+    def read(self):
+        pass
+
+    # number of rows of a table or feature class
+    @abstractmethod
+    def count_rows(self, name):
+        pass
+
+    # (min, max) OBJECTID of a table or feature class
+    @abstractmethod
+    def read_oid_range(self, name):
+        pass
+
+    def add_name(self, name):
+        self.names[name.lower()] = name
+
+    # -------------------------------------------------------------------------------
+    # Scanned state, restored as is from the metadata cache
+    #
+    def state(self):
+        return {key: getattr(self, key) for key in CATALOG_STATE}
+
+    def restore(self, state):
+        for key in CATALOG_STATE:
+            setattr(self, key, state[key])
+
+        self.scanned = True
+
+    # -------------------------------------------------------------------------------
+    # Reuse the layers and relationship classes of a cached scan whose items (lower case
+    # names) are not in changed, and the domains if none of them changed and no item was added
+    #
+    def reuse(self, state, changed):
+        self.cached_layers = {name: layer for name, layer in state['layers'].items() if name.lower() not in changed}
+        self.cached_relationships = {name: rel for name, rel in state['relationships'].items()
+                                     if name.lower() not in changed}
+
+        known = set(name.lower() for key in ('layers', 'relationships', 'domains') for name in state[key])
+        if not changed & set(name.lower() for name in state['domains']) and changed <= known:
+            self.cached_domains = state['domains']
+
+    # -------------------------------------------------------------------------------
+    # Lookups
+    #
+    def all_layers(self):
+        self.scan()
+        layers = list(self.tables)
+        layers += self.feature_classes['']
+        for fds in self.datasets:
+            layers += self.feature_classes[fds]
+
+        return layers
+
+    def list_datasets(self):
+        self.scan()
+        return list(self.datasets)
+
+    def list_tables(self):
+        self.scan()
+        return list(self.tables)
+
+    def list_feature_classes(self, fds=''):
+        self.scan()
+        return list(self.feature_classes.get(fds or '', []))
+
+    def list_domains(self):
+        self.scan()
+        return [self.domains[name] for name in sorted(self.domains)]
+
+    def list_relationships(self):
+        self.scan()
+        return [self.relationships[name] for name in sorted(self.relationships)]
+
+    def exists(self, name):
+        self.scan()
+        return name.lower() in self.names
+
+    def get_layer(self, name):
+        self.scan()
+        return self.layers.get(self.names.get(name.lower()))
+
+    def fields(self, name):
+        layer = self.get_layer(name)
+        return layer.fields if layer else []
+
+    def field_names(self, name):
+        return [field.name for field in self.fields(name)]
+
+    def subtypes(self, name):
+        layer = self.get_layer(name)
+        return layer.subtypes if layer else {}
+
+    def row_count(self, name):
+        if name not in self.row_counts:
+            self.row_counts[name] = self.count_rows(name)
+
+        return self.row_counts[name]
+
+    def oid_field(self, name):
+        return next((field.name for field in self.fields(name) if field.type == 'OID'), None)
+
+    # lowest and highest OBJECTID
+    def oid_range(self, name):
+        if name not in self.oid_ranges:
+            self.oid_ranges[name] = self.read_oid_range(name)
+
+        return self.oid_ranges[name]
+
+    # -------------------------------------------------------------------------------
+    # Where clauses splitting a layer into OBJECTID ranges of about chunk_rows rows
+    # Layers without OBJECTID or with up to chunk_rows rows are not split
+    #
+    def layer_chunks(self, name, chunk_rows):
+        rows = self.row_count(name)
+        oid_field = self.oid_field(name)
+        if not chunk_rows or rows <= chunk_rows or oid_field is None:
+            return []
+
+        min_oid, max_oid = self.oid_range(name)
+        if min_oid is None:
+            return []
+
+        return ['"{0}" >= {1} AND "{0}" < {2}'.format(oid_field, start, end)
+                for start, end in oid_chunks(min_oid, max_oid, rows, chunk_rows)]
+
+
+# -------------------------------------------------------------------------------
+# Read the workspace with arcpy (Windows, ArcGIS Pro licence)
+#
+class ArcpyCatalog(Catalog):
+    def __init__(self, workspace, jobs=1):
+        Catalog.__init__(self, workspace)
+        self.jobs = jobs
+        self.arcpy = import_module('arcpy')
+        self.arcpy.env.workspace = workspace
+
+    # -------------------------------------------------------------------------------
+    # Call an arcpy function and count it
+    #
+    def call(self, func, *args, **kwargs):
+        self.arcpy_calls += 1
+        return func(*args, **kwargs)
+
+    # -------------------------------------------------------------------------------
+    # The layers and relationship classes are described by a pool of processes with
+    # more than one job (see read_groups), the catalog is filled in the serial order
+    #
+    def read(self):
+        arcpy = self.arcpy
+
+        self.datasets = sorted(self.call(arcpy.ListDatasets, "*", "Feature") or [])
+        self.tables = sorted(self.call(arcpy.ListTables) or [])
+        self.feature_classes[''] = sorted(self.call(arcpy.ListFeatureClasses, "*", "") or [])
+
+        for fds in self.datasets:
+            self.feature_classes[fds] = sorted(
+                self.call(arcpy.ListFeatureClasses, "*", "", fds) or [])
+
+        if self.cached_domains is not None:
+            self.domains = dict(self.cached_domains)
+        else:
+            for domain in self.call(arcpy.da.ListDomains, self.workspace):
+                self.domains[domain.name] = Domain(
+                    domain.name, domain.domainType, domain.type, domain.codedValues)
+
+        layers = [(table, '', 'Table') for table in self.tables]
+        for fds, fc_list in self.feature_classes.items():
+            layers += [(fc, fds, 'FeatureClass') for fc in fc_list]
+
+        if self.jobs > 1:
+            self.read_groups(layers)
+
+        for name, dataset, kind in layers:
+            self.add_layer(name, dataset, kind)
+
+        rel_names = set()
+        for layer in self.layers.values():
+            rel_names.update(layer.relationship_class_names)
+        rel_names = sorted(rel_names)
+
+        if self.jobs > 1:
+            self.read_groups([], rel_names)
+
+        for rel_name in rel_names:
+            self.add_relationship(rel_name)
+
+    # -------------------------------------------------------------------------------
+    # Describe layers (name, dataset, kind) or relationship classes in worker processes,
+    # one per feature dataset and per batch of tables and feature classes outside of datasets
+    # The results are kept as cached items, added to the catalog in the serial order
+    #
+    def read_groups(self, layers, rel_names=()):
+        layers = [layer for layer in layers if layer[0] not in self.cached_layers]
+        rel_names = [name for name in rel_names if name not in self.cached_relationships]
+
+        groups = {}
+        for layer in layers:
+            groups.setdefault(layer[1], []).append(layer)
+        standalone = groups.pop('', [])
+        groups = list(groups.values())
+
+        for items in (standalone, rel_names):
+            size = -(-len(items) // self.jobs) if items else 1
+            groups += [items[start:start + size] for start in range(0, len(items), size)]
+        if len(groups) < 2:
+            return
+
+        with ProcessPoolExecutor(max_workers=min(self.jobs, len(groups))) as executor:
+            futures = [executor.submit(read_group, self.workspace, group) for group in groups]
+            for future in futures:
+                items, calls = future.result()
+                self.arcpy_calls += calls
+                for item in items:
+                    if isinstance(item, Layer):
+                        self.cached_layers[item.name] = item
+                    else:
+                        self.cached_relationships[item.name] = item
+
+    def add_relationship(self, rel_name):
+        if rel_name in self.cached_relationships:
+            self.relationships[rel_name] = self.cached_relationships[rel_name]
+            return
+
+        rel = self.call(self.arcpy.Describe, rel_name)
+        self.relationships[rel_name] = Relationship(
+            rel_name,
+            rel.originClassNames[0],
+            rel.destinationClassNames[0],
+            [tuple(key) for key in rel.originClassKeys],
+            rel.isAttachmentRelationship)
+
+    def add_layer(self, name, dataset, kind):
+        if name in self.cached_layers:
+            self.layers[name] = self.cached_layers[name]
+            self.add_name(name)
+            return
+
+        arcpy = self.arcpy
+        desc = self.call(arcpy.Describe, name)
+        fields = [Field(f.name, f.type, f.length) for f in desc.fields]
+
+        try:
+            rel_names = list(desc.relationshipClassNames)
+        except:
+            print(name, "An exception occurred")
+            rel_names = []
+
+        subtypes = {}
+        try:
+            subtypes = self.call(arcpy.da.ListSubtypes, name)
+        except:
+            print(name, "List subtypes exception")
+
+        # keep domain names instead of domain objects
+        for subtype in subtypes.values():
+            field_values = subtype.get('FieldValues', {})
+            for field, (default, domain) in list(field_values.items()):
+                field_values[field] = (default, domain.name if domain is not None else None)
+
+        self.layers[name] = Layer(name, dataset, kind, fields, subtypes, rel_names)
+        self.add_name(name)
+
+    def count_rows(self, name):
+        result = self.call(self.arcpy.GetCount_management, name)
+        return int(result.getOutput(0))
+
+    # read from the first row of each sort order
+    def read_oid_range(self, name):
+        oid_field = self.oid_field(name)
+        bounds = []
+        for order in ('ASC', 'DESC'):
+            sql_clause = (None, 'ORDER BY {0} {1}'.format(oid_field, order))
+            with self.call(self.arcpy.da.SearchCursor, name, ['OID@'], sql_clause=sql_clause) as cursor:
+                bounds.append(next(iter(cursor), (None,))[0])
+
+        return tuple(bounds)
+
+
+# -------------------------------------------------------------------------------
+# Worker of ArcpyCatalog.read_groups, with its own arcpy workspace: describe the
+# layers (name, dataset, kind) or relationship classes (names) of a group
+#
+def read_group(workspace, group):
+    catalog = ArcpyCatalog(workspace)
+    items = []
+    for item in group:
+        if isinstance(item, tuple):
+            catalog.add_layer(*item)
+            items.append(catalog.layers[item[0]])
+        else:
+            catalog.add_relationship(item)
+            items.append(catalog.relationships[item])
+
+    return items, catalog.arcpy_calls
+
+
+# -------------------------------------------------------------------------------
+# Half open OBJECTID ranges [start, end) covering min_oid to max_oid, sized so that
+# rows evenly spread over the range give about chunk_rows rows per range
+#
+def oid_chunks(min_oid, max_oid, rows, chunk_rows):
+    count = -(-rows // chunk_rows)
+    step = -(-(max_oid - min_oid + 1) // count)
+
+    return [(start, min(start + step, max_oid + 1)) for start in range(min_oid, max_oid + 1, step)]
@@ -0,0 +1,495 @@
+##
+# copy_loader.py
+#
+# Description: Stream file geodatabase tables into PostGIS using COPY BINARY
+#              Rows are read with arcpy.da.SearchCursor and encoded in batches
+#              sized by bytes, producing the same layout as the ogr2ogr loader
+#              Sources with copy_blocks (gdbtable.GdbTableSource) hand over blocks of
+#              rows already encoded
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import struct
+import threading
+from datetime import date, datetime, timezone
+
+import psycopg2
+
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_TRAILER = struct.pack('!h', -1)
+BATCH_BYTES = 8 * 1024 * 1024
+
+PG_EPOCH = datetime(2000, 1, 1)
+PG_EPOCH_DATE = date(2000, 1, 1)
+
+# EWKB flags
+WKB_Z = 0x80000000
+WKB_M = 0x40000000
+WKB_SRID = 0x20000000
+
+_NULL = struct.pack('!i', -1)
+
+# arcpy is not thread safe, the layers loaded by a pool of threads are described and read one at a time
+ARCPY_LOCK = threading.Lock()
+
+
+# -------------------------------------------------------------------------------
+# Field encoders, value to length prefixed binary COPY field
+#
+def encode_int2(value):
+    return struct.pack('!ih', 2, value)
+
+
+def encode_int4(value):
+    return struct.pack('!ii', 4, value)
+
+
+def encode_int8(value):
+    return struct.pack('!iq', 8, value)
+
+
+def encode_float4(value):
+    return struct.pack('!if', 4, value)
+
+
+def encode_float8(value):
+    return struct.pack('!id', 8, value)
+
+
+def encode_text(value):
+    data = str(value).encode('utf-8')
+    return struct.pack('!i', len(data)) + data
+
+
+def encode_bytes(value):
+    data = bytes(value)
+    return struct.pack('!i', len(data)) + data
+
+
+def encode_timestamp(value):
+    # naive datetimes are written as UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    delta = value - PG_EPOCH
+    micro = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return struct.pack('!iq', 8, micro)
+
+
+def encode_date(value):
+    if isinstance(value, datetime):
+        value = value.date()
+
+    return struct.pack('!ii', 4, (value - PG_EPOCH_DATE).days)
+
+
+def encode_time(value):
+    micro = ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+    return struct.pack('!iq', 8, micro)
+
+
+def encode_row(encoders, values):
+    parts = [struct.pack('!h', len(encoders))]
+    for encode, value in zip(encoders, values):
+        parts.append(_NULL if value is None else encode(value))
+
+    return b''.join(parts)
+
+
+# -------------------------------------------------------------------------------
+# Convert (ISO/EWKB) WKB to EWKB with srid
+# Lines and polygons are promoted to multi geometries (ogr2ogr -nlt PROMOTE_TO_MULTI)
+#
+def to_ewkb(wkb, srid, promote=True):
+    wkb = bytes(wkb)
+    endian = '<' if wkb[0] == 1 else '>'
+    code = struct.unpack(endian + 'I', wkb[1:5])[0]
+
+    body = wkb[5:]
+    if code & (WKB_Z | WKB_M | WKB_SRID):
+        geom_type = code & 0x0FFFFFFF
+        flags = code & (WKB_Z | WKB_M)
+        if code & WKB_SRID:
+            body = wkb[9:]
+    else:
+        geom_type = code % 1000
+        dims = code // 1000
+        flags = (WKB_Z if dims in (1, 3) else 0) | (WKB_M if dims in (2, 3) else 0)
+
+    if geom_type > 7:
+        raise ValueError("Unsupported WKB geometry type {}".format(code))
+
+    if promote and geom_type in (2, 3):
+        inner = wkb[:1] + struct.pack(endian + 'I', geom_type | flags) + body
+        header = struct.pack(endian + 'IiI', (geom_type + 3) | flags | WKB_SRID, srid, 1)
+        return wkb[:1] + header + inner
+
+    return wkb[:1] + struct.pack(endian + 'Ii', geom_type | flags | WKB_SRID, srid) + body
+
+
+def parse_srid(srs):
+    srs = str(srs)
+    if ':' in srs:
+        srs = srs.split(':')[-1]
+
+    return int(srs)
+
+
+# -------------------------------------------------------------------------------
+# Map geodatabase fields to columns, as created by ogr2ogr
+# (-lco fid=id -lco geometry_name=geom -lco launder=no -nlt PROMOTE_TO_MULTI)
+#
+FIELD_TYPES = {
+    'SmallInteger': ('smallint', encode_int2),
+    'Integer': ('integer', encode_int4),
+    'BigInteger': ('bigint', encode_int8),
+    'Single': ('real', encode_float4),
+    'Double': ('double precision', encode_float8),
+    'Date': ('timestamp with time zone', encode_timestamp),
+    'DateOnly': ('date', encode_date),
+    'TimeOnly': ('time', encode_time),
+    'TimestampOffset': ('timestamp with time zone', encode_timestamp),
+    'GUID': ('varchar(38)', encode_text),
+    'GlobalID': ('varchar(38)', encode_text),
+    'XML': ('varchar', encode_text),
+    'Blob': ('bytea', encode_bytes)
+}
+
+GEOMETRY_TYPES = {
+    'Point': 'Point',
+    'Multipoint': 'MultiPoint',
+    'Polyline': 'MultiLineString',
+    'Polygon': 'MultiPolygon',
+    'MultiPatch': 'MultiPolygon'
+}
+
+
+def table_columns(fields, geometry, srid, layer=None):
+    # list of (name, pg_type, cursor_field, encoder)
+    columns = []
+
+    for name, field_type, length in fields:
+        if field_type == 'OID':
+            columns.insert(0, ('id', 'SERIAL', 'OID@', encode_int4))
+
+    if geometry:
+        shape_type, has_z, has_m = geometry
+        geom_type = "{0}{1}{2}".format(
+            GEOMETRY_TYPES[shape_type], 'Z' if has_z else '', 'M' if has_m else '')
+        promote = GEOMETRY_TYPES[shape_type].startswith('Multi')
+        columns.append(('geom', 'geometry({0},{1})'.format(geom_type, srid), 'SHAPE@WKB',
+                        lambda value: encode_bytes(to_ewkb(value, srid, promote))))
+
+    for name, field_type, length in fields:
+        if field_type == 'String':
+            columns.append((name, 'varchar({})'.format(length) if length else 'varchar', name, encode_text))
+        elif field_type in FIELD_TYPES:
+            pg_type, encoder = FIELD_TYPES[field_type]
+            columns.append((name, pg_type, name, encoder))
+        elif field_type not in ('OID', 'Geometry'):
+            print(" Warning: field {0}.{1} of type {2} is not supported, it is not loaded".format(
+                layer, name, field_type))
+
+    return columns
+
+
+# columns of domain and subtype lookup tables (id, code, description)
+def lookup_table_columns(field, field_type):
+    pg_type, encoder = FIELD_TYPES.get(field_type, ('varchar', encode_text))
+
+    return [
+        ('id', 'SERIAL', 'OID@', encode_int4),
+        (field, pg_type, field, encoder),
+        ('Description', 'varchar', 'Description', encode_text)
+    ]
+
+
+def quote_ident(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+# -------------------------------------------------------------------------------
+# File like object consumed by cursor.copy_expert
+# Rows are encoded until the batch size (in bytes) is reached
+#
+class CopyStream:
+    def __init__(self, columns, rows, batch_bytes=BATCH_BYTES):
+        self.encoders = [column[3] for column in columns]
+        self.rows = iter(rows)
+        self.batch_bytes = batch_bytes
+        self.buffer = bytearray(COPY_HEADER)
+        self.done = False
+        self.row_count = 0
+        self.byte_count = 0
+        self.errors = []
+
+    def read(self, size=-1):
+        while not self.done and len(self.buffer) < self.batch_bytes:
+            try:
+                values = next(self.rows)
+            except StopIteration:
+                self.buffer += COPY_TRAILER
+                self.done = True
+                break
+
+            try:
+                self.buffer += encode_row(self.encoders, values)
+                self.row_count += 1
+            except Exception as error:
+                self.errors.append((values[0], "{0}: {1}".format(type(error).__name__, error)))
+
+        data = bytes(self.buffer)
+        self.buffer = bytearray()
+        self.byte_count += len(data)
+        return data
+
+    # release the source of rows not read to the end (failed COPY)
+    def close(self):
+        if hasattr(self.rows, 'close'):
+            self.rows.close()
+
+
+# -------------------------------------------------------------------------------
+# File like object over blocks of encoded rows (row count, data, row errors)
+#
+class BlockStream(CopyStream):
+    def __init__(self, blocks, batch_bytes=BATCH_BYTES):
+        CopyStream.__init__(self, [], blocks, batch_bytes)
+
+    def read(self, size=-1):
+        while not self.done and len(self.buffer) < self.batch_bytes:
+            try:
+                rows, data, errors = next(self.rows)
+            except StopIteration:
+                self.buffer += COPY_TRAILER
+                self.done = True
+                break
+
+            self.buffer += data
+            self.row_count += rows
+            self.errors += errors
+
+        data = bytes(self.buffer)
+        self.buffer = bytearray()
+        self.byte_count += len(data)
+        return data
+
+
+# -------------------------------------------------------------------------------
+# Read layers with arcpy.da.SearchCursor
+# arcpy is imported on first use so the loader can run against other sources
+#
+class ArcpySource:
+    def __init__(self, workspace, a_srs, t_srs):
+        self.workspace = workspace
+        self.a_srs = parse_srid(a_srs)
+        self.t_srs = parse_srid(t_srs)
+
+    def describe(self, layer):
+        import arcpy
+
+        with ARCPY_LOCK:
+            desc = arcpy.Describe(layer)
+            fields = [(f.name, f.type, f.length) for f in desc.fields]
+
+            geometry = None
+            if getattr(desc, 'shapeType', None):
+                geometry = (desc.shapeType, bool(desc.hasZ), bool(desc.hasM))
+
+        return fields, geometry
+
+    def rows(self, layer, cursor_fields, where=None):
+        import arcpy
+
+        spatial_reference = None
+        if self.a_srs != self.t_srs:
+            spatial_reference = arcpy.SpatialReference(self.t_srs)
+
+        # the lock is held until the cursor is exhausted or the rows are closed (CopyStream.close)
+        with ARCPY_LOCK:
+            with arcpy.da.SearchCursor(layer, cursor_fields, where_clause=where,
+                                       spatial_reference=spatial_reference) as cursor:
+                for row in cursor:
+                    yield row
+
+
+# -------------------------------------------------------------------------------
+# Create the target table and stream the layer rows into it
+#
+class CopyLoader:
+    def __init__(self, conn_string, source, srid, schema='public', batch_bytes=BATCH_BYTES,
+                 unlogged=False, session_sql=(), reprojector=None, spatial_index=True):
+        self.conn_string = conn_string
+        self.source = source
+        self.srid = srid
+        self.schema = schema
+        self.batch_bytes = batch_bytes
+        self.unlogged = unlogged
+        self.session_sql = list(session_sql)
+        self.reprojector = reprojector
+        self.spatial_index = spatial_index
+        self.row_errors = {}
+        self.byte_counts = {}
+        self.chunk_columns = {}
+        self.lock = threading.Lock()
+
+    # partitioned tables (partition_by clause) cannot be unlogged, their partitions can
+    def create_table_sql(self, layer, columns, primary_key=True, partition_by=None):
+        table = "{0}.{1}".format(quote_ident(self.schema), quote_ident(layer))
+
+        definitions = ['{0} {1}'.format(quote_ident(name), pg_type)
+                       for name, pg_type, cursor_field, encoder in columns]
+        if primary_key and columns and columns[0][0] == 'id':
+            definitions.insert(1, 'CONSTRAINT {} PRIMARY KEY ("id")'.format(
+                quote_ident("{}_pkey".format(layer))))
+
+        return [
+            'DROP TABLE IF EXISTS {} CASCADE'.format(table),
+            'CREATE {0}TABLE {1} ({2}){3}'.format(
+                'UNLOGGED ' if self.unlogged and not partition_by else '', table, ', '.join(definitions),
+                ' ' + partition_by if partition_by else '')
+        ]
+
+    def finalize_table_sql(self, layer, columns):
+        table = "{0}.{1}".format(quote_ident(self.schema), quote_ident(layer))
+        names = [column[0] for column in columns]
+        statements = []
+
+        if 'id' in names:
+            statements.append(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), coalesce(max(\"id\"), 1)) FROM {0}".format(
+                    table.replace("'", "''")))
+        if 'geom' in names and self.spatial_index:
+            statements.append('CREATE INDEX {0} ON {1} USING GIST ("geom")'.format(
+                quote_ident("{}_geom_geom_idx".format(layer)), table))
+
+        return statements
+
+    def load_layer(self, layer, conn=None):
+        try:
+            fields, geometry = self.source.describe(layer)
+            columns = table_columns(fields, geometry, self.srid, layer)
+        except Exception as error:
+            return -1, "{0}: {1}".format(type(error).__name__, error)
+
+        return self.load_table(layer, columns, self.layer_rows(layer, columns, geometry), conn)
+
+    def layer_rows(self, layer, columns, geometry, where=None):
+        # blocks of encoded rows, unless the geometries have to be reprojected one by one
+        if self.reprojector is None and hasattr(self.source, 'copy_blocks'):
+            return BlockStream(self.source.copy_blocks(layer, columns, where), self.batch_bytes)
+
+        rows = self.source.rows(layer, [column[2] for column in columns], where)
+
+        # geometries read in the source srs are reprojected on the way to the stream
+        if self.reprojector is not None and geometry:
+            rows = self.reprojector.rows(rows, [column[0] for column in columns].index('geom'))
+
+        return rows
+
+    # -------------------------------------------------------------------------------
+    # Chunked load of a large layer: the table is created without primary key,
+    # the chunks (where clauses on OBJECTID) are copied into it by concurrent
+    # connections and the primary key and spatial index are built at the end
+    # Partitioned tables (partition clause and partitions statements) are loaded the same
+    # way, they get an index on id instead of the primary key (it would need the partition key)
+    #
+    def create_chunked_table(self, layer, partition_by=None, partitions=()):
+        fields, geometry = self.source.describe(layer)
+        columns = table_columns(fields, geometry, self.srid, layer)
+        self.chunk_columns[layer] = (columns, geometry, partition_by is not None)
+        self.row_errors[layer] = []
+        self.byte_counts[layer] = 0
+
+        statements = self.create_table_sql(layer, columns, primary_key=False, partition_by=partition_by)
+        return self.execute(statements + list(partitions))
+
+    def load_chunk(self, layer, where, conn=None):
+        columns, geometry, partitioned = self.chunk_columns[layer]
+        return self.load_table(layer, columns, self.layer_rows(layer, columns, geometry, where), conn, chunk=True)
+
+    def finish_chunked_table(self, layer):
+        columns, geometry, partitioned = self.chunk_columns.pop(layer)
+        table = "{0}.{1}".format(quote_ident(self.schema), quote_ident(layer))
+        statements = []
+        if columns and columns[0][0] == 'id' and partitioned:
+            statements.append('CREATE INDEX {0} ON {1} ("id")'.format(quote_ident("{}_id_idx".format(layer)), table))
+        elif columns and columns[0][0] == 'id':
+            statements.append('ALTER TABLE {0} ADD CONSTRAINT {1} PRIMARY KEY ("id")'.format(
+                table, quote_ident("{}_pkey".format(layer))))
+
+        returncode, error = self.execute(statements + self.finalize_table_sql(layer, columns))
+        if returncode == 0 and self.row_errors[layer]:
+            return 0, "{} rows skipped".format(len(self.row_errors[layer]))
+
+        return returncode, error
+
+    def execute(self, statements):
+        conn = psycopg2.connect(self.conn_string)
+        try:
+            with conn.cursor() as cursor:
+                for statement in self.session_sql + statements:
+                    cursor.execute(statement)
+            conn.commit()
+        except psycopg2.Error as error:
+            conn.rollback()
+            return 1, str(error).strip()
+        finally:
+            conn.close()
+
+        return 0, ''
+
+    # -------------------------------------------------------------------------------
+    # Create table and copy rows (tuples in columns order or a BlockStream) into it
+    # Chunks are copied into the existing table, the counters add up per layer
+    #
+    def load_table(self, layer, columns, rows, conn=None, chunk=False):
+        table = "{0}.{1}".format(quote_ident(self.schema), quote_ident(layer))
+        # the table is created in the same transaction, rows can be written frozen
+        copy_sql = 'COPY {0} ({1}) FROM STDIN WITH (FORMAT binary{2})'.format(
+            table, ', '.join(quote_ident(column[0]) for column in columns), '' if chunk else ', FREEZE')
+
+        own_conn = conn is None
+        if own_conn:
+            conn = psycopg2.connect(self.conn_string)
+
+        stream = rows if isinstance(rows, CopyStream) else CopyStream(columns, rows, self.batch_bytes)
+        try:
+            with conn.cursor() as cursor:
+                for statement in self.session_sql:
+                    cursor.execute(statement)
+
+                if not chunk:
+                    for statement in self.create_table_sql(layer, columns):
+                        cursor.execute(statement)
+
+                cursor.copy_expert(copy_sql, stream, size=self.batch_bytes)
+
+                if not chunk:
+                    for statement in self.finalize_table_sql(layer, columns):
+                        cursor.execute(statement)
+
+            conn.commit()
+        except psycopg2.Error as error:
+            conn.rollback()
+            return 1, str(error).strip()
+        except Exception as error:
+            conn.rollback()
+            return -1, "{0}: {1}".format(type(error).__name__, error)
+        finally:
+            stream.close()
+            with self.lock:
+                if chunk:
+                    self.row_errors[layer] += stream.errors
+                    self.byte_counts[layer] += stream.byte_count
+                else:
+                    self.row_errors[layer] = stream.errors
+                    self.byte_counts[layer] = stream.byte_count
+            if own_conn:
+                conn.close()
+
+        if stream.errors:
+            return 0, "{} rows skipped".format(len(stream.errors))
+
+        return 0, ''
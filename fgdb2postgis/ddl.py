@@ -0,0 +1,411 @@
+##
+# ddl.py
+#
+# Description: In-memory model of the generated ddl (schemas, indexes, foreign keys,
+#              schema moves, clustering, partitions, final data layers and data checks) rendered to the sql scripts
+#              Objects are deduplicated by key and get collision-safe names
+#              within the 63 bytes limit of PostgreSQL identifiers
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import hashlib
+from collections import OrderedDict, namedtuple
+from os import path
+
+MAX_IDENTIFIER = 63
+
+Index = namedtuple('Index', 'name schema table column unique method', defaults=(None,))
+ForeignKey = namedtuple('ForeignKey', 'name schema table column ref_schema ref_table ref_column')
+Move = namedtuple('Move', 'table schema')
+Relation = namedtuple('Relation', 'origin primary_key destination foreign_key')
+Cluster = namedtuple('Cluster', 'table column method index')
+Partition = namedtuple('Partition', 'table method column values modulus children filters')
+
+ORPHANS_SCHEMA = 'fgdb2postgis_report'
+FINAL_DATA_SCHEMA = 'final_data'
+FIX_MODES = ['insert', 'nullify']
+CLUSTER_MODES = ['hilbert', 'gist']
+PARTITION_METHODS = ['range', 'list', 'hash', 'grid']
+
+# position of (x, y) on a hilbert curve of order 16 over the extent
+HILBERT_FUNCTION = '''CREATE OR REPLACE FUNCTION {}.fgdb2postgis_hilbert(
+    x float8, y float8, xmin float8, ymin float8, xmax float8, ymax float8)
+RETURNS bigint LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    n CONSTANT bigint := 65536;
+    ix bigint;
+    iy bigint;
+    rx bigint;
+    ry bigint;
+    s bigint := n / 2;
+    d bigint := 0;
+    t bigint;
+BEGIN
+    IF x IS NULL OR y IS NULL THEN
+        RETURN NULL;
+    END IF;
+    ix := least(greatest(coalesce(floor((x - xmin) / nullif(xmax - xmin, 0) * (n - 1)), 0), 0), n - 1);
+    iy := least(greatest(coalesce(floor((y - ymin) / nullif(ymax - ymin, 0) * (n - 1)), 0), 0), n - 1);
+    WHILE s > 0 LOOP
+        rx := ((ix & s) > 0)::int;
+        ry := ((iy & s) > 0)::int;
+        d := d + s * s * ((3 * rx) # ry);
+        IF ry = 0 THEN
+            IF rx = 1 THEN
+                ix := n - 1 - ix;
+                iy := n - 1 - iy;
+            END IF;
+            t := ix;
+            ix := iy;
+            iy := t;
+        END IF;
+        s := s / 2;
+    END LOOP;
+    RETURN d;
+END
+$$'''
+
+SQL_FILES = [
+    'create_schemas.sql',
+    'create_indexes.sql',
+    'create_constraints.sql',
+    'split_schemas.sql',
+    'cluster_layers.sql',
+    'create_views.sql',
+    'find_data_errors.sql',
+    'fix_data_errors.sql'
+]
+
+
+def quote_table(table, schema=None):
+    if schema:
+        return '"{0}"."{1}"'.format(schema, table)
+
+    return '"{}"'.format(table)
+
+
+def truncate(name, length):
+    encoded = name.encode('utf-8')[:length]
+    return encoded.decode('utf-8', 'ignore')
+
+
+def literal(value):
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def relation_literals(rel):
+    return ', '.join(literal(value) for value in rel)
+
+
+def orphan_condition(rel):
+    return ('d."{0}" IS NOT NULL AND NOT EXISTS (SELECT 1 FROM "{1}" o WHERE o."{2}" = d."{0}")'.format(
+        rel.foreign_key, rel.origin, rel.primary_key))
+
+
+class DDLModel:
+    # the schemas created by the tool are prefixed with schema_prefix (batch mode)
+    def __init__(self, schema_prefix=''):
+        self.schema_prefix = schema_prefix
+        self.final_data_schema = schema_prefix + FINAL_DATA_SCHEMA
+        self.orphans_schema = schema_prefix + ORPHANS_SCHEMA
+        self.orphans_table = '"{}"."orphans"'.format(self.orphans_schema)
+        # conversions sharing a database (batch mode) keep their own hilbert function
+        self.function_schema = '"{}public"'.format(schema_prefix) if schema_prefix else 'public'
+        self.extensions = ['postgis']
+        self.schemas = OrderedDict()
+        self.indexes = OrderedDict()
+        self.foreign_keys = OrderedDict()
+        self.moves = OrderedDict()
+        self.clusters = OrderedDict()
+        self.partitions = OrderedDict()
+        self.final_data = OrderedDict()
+        self.final_data_mode = None
+        self.relations = OrderedDict()
+        self.names = set()
+
+    # -------------------------------------------------------------------------------
+    # Unique identifier for base, hash of the object key appended if base is
+    # too long or already taken by another object
+    #
+    def make_name(self, base, key):
+        name = base
+        if len(name.encode('utf-8')) > MAX_IDENTIFIER or name in self.names:
+            digest = hashlib.md5(repr(key).encode('utf-8')).hexdigest()[:8]
+            name = "{0}_{1}".format(truncate(base, MAX_IDENTIFIER - 9), digest)
+
+            counter = 1
+            while name in self.names:
+                suffix = "{0}_{1}".format(digest, counter)
+                name = "{0}_{1}".format(truncate(base, MAX_IDENTIFIER - len(suffix) - 1), suffix)
+                counter += 1
+
+        self.names.add(name)
+        return name
+
+    # -------------------------------------------------------------------------------
+    # Add objects, the same object added twice is kept once
+    #
+    def add_schema(self, schema):
+        self.schemas[schema] = True
+
+    def add_index(self, table, column, schema=None, unique=True, method=None):
+        key = (schema, table, column) if method is None else (schema, table, column, method)
+        if key not in self.indexes:
+            base = "{0}_{1}_{2}idx".format(table, column, method + '_' if method else '')
+            self.indexes[key] = Index(self.make_name(base, key), schema, table, column, unique, method)
+
+        return self.indexes[key]
+
+    def add_foreign_key(self, table, column, ref_table, ref_column, ref_schema=None, schema=None):
+        key = (schema, table, column, ref_schema, ref_table, ref_column)
+        if key not in self.foreign_keys:
+            name = self.make_name("{0}_{1}".format(table, ref_table), key)
+            self.foreign_keys[key] = ForeignKey(name, schema, table, column, ref_schema, ref_table, ref_column)
+
+        return self.foreign_keys[key]
+
+    def add_move(self, table, schema):
+        self.moves[table] = Move(table, schema)
+
+    # hilbert: rewrite in hilbert order of the bounding box centers (temporary index),
+    # gist: rewrite in the order of the spatial index created by the loader
+    def add_cluster(self, table, column, method):
+        if method == 'hilbert':
+            index = self.make_name("{0}_{1}_hilbert_idx".format(table, column), (table, column, method))
+        else:
+            index = truncate("{0}_{1}_geom_idx".format(table, column), MAX_IDENTIFIER)
+        self.clusters[table] = Cluster(table, column, method, index)
+
+    # range: values are the bounds, list: the values of each partition, hash: modulus partitions,
+    # grid: values is the cell size, rows are hashed by grid cell into modulus partitions
+    # filters are the source where clauses of the partitions (range and list), in children order
+    def add_partition(self, table, method, column, values=None, modulus=None, filters=None):
+        if method == 'range':
+            count = len(values) - 1
+        elif method == 'list':
+            count = len(values)
+        else:
+            count = modulus
+
+        children = [self.make_name("{0}_p{1}".format(table, n), (table, n)) for n in range(1, count + 1)]
+        if method in ('range', 'list'):
+            children.append(self.make_name("{}_default".format(table), (table, 'default')))
+
+        self.partitions[table] = Partition(table, method, column, values, modulus, children, filters or [])
+        return self.partitions[table]
+
+    def add_final_data(self, layer, statements):
+        self.final_data[layer] = statements
+
+    def add_relation(self, origin, primary_key, destination, foreign_key):
+        key = (origin, primary_key, destination, foreign_key)
+        self.relations[key] = Relation(origin, primary_key, destination, foreign_key)
+
+    # -------------------------------------------------------------------------------
+    # Statements of each sql script (without the terminating semicolon)
+    #
+    def statements(self, sql_file):
+        if sql_file == 'create_schemas.sql':
+            statements = ['CREATE EXTENSION IF NOT EXISTS {}'.format(e) for e in self.extensions]
+            for schema in self.schemas:
+                if schema == 'public':
+                    continue
+                statements.append('DROP SCHEMA IF EXISTS "{}" CASCADE'.format(schema))
+                statements.append('CREATE SCHEMA "{}"'.format(schema))
+            return statements
+
+        # unique indexes of partitioned tables must contain the partition key
+        if sql_file == 'create_indexes.sql':
+            return ['CREATE {0}INDEX "{1}" ON {2} {3}("{4}")'.format(
+                'UNIQUE ' if index.unique and self.unique_allowed(index.table, index.column) else '',
+                index.name, quote_table(index.table, index.schema),
+                'USING {} '.format(index.method) if index.method else '', index.column)
+                for index in self.indexes.values()]
+
+        # foreign keys need a unique index on the referenced column
+        if sql_file == 'create_constraints.sql':
+            return ['ALTER TABLE {0} ADD CONSTRAINT "{1}" FOREIGN KEY ("{2}") REFERENCES {3} ("{4}") NOT VALID'.format(
+                quote_table(fk.table, fk.schema), fk.name, fk.column,
+                quote_table(fk.ref_table, fk.ref_schema), fk.ref_column)
+                for fk in self.foreign_keys.values() if self.unique_allowed(fk.ref_table, fk.ref_column)]
+
+        # the partitions of a table move with it
+        if sql_file == 'split_schemas.sql':
+            statements = []
+            for move in self.moves.values():
+                tables = [move.table]
+                if move.table in self.partitions:
+                    tables += self.partitions[move.table].children
+                statements += ['ALTER TABLE "{0}" SET SCHEMA "{1}"'.format(table, move.schema) for table in tables]
+            return statements
+
+        # partitioned tables cannot be clustered
+        if sql_file == 'cluster_layers.sql':
+            clusters = [cluster for cluster in self.clusters.values() if cluster.table not in self.partitions]
+            if not clusters:
+                return []
+
+            statements = self.cluster_header()
+            statements += [self.cluster_statement(cluster) for cluster in clusters]
+            return statements + self.cluster_footer()
+
+        if sql_file == 'create_views.sql':
+            if not self.final_data:
+                return []
+
+            statements = self.final_data_header()
+            for layer_statements in self.final_data.values():
+                statements += layer_statements
+            return statements
+
+        if sql_file == 'find_data_errors.sql':
+            if not self.relations:
+                return []
+
+            return self.orphans_header() + [self.orphan_check(rel) for rel in self.relations.values()]
+
+        if sql_file == 'fix_data_errors.sql':
+            return [self.orphan_fix(rel, 'insert') for rel in self.relations.values()]
+
+        raise ValueError("Unknown sql file {}".format(sql_file))
+
+    # -------------------------------------------------------------------------------
+    # Partitions, the partitioned table is created by the loader from the partition
+    # clause and the children statements
+    #
+    def unique_allowed(self, table, column):
+        partition = self.partitions.get(table)
+        return partition is None or partition.column == column
+
+    def partition_clause(self, table):
+        partition = self.partitions[table]
+        if partition.method == 'grid':
+            # grid cell of the bounding box center
+            key = ', '.join('(floor((ST_{0}Min("{1}") + ST_{0}Max("{1}")) / 2 / {2}))'.format(
+                axis, partition.column, partition.values) for axis in ('X', 'Y'))
+            return 'PARTITION BY HASH ({})'.format(key)
+
+        return 'PARTITION BY {0} ("{1}")'.format(partition.method.upper(), partition.column)
+
+    def partition_children(self, table, schema=None, unlogged=False):
+        partition = self.partitions[table]
+        if partition.method in ('range', 'list'):
+            values = [literal(str(value)) for value in partition.values]
+
+        if partition.method == 'range':
+            bounds = ['FROM ({0}) TO ({1})'.format(values[n], values[n + 1]) for n in range(len(values) - 1)]
+        elif partition.method == 'list':
+            bounds = ['IN ({})'.format(value) for value in values]
+        else:
+            bounds = ['WITH (MODULUS {0}, REMAINDER {1})'.format(partition.modulus, n)
+                      for n in range(partition.modulus)]
+
+        statements = []
+        for child, bound in zip(partition.children, bounds + ['DEFAULT']):
+            statements.append('CREATE {0}TABLE {1} PARTITION OF {2} {3}'.format(
+                'UNLOGGED ' if unlogged else '', quote_table(child, schema), quote_table(table, schema),
+                bound if bound == 'DEFAULT' else 'FOR VALUES ' + bound))
+        return statements
+
+    # -------------------------------------------------------------------------------
+    # Clustering, the hilbert key is scaled to the extent of each layer
+    #
+    def cluster_header(self):
+        if any(cluster.method == 'hilbert' for cluster in self.clusters.values()):
+            return [HILBERT_FUNCTION.format(self.function_schema)]
+        return []
+
+    def cluster_footer(self):
+        if any(cluster.method == 'hilbert' for cluster in self.clusters.values()):
+            return ['DROP FUNCTION IF EXISTS {}.fgdb2postgis_hilbert(float8, float8, float8, float8, float8, float8)'
+                    .format(self.function_schema)]
+        return []
+
+    def cluster_statement(self, cluster):
+        table = quote_table(cluster.table)
+        if cluster.method == 'gist':
+            return 'CLUSTER {0} USING "{1}"'.format(table, cluster.index)
+
+        column = '"{}"'.format(cluster.column)
+        key = ('{0}.fgdb2postgis_hilbert((ST_XMin({1}) + ST_XMax({1})) / 2, (ST_YMin({1}) + ST_YMax({1})) / 2, '
+               .format(self.function_schema, column).replace("'", "''"))
+        table_text = table.replace("'", "''")
+        return (
+            'DO $$\n'
+            'DECLARE\n'
+            '    e box2d;\n'
+            'BEGIN\n'
+            '    SELECT ST_Extent({0}) INTO e FROM {1};\n'
+            '    IF e IS NOT NULL THEN\n'
+            '        EXECUTE \'CREATE INDEX "{2}" ON {3} ({4}\' || ST_XMin(e) || \', \' || ST_YMin(e) || \', \'\n'
+            '            || ST_XMax(e) || \', \' || ST_YMax(e) || \'))\';\n'
+            '        EXECUTE \'CLUSTER {3} USING "{2}"\';\n'
+            '        EXECUTE \'DROP INDEX "{2}"\';\n'
+            '    END IF;\n'
+            'END\n'
+            '$$'.format(column, table, cluster.index, table_text, key))
+
+    def final_data_header(self):
+        return ['DROP SCHEMA IF EXISTS "{}" CASCADE'.format(self.final_data_schema),
+                'CREATE SCHEMA "{}"'.format(self.final_data_schema)]
+
+    def final_data_refresh(self):
+        if self.final_data_mode != 'matview':
+            return []
+
+        return ['REFRESH MATERIALIZED VIEW CONCURRENTLY "{0}"."{1}"'.format(self.final_data_schema, layer)
+                for layer in self.final_data]
+
+    # -------------------------------------------------------------------------------
+    # Orphan keys of the relations, the rows of the destination whose foreign key
+    # has no match in the origin (NOT EXISTS, planned as a hash anti join)
+    # Every check adds one row to the report table with a sample of the keys
+    #
+    def orphans_header(self):
+        return [
+            'CREATE SCHEMA IF NOT EXISTS "{}"'.format(self.orphans_schema),
+            'DROP TABLE IF EXISTS {}'.format(self.orphans_table),
+            'CREATE TABLE {} (origin text, primary_key text, destination text, foreign_key text, '
+            'orphan_rows bigint, orphan_keys bigint, sample_keys text[], fix text, fixed_rows bigint, '
+            'checked timestamptz DEFAULT now())'.format(self.orphans_table)
+        ]
+
+    def orphan_check(self, rel, samples=10):
+        return (
+            'INSERT INTO {0} (origin, primary_key, destination, foreign_key, orphan_rows, orphan_keys, sample_keys)\n'
+            'SELECT {1}, count(*), count(DISTINCT d."{2}"), (array_agg(DISTINCT d."{2}"::text))[1:{3}]\n'
+            '  FROM "{4}" d\n'
+            ' WHERE {5}'.format(self.orphans_table, relation_literals(rel), rel.foreign_key, samples,
+                                rel.destination, orphan_condition(rel)))
+
+    # insert: add the missing keys to the origin, nullify: clear the foreign keys
+    def orphan_fix(self, rel, mode):
+        if mode == 'insert':
+            fix = ('INSERT INTO "{0}" ("{1}")\n'
+                   '    SELECT DISTINCT d."{2}" FROM "{3}" d\n'
+                   '     WHERE {4}'.format(rel.origin, rel.primary_key, rel.foreign_key,
+                                          rel.destination, orphan_condition(rel)))
+        elif mode == 'nullify':
+            fix = ('UPDATE "{0}" d SET "{1}" = NULL\n'
+                   '     WHERE {2}'.format(rel.destination, rel.foreign_key, orphan_condition(rel)))
+        else:
+            raise ValueError("Unknown fix mode {}".format(mode))
+
+        return (
+            'WITH fixed AS (\n    {0}\n    RETURNING 1)\n'
+            'UPDATE {1} SET fix = \'{2}\', fixed_rows = (SELECT count(*) FROM fixed)\n'
+            ' WHERE (origin, primary_key, destination, foreign_key) = ({3})'.format(
+                fix, self.orphans_table, mode, relation_literals(rel)))
+
+    # -------------------------------------------------------------------------------
+    # Write the sql scripts to the sql folder
+    #
+    def render(self, sqlfolder_path, sql_files=SQL_FILES):
+        for sql_file in sql_files:
+            with open(path.join(sqlfolder_path, sql_file), 'w', encoding='utf-8') as f:
+                for statement in self.statements(sql_file):
+                    if statement.startswith('\\'):
+                        f.write("{}\n".format(statement))
+                    else:
+                        f.write("{};\n".format(statement))
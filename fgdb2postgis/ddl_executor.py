@@ -0,0 +1,270 @@
+##
+# ddl_executor.py
+#
+# Description: Execute the generated index, constraint and schema scripts in parallel
+#              Statements are parsed into a dependency graph and run over a pool of
+#              connections; foreign keys left NOT VALID are validated at the end
+#              Statements whose dependencies failed are skipped, statements that
+#              only have to run after others (after) run anyway
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import psycopg2
+
+from fgdb2postgis.sql_script import read_statements
+
+IDENT = r'((?:"[^"]+"\.)?"[^"]+")'
+
+RE_INDEX = re.compile(
+    r'^CREATE\s+(?:UNIQUE\s+)?INDEX\s+"[^"]+"\s+ON\s+' + IDENT + r'\s*(?:USING\s+\w+\s*)?\(\s*"([^"]+)"\s*\)',
+    re.IGNORECASE)
+RE_FOREIGN_KEY = re.compile(
+    r'^ALTER\s+TABLE\s+' + IDENT + r'\s+ADD\s+CONSTRAINT\s+("[^"]+")\s+FOREIGN\s+KEY\s*\(\s*"([^"]+)"\s*\)\s*'
+    r'REFERENCES\s+' + IDENT + r'\s*\(\s*"([^"]+)"\s*\)(\s+NOT\s+VALID)?',
+    re.IGNORECASE)
+RE_SET_SCHEMA = re.compile(
+    r'^ALTER\s+TABLE\s+' + IDENT + r'\s+SET\s+SCHEMA\s+', re.IGNORECASE)
+RE_SESSION = re.compile(r'^(SET|RESET)\s', re.IGNORECASE)
+
+
+def unquote(ident):
+    return ident.replace('"', '')
+
+
+class Statement:
+    def __init__(self, sql_text, source, kind='other', tables=(), refs=(), shared=False):
+        self.sql = sql_text
+        self.source = source
+        self.kind = kind
+        self.tables = set(tables)
+        self.refs = set(refs) | self.tables
+        self.shared = shared
+        self.key = None
+        self.barrier = False
+        self.deps = set()
+        self.after = set()
+        self.error = None
+        self.skipped = False
+        self.duration = 0
+
+
+# -------------------------------------------------------------------------------
+# Parse generated ddl statements into a dependency graph
+#
+class DDLGraph:
+    def __init__(self, novalidate=()):
+        self.statements = []
+        self.session = []
+        self.indexes = {}
+        # (table, column) of foreign keys known to fail validation (orphan keys)
+        self.novalidate = set(novalidate)
+
+    def read_file(self, sql_file):
+        for statement, line in read_statements(sql_file):
+            self.add(statement, "{0}:{1}".format(sql_file, line))
+
+    def add(self, sql_text, source):
+        if RE_SESSION.match(sql_text):
+            if sql_text not in self.session:
+                self.session.append(sql_text)
+            return
+
+        m = RE_INDEX.match(sql_text)
+        if m:
+            table = unquote(m.group(1))
+            stmt = Statement(sql_text, source, 'index', [table], shared=True)
+            self.indexes[(table, m.group(2))] = stmt
+            self.statements.append(stmt)
+            return
+
+        m = RE_FOREIGN_KEY.match(sql_text)
+        if m:
+            table, master = unquote(m.group(1)), unquote(m.group(4))
+            stmt = Statement(sql_text, source, 'foreign_key', [table, master])
+            stmt.key = (master, m.group(5))
+            self.statements.append(stmt)
+
+            if m.group(6) and (table, m.group(3)) not in self.novalidate:
+                validate = Statement(
+                    'ALTER TABLE {0} VALIDATE CONSTRAINT {1}'.format(m.group(1), m.group(2)),
+                    source, 'validate', [table], refs=[master])
+                validate.deps.add(stmt)
+                self.statements.append(validate)
+            return
+
+        m = RE_SET_SCHEMA.match(sql_text)
+        if m:
+            self.statements.append(Statement(sql_text, source, 'set_schema', [unquote(m.group(1))]))
+            return
+
+        # unknown statements run on their own, after everything read before them
+        stmt = Statement(sql_text, source)
+        stmt.after.update(self.statements)
+        stmt.barrier = True
+        self.statements.append(stmt)
+
+    # resolve dependencies once all files are read
+    def resolve(self):
+        for stmt in self.statements:
+            if stmt.kind == 'foreign_key' and stmt.key in self.indexes:
+                stmt.deps.add(self.indexes[stmt.key])
+
+            if stmt.kind == 'set_schema':
+                table = next(iter(stmt.tables))
+                stmt.after.update(s for s in self.statements
+                                 if s.kind in ('index', 'foreign_key', 'validate') and table in s.refs)
+
+        # statements after a barrier wait for it
+        barrier = None
+        for stmt in self.statements:
+            if barrier is not None:
+                stmt.after.add(barrier)
+            if stmt.barrier:
+                barrier = stmt
+
+
+# -------------------------------------------------------------------------------
+# Run the graph over a pool of connections
+# Statements touching the same table do not run at the same time,
+# except index builds which share the table lock
+# A failed statement fails its dependents (deps, transitively) without running them
+#
+class DDLExecutor:
+    def __init__(self, conn_string, jobs=4, session_sql=()):
+        self.conn_string = conn_string
+        self.jobs = jobs
+        self.session_sql = list(session_sql)
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.sql_time = 0
+
+    def connection(self, session):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = psycopg2.connect(self.conn_string)
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                for statement in self.session_sql + session:
+                    cursor.execute(statement)
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+
+        return conn
+
+    def execute(self, stmt, session):
+        try:
+            with self.connection(session).cursor() as cursor:
+                start = time.time()
+                cursor.execute(stmt.sql)
+                stmt.duration = time.time() - start
+        except psycopg2.Error as error:
+            stmt.error = str(error).strip()
+
+        return stmt
+
+    def run(self, graph):
+        graph.resolve()
+        start = time.time()
+
+        # statements become ready once all their dependencies are done
+        waiting = {}
+        dependents = {}
+        for stmt in graph.statements:
+            waiting[stmt] = len(stmt.deps | stmt.after)
+            for dep in stmt.deps | stmt.after:
+                dependents.setdefault(dep, []).append(stmt)
+
+        ready = [stmt for stmt in graph.statements if not waiting[stmt]]
+        shared = {}
+        exclusive = set()
+        running = {}
+
+        # release the dependents of a finished (or skipped) statement
+        def release(stmt):
+            finished = [stmt]
+            while finished:
+                stmt = finished.pop()
+                for dependent in dependents.get(stmt, []):
+                    if stmt.error and stmt in dependent.deps and not dependent.error:
+                        dependent.error = 'dependency failed: {}'.format(stmt.source)
+                        dependent.skipped = True
+
+                    waiting[dependent] -= 1
+                    if waiting[dependent]:
+                        continue
+                    if dependent.skipped:
+                        finished.append(dependent)
+                    else:
+                        ready.append(dependent)
+
+        def startable(stmt):
+            for table in stmt.tables:
+                if table in exclusive or (table in shared and not stmt.shared):
+                    return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while ready or running:
+                for stmt in list(ready):
+                    if len(running) >= self.jobs:
+                        break
+                    if not startable(stmt):
+                        continue
+
+                    ready.remove(stmt)
+                    for table in stmt.tables:
+                        if stmt.shared:
+                            shared[table] = shared.get(table, 0) + 1
+                        else:
+                            exclusive.add(table)
+                    running[executor.submit(self.execute, stmt, graph.session)] = stmt
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stmt = running.pop(future)
+                    for table in stmt.tables:
+                        if stmt.shared:
+                            shared[table] -= 1
+                            if not shared[table]:
+                                del shared[table]
+                        else:
+                            exclusive.discard(table)
+
+                    if stmt.error:
+                        print(" Exception ({0}): {1}".format(stmt.source, stmt.error))
+
+                    release(stmt)
+
+        # dependencies that can never complete
+        for stmt in graph.statements:
+            if waiting[stmt]:
+                stmt.error = 'unresolved dependencies'
+
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+
+        errors = [stmt for stmt in graph.statements if stmt.error and not stmt.skipped]
+        skipped = [stmt for stmt in graph.statements if stmt.skipped]
+        for stmt in skipped:
+            print(" Skipped ({0}): {1}".format(stmt.source, stmt.error))
+
+        self.sql_time = sum(stmt.duration for stmt in graph.statements)
+        kinds = {}
+        for stmt in graph.statements:
+            kinds[stmt.kind] = kinds.get(stmt.kind, 0) + 1
+
+        print(" {0} statements ({1}), {2} failed, {3} skipped, {4:.1f}s".format(
+            len(graph.statements),
+            ', '.join('{0} {1}'.format(count, kind) for kind, count in sorted(kinds.items())),
+            len(errors), len(skipped), time.time() - start))
+
+        return len(errors)
@@ -1,8 +1,8 @@
 ##
 # filegdb.py
 #
-# Description: Read file geodatabase, create tables for subtypes and domains
-#              Prepare sql scripts for indexes and foreign key constraints
+# Description: Read file geodatabase, collect the values of subtypes and domains
+#              Fill the ddl model of indexes and foreign key constraints and render the sql scripts
 # Author: George Ioannou
 # Copyright: Cartologic 2017-2020
 #
@@ -12,12 +12,26 @@ from os import getcwd, mkdir, path
 from ruamel.yaml import YAML
 from slugify import Slugify
 
-import arcpy
 import sys
 
+from fgdb2postgis.cache import MetadataCache, digest
+from fgdb2postgis.catalog import open_catalog
+from fgdb2postgis.ddl import PARTITION_METHODS, DDLModel
+
 
 slugify = Slugify(translate=None)
 
+# field type of domain codes
+DOMAIN_FIELD_TYPES = {
+    'Short': 'SmallInteger',
+    'Long': 'Integer',
+    'BigInteger': 'BigInteger',
+    'Float': 'Single',
+    'Double': 'Double',
+    'Text': 'String',
+    'Date': 'Date'
+}
+
 
 class YAMLObject(YAML):
     def __init__(self):
@@ -28,22 +42,37 @@ class YAMLObject(YAML):
 yaml = YAMLObject()
 
 
+# attributes filled by the processing steps, kept by the metadata cache
+MODEL_STATE = ['ddl', 'lookup_tables', 'table_schemas']
+
+
 class FileGDB:
-    def __init__(self, workspace, a_srs):
+    def __init__(self, workspace, a_srs, schema_prefix='', backend='arcpy', cache=False, jobs=1):
         self.workspace = workspace
         self.a_srs = a_srs
+        # with a schema prefix (batch mode) every schema is prefixed, public included
+        self.schema_prefix = schema_prefix
+        self.default_schema = self.schema_name('public')
+        self.lookup_schema = self.schema_name('lookup_tables')
         self.workspace_path = ""
         self.sqlfolder_path = ""
         self.yamlfile_path = ""
+        self.manifest_path = ""
+        self.cache_path = ""
+        self.yaml_digest = None
         self.schemas = []
         self.feature_datasets = {}
         self.feature_classes = {}
         self.tables = {}
-        self.indexes = []
-        self.constraints = []
-        self.views = []
+        self.partitions = {}
+        self.ddl = DDLModel(schema_prefix)
+        self.table_schemas = {}
+        self.lookup_tables = {}
+        self.backend = backend
+        self.catalog = open_catalog(workspace, backend, jobs)
+        self.restored = False
         self.init_paths()
-        self.setenv()
+        self.cache = MetadataCache(self.cache_path, workspace, backend) if cache else None
         self.parse_yaml()
 
     # -------------------------------------------------------------------------------
@@ -58,24 +87,28 @@ class FileGDB:
         # sqlfolder, yamlfile path
         sqlfolder_base = "{}.sql".format(workspace_base)
         yamlfile_base = "{}.yml".format(workspace_base)
+        manifest_base = "{}.manifest.json".format(workspace_base)
+        cache_base = "{}.cache".format(workspace_base)
         sqlfolder_path = path.join(workspace_dir, sqlfolder_base)
         yamlfile_path = path.join(workspace_dir, yamlfile_base)
+        manifest_path = path.join(workspace_dir, manifest_base)
+        cache_path = path.join(workspace_dir, cache_base)
 
         # set current object instance props
         self.workspace_path = workspace_path
         self.sqlfolder_path = sqlfolder_path
         self.yamlfile_path = yamlfile_path
+        self.manifest_path = manifest_path
+        self.cache_path = cache_path
 
     def info(self):
         print("\nFileGDB Info:")
         print(" Workspace: {0} ({1})".format(self.workspace_path, self.a_srs))
         print(" Sqlfolder: {0}".format(self.sqlfolder_path))
         print(" Yamlfile: {0}".format(self.yamlfile_path))
-
-    def setenv(self):
-        print("\nSetting arcpy environment ...")
-        arcpy.env.workspace = self.workspace
-        arcpy.env.overwriteOutput = True
+        print(" Manifest: {0}".format(self.manifest_path))
+        if self.cache is not None:
+            print(" Cache: {0}".format(self.cache_path))
 
     # -------------------------------------------------------------------------------
     # Parse the yaml file and map data to schemas
@@ -87,7 +120,9 @@ class FileGDB:
             self.create_yaml()
 
         with open(self.yamlfile_path, 'r', encoding="utf-8") as ymlfile:
-            data_map = yaml.load(ymlfile)
+            text = ymlfile.read()
+            self.yaml_digest = digest(text)
+            data_map = yaml.load(text)
             for key_type, value_items in data_map.items():
                 if (key_type == "Schemas"):
                     self.schemas = value_items
@@ -97,14 +132,70 @@ class FileGDB:
                     self.feature_classes = value_items
                 elif (key_type == "Tables"):
                     self.tables = value_items
+                elif (key_type == "Partitions"):
+                    self.partitions = value_items or {}
+
 
+        if self.schema_prefix:
+            self.schemas = [self.schema_name(schema) for schema in self.schemas]
+            self.schemas.insert(0, self.default_schema)
+            self.feature_datasets = self.prefix_keys(self.feature_datasets)
+            self.feature_classes = self.prefix_keys(self.feature_classes)
+            self.tables = self.prefix_keys(self.tables)
 
         # lookup_tables is a default schema and it will host subtypes, domains
-        if 'lookup_tables' not in self.schemas:
-            self.schemas.append('lookup_tables')
+        if self.lookup_schema not in self.schemas:
+            self.schemas.append(self.lookup_schema)
+
+    def schema_name(self, schema):
+        if not self.schema_prefix:
+            return schema
+
+        return "{0}{1}".format(self.schema_prefix, schema)
+
+    def prefix_keys(self, mapping):
+        return {self.schema_name(schema): items for schema, items in (mapping or {}).items()}
+
+    # -------------------------------------------------------------------------------
+    # Scan the geodatabase, the catalog is restored from the cache if the schema is unchanged
+    #
+    def scan(self):
+        if self.cache is not None and not self.catalog.scanned:
+            print("\nChecking metadata cache ...")
+            self.cache.restore_catalog(self.catalog)
+
+        self.catalog.scan()
 
     # -------------------------------------------------------------------------------
-    # Open sql files
+    # Restore the ddl model processed by a previous run of the same catalog, yaml file
+    # and options, the processing steps are then skipped (see unless_restored)
+    # The brin indexes depend on the row counts of the layers, they are part of the key
+    #
+    def restore_model(self, partitions=False, cluster=None, brin_rows=None, final_data=None):
+        if self.cache is None:
+            return
+
+        key = [self.schema_prefix, self.yaml_digest, bool(partitions), cluster, brin_rows, final_data]
+        if brin_rows:
+            key.append(self.list_layers())
+
+        state = self.cache.restore_model(*key)
+        if state is not None:
+            for name in MODEL_STATE:
+                setattr(self, name, state[name])
+            self.restored = True
+            print("\nRestored the ddl model ({} lookup tables) from the cache ...".format(len(self.lookup_tables)))
+
+    def unless_restored(self, func, *args):
+        if not self.restored:
+            return func(*args)
+
+    def save_cache(self):
+        if self.cache is not None and not self.restored:
+            self.cache.save(self.catalog, {name: getattr(self, name) for name in MODEL_STATE})
+
+    # -------------------------------------------------------------------------------
+    # Initialize sql folder and ddl model
     #
     def open_files(self):
         print("\nInitializing sql files ...")
@@ -112,33 +203,25 @@ class FileGDB:
         if not path.exists(self.sqlfolder_path):
             mkdir(self.sqlfolder_path)
 
-        self.f_create_schemas = open(
-            path.join(self.sqlfolder_path, "create_schemas.sql"), "w", encoding='utf-8')
-        self.f_split_schemas = open(
-            path.join(self.sqlfolder_path, "split_schemas.sql"), "w", encoding='utf-8')
-        self.f_create_indexes = open(
-            path.join(self.sqlfolder_path, "create_indexes.sql"), "w", encoding='utf-8')
-        self.f_create_constraints = open(
-            path.join(self.sqlfolder_path, "create_constraints.sql"), "w", encoding='utf-8')
-        self.f_create_views = open(
-            path.join(self.sqlfolder_path, "create_views.sql"), "w", encoding='utf-8')
-        self.f_find_data_errors = open(
-            path.join(self.sqlfolder_path, "find_data_errors.sql"), "w", encoding='utf-8')
-        self.f_fix_data_errors = open(
-            path.join(self.sqlfolder_path, "fix_data_errors.sql"), "w", encoding='utf-8')
+        self.ddl = DDLModel(self.schema_prefix)
 
     # -------------------------------------------------------------------------------
-    # close sql files
+    # Render one sql file before the others (e.g. create_schemas.sql once the schemas
+    # are processed, so the schemas can be created while the model is being filled)
+    #
+    def write_sql(self, sql_file):
+        self.ddl.render(self.sqlfolder_path, [sql_file])
+
+    # -------------------------------------------------------------------------------
+    # Render the ddl model to the sql files
     #
     def close_files(self):
-        print("\nClosing sql files ...")
-        self.f_create_schemas.close()
-        self.f_split_schemas.close()
-        self.f_create_indexes.close()
-        self.f_create_constraints.close()
-        self.f_create_views.close()
-        self.f_find_data_errors.close()
-        self.f_fix_data_errors.close()
+        print("\nWriting sql files ...")
+        self.ddl.render(self.sqlfolder_path)
+
+        print(" {0} indexes, {1} constraints, {2} schema moves".format(
+            len(self.ddl.indexes), len(self.ddl.foreign_keys), len(self.ddl.moves)))
+        print(" Arcpy calls: {}".format(self.catalog.arcpy_calls))
 
     # -------------------------------------------------------------------------------
     # Process domains
@@ -148,53 +231,34 @@ class FileGDB:
         print("\nProcessing domains ...")
 
         # create table for each domain
-        domains_list = arcpy.da.ListDomains(self.workspace)
-        for domain in domains_list:
+        for domain in self.catalog.list_domains():
             self.create_domain_table(domain)
-        
-        # create fk constraints for data tables referencing domain tables
-        tables_list = arcpy.ListTables()
-        tables_list.sort()
-
-        for table in tables_list:
-            self.create_constraints_referencing_domains(table)
-
-        # create fk constraints for feature classes referencing domain tables
-        # stand-alone feature classes
-        fc_list = arcpy.ListFeatureClasses("*", "")
-        fc_list.sort()
 
-        for fc in fc_list:
-            self.create_constraints_referencing_domains(fc)
-
-        # feature classes in feature datasets
-        fds_list = arcpy.ListDatasets("*", "Feature")
-        fds_list.sort()
-
-        for fds in fds_list:
-            fc_list = arcpy.ListFeatureClasses("*", "", fds)
-            fc_list.sort()
-
-            for fc in fc_list:
-                self.create_constraints_referencing_domains(fc)
+        # create fk constraints for tables, stand-alone feature classes
+        # and feature classes in feature datasets referencing domain tables
+        for layer in self.catalog.all_layers():
+            self.create_constraints_referencing_domains(layer)
 
     # -------------------------------------------------------------------------------
     # Create domain table (list of values)
+    # The table is created by PostGIS.load_lookup_tables in lookup_tables schema
     #
     def create_domain_table(self, domain):
         domain_name = slugify(domain.name, separator='_', lowercase=False)
         domain_table = "{}_lut".format(domain_name)
 
         domain_field = "Code"
-        domain_field_desc = "Description"
 
-        if not arcpy.Exists(domain_table):
-            arcpy.DomainToTable_management(
-                self.workspace, domain.name, domain_table, domain_field, domain_field_desc)
+        if domain.domain_type != 'CodedValue':
+            print(" {} is not a coded value domain, skipped".format(domain.name))
+            return
+
+        field_type = DOMAIN_FIELD_TYPES.get(domain.field_type, 'String')
+        self.lookup_tables[domain_table] = (
+            domain_field, field_type, list(domain.coded_values.items()))
 
         # create index
-        self.create_index(domain_table, domain_field)
-        self.split_schemas(domain_table, "lookup_tables")
+        self.create_index(domain_table, domain_field, self.lookup_schema)
 
     # -------------------------------------------------------------------------------
     # Create foraign key constraints to tables referencing domain tables
@@ -202,12 +266,7 @@ class FileGDB:
     def create_constraints_referencing_domains(self, layer):
         dmcode = "Code"
         dmcode_desc = "Description"
-        subtypes = {}
-
-        try:
-            subtypes = arcpy.da.ListSubtypes(layer)
-        except:
-            print(layer, "List subtypes exception")
+        subtypes = self.catalog.subtypes(layer)
 
         for stcode, v1 in subtypes.items():
             for k2, v2 in v1.items():
@@ -229,10 +288,11 @@ class FileGDB:
                     for dmfield, v3 in v2.items():
                         if v3[1] is not None:
                             dmname = slugify(
-                                v3[1].name, separator='_', lowercase=False)
+                                v3[1], separator='_', lowercase=False)
                             dmtable = dmname + '_lut'
-                            self.create_foreign_key_constraint(
-                                layer, dmfield, dmtable, dmcode)
+                            if dmtable in self.lookup_tables:
+                                self.create_foreign_key_constraint(
+                                    layer, dmfield, dmtable, dmcode, self.lookup_schema)
 
     # -------------------------------------------------------------------------------
     # Process subtypes
@@ -242,41 +302,16 @@ class FileGDB:
     def process_subtypes(self):
         print("\nProcessing subtypes ...")
 
-        # create subtypes table for tables
-        tables_list = arcpy.ListTables()
-        tables_list.sort()
-
-        for table in tables_list:
-            self.create_subtypes_table(table)
-
-        # create subtypes table for stand-alone featureclasses
-        fc_list = arcpy.ListFeatureClasses("*", "")
-        fc_list.sort()
-
-        for fc in fc_list:
-            self.create_subtypes_table(fc)
-
-        # create subtypes table for featureclasses in datasets
-        fds_list = arcpy.ListDatasets("*", "Feature")
-        fds_list.sort()
-
-        for fds in fds_list:
-            fc_list = arcpy.ListFeatureClasses("*", "", fds)
-            fc_list.sort()
-
-            for fc in fc_list:
-                self.create_subtypes_table(fc)
+        # create subtypes table for tables, stand-alone featureclasses
+        # and featureclasses in datasets
+        for layer in self.catalog.all_layers():
+            self.create_subtypes_table(layer)
 
     # -------------------------------------------------------------------------------
     # Create subtypes table for layer/field and insert records (list of values)
     #
     def create_subtypes_table(self, layer):
-        subtypes_dict = {}
-
-        try:
-            subtypes_dict = arcpy.da.ListSubtypes(layer)
-        except:
-            print(layer, "An exception occurred")
+        subtypes_dict = self.catalog.subtypes(layer)
 
         if subtypes_dict:                
             subtype_fields = {key: value['SubtypeField']
@@ -287,44 +322,37 @@ class FileGDB:
             key, field = list(subtype_fields.items())[0]                
 
             if len(field) > 0:
-                # find subtype field type
-                field_type = None
-                for f in arcpy.ListFields(layer):
-                    if f.name == field:
-                        field_type = f.type
-
-                # convert field to upper case and try again if not found
-                if field_type == None:
-                    field = field.upper()
-                    for f in arcpy.ListFields(layer):
-                        if f.name.upper() == field:
-                            field_type = f.type
+                field, field_type = self.find_field(layer, field)
 
                 subtypes_table = "{0}_{1}_sub".format(layer, field)
                 subtypes_table = slugify(
                     subtypes_table, separator='_', lowercase=False)
 
-                if not arcpy.Exists(subtypes_table):
-                    # create subtypes table
-                    arcpy.CreateTable_management(self.workspace, subtypes_table)
-                    arcpy.AddField_management(subtypes_table, field, field_type)
-                    arcpy.AddField_management(
-                        subtypes_table, "Description", "String")
+                # subtypes table (list of values) is created by PostGIS.load_lookup_tables
+                self.lookup_tables[subtypes_table] = (
+                    field, field_type or 'Integer', list(subtype_values.items()))
+
+                self.create_index(subtypes_table, field, self.lookup_schema)
+                self.create_foreign_key_constraint(
+                    layer, field, subtypes_table, field, self.lookup_schema)
 
-                    # insert records (list of values)
-                    cur = arcpy.da.InsertCursor(subtypes_table, "*")
-                    oid = 1
-                    for code, desc in subtype_values.items():
-                        # print("  {0} {1}".format(code, desc))
-                        cur.insertRow([oid, code, desc])
-                        oid += 1
+    # -------------------------------------------------------------------------------
+    # Find field and field type of layer
+    # Convert field to upper case and try again if not found
+    #
+    def find_field(self, layer, field):
+        fields = self.catalog.fields(layer)
 
-                    del cur
+        for f in fields:
+            if f.name == field:
+                return field, f.type
 
-                self.create_index(subtypes_table, field)
-                self.create_foreign_key_constraint(
-                    layer, field, subtypes_table, field)
-                self.split_schemas(subtypes_table, "lookup_tables")
+        field = field.upper()
+        for f in fields:
+            if f.name.upper() == field:
+                return field, f.type
+
+        return field, None
 
     # -------------------------------------------------------------------------------
     # Process relations
@@ -334,77 +362,36 @@ class FileGDB:
     def process_relations(self):
         print("\nProcessing relations ...")
 
-        relClassSet = self.get_relationship_classes()
-
-        for relClass in relClassSet:
-            rel = arcpy.Describe(relClass)
-            if rel.isAttachmentRelationship:
+        for rel in self.get_relationship_classes():
+            if rel.is_attachment:
                 continue
 
-            rel_origin_table = rel.originClassNames[0]
-            rel_destination_table = rel.destinationClassNames[0]
+            rel_origin_table = rel.origin
+            rel_destination_table = rel.destination
 
-            rel_primary_key = rel.originClassKeys[0][0]
-            rel_foreign_key = rel.originClassKeys[1][0]
+            rel_primary_key = rel.origin_keys[0][0]
+            rel_foreign_key = rel.origin_keys[1][0]
 
             # convert primary/foreign key to uppercase if not found
-            if rel_primary_key not in [field.name for field in arcpy.ListFields(rel_origin_table)]:
-                rel_primary_key = rel.originClassKeys[0][0].upper()
+            if rel_primary_key not in self.catalog.field_names(rel_origin_table):
+                rel_primary_key = rel.origin_keys[0][0].upper()
 
-            if rel_foreign_key not in [field.name for field in arcpy.ListFields(rel_destination_table)]:
-                rel_foreign_key = rel.originClassKeys[1][0].upper()
+            if rel_foreign_key not in self.catalog.field_names(rel_destination_table):
+                rel_foreign_key = rel.origin_keys[1][0].upper()
 
             self.create_index(rel_origin_table, rel_primary_key)
             self.create_foreign_key_constraint(
                 rel_destination_table, rel_foreign_key, rel_origin_table, rel_primary_key)
 
-            # prcess data errors (fk)
-            str_data_errors_fk = '\\echo {0} ({1}) -> {2} ({3});'.format(
-                rel_destination_table, rel_foreign_key, rel_origin_table, rel_primary_key)
-            self.write_it(self.f_find_data_errors, str_data_errors_fk)
-
-            str_data_errors = 'SELECT COUNT(*) FROM "{0}" dest WHERE NOT EXISTS (SELECT 1 FROM "{1}" orig WHERE dest."{2}" = orig."{3}");'
-            str_data_errors = str_data_errors.format(
-                rel_destination_table, rel_origin_table, rel_foreign_key, rel_primary_key)
-
-            self.write_it(self.f_find_data_errors, str_data_errors)
-
-            str_fix_errors_1 = 'INSERT INTO "{0}" ("{1}")'.format(
-                rel_origin_table, rel_primary_key)
-            str_fix_errors_2 = 'SELECT DISTINCT detail."{0}" \n  FROM "{1}" AS detail \n LEFT JOIN "{2}" AS master ON detail."{3}" = master."{4}" \n WHERE master.id IS NULL;\n'
-            str_fix_errors_2 = str_fix_errors_2.format(
-                rel_foreign_key, rel_destination_table, rel_origin_table, rel_foreign_key, rel_primary_key)
-
-            self.write_it(self.f_fix_data_errors, str_fix_errors_1)
-            self.write_it(self.f_fix_data_errors, str_fix_errors_2)
+            # find and fix data errors (fk)
+            self.ddl.add_relation(
+                rel_origin_table, rel_primary_key, rel_destination_table, rel_foreign_key)
 
     # -------------------------------------------------------------------------------
-    # Create relationship classes Set and return it to the calling routine
+    # Return the relationship classes of the layers to the calling routine
     #
     def get_relationship_classes(self):
-
-        # get featureclasses outside of datasets
-        fc_list = arcpy.ListFeatureClasses("*")
-
-        # get fetatureclasses within datasets
-        fds_list = arcpy.ListDatasets("*", "Feature")
-        for fds in fds_list:
-            fc_list += arcpy.ListFeatureClasses("*", "", fds)
-
-        # get tables
-        fc_list += arcpy.ListTables("*")
-
-        # create relationship classes set
-        relClasses = set()
-        for i, fc in enumerate(fc_list):
-            desc = arcpy.Describe(fc)
-            try:
-                for j, rel in enumerate(desc.relationshipClassNames):
-                    relClasses.add(rel)
-            except:
-                print(fc, "An exception occurred")
-
-        return relClasses
+        return self.catalog.list_relationships()
 
     # -------------------------------------------------------------------------------
     # Process Schemas
@@ -413,235 +400,267 @@ class FileGDB:
     def process_schemas(self):
         print("\nProcessing schemas ...")
 
-        # create extension postgis
-        str_create_extension = "CREATE EXTENSION IF NOT EXISTS postgis;\n"
-        self.write_it(self.f_create_schemas, str_create_extension)
-
-        # create schemas
+        # create schemas (and extension postgis)
         for schema in self.schemas:
-            if schema == 'public':
-                continue
-
-            str_drop_schema = 'DROP SCHEMA IF EXISTS \"{0}\" CASCADE;\n'.format(schema)
-            str_create_schema = 'CREATE SCHEMA \"{0}\";\n'.format(schema)
-            self.write_it(self.f_create_schemas, str_drop_schema)
-            self.write_it(self.f_create_schemas, str_create_schema)
+            self.ddl.add_schema(schema)
 
         # split feature classes within feature datasets to schemas
-        self.write_it(self.f_split_schemas, "\n")
         print(" FeatureDatasets")
         for schema, datasets in self.feature_datasets.items():
-            if schema == 'public':
+            if schema == self.default_schema:
                 continue
 
             for fds in datasets:
-                fc_list = arcpy.ListFeatureClasses("*", "", fds)
-                fc_list.sort()
+                fc_list = self.catalog.list_feature_classes(fds)
                 for fc in fc_list:
                     self.split_schemas(fc, schema)
 
         # split feature classes outside of feature datasets to schemas
-        self.write_it(self.f_split_schemas, "\n")
         print(" FeatureClasses")
         for schema, fcs in self.feature_classes.items():
-            if schema == 'public':
+            if schema == self.default_schema:
                 continue
 
             for fc in fcs:
-                if arcpy.Exists(fc):
+                if self.catalog.exists(fc):
                     self.split_schemas(fc, schema)
 
         # split tables to schemas
-        self.write_it(self.f_split_schemas, "\n")
         print(" Tables")
         for schema, tables in self.tables.items():
-            if schema == 'public':
+            if schema == self.default_schema:
                 continue
 
             for table in tables:
-                if arcpy.Exists(table):
+                if self.catalog.exists(table):
                     self.split_schemas(table, schema)
 
     # -------------------------------------------------------------------------------
-    # Process Views
-    # Prepare Views with joins
-    # 
-    def _generate_view_for_layer(self, fc, schema="public"):
-        items = []
-        fields_to_be_replaced = []
-        items.append('CREATE TABLE final_data.{0} as (SELECT'.format(fc))
-        letter_assignment = bytes('aa', 'utf-8')
-        letter_assignment_d = None
-        letter_assignment_s = None
-        items.append('\n'.join(self._get_layer_fields(fc, letter_assignment)))
-        items.append('FROM "{}"."{}" {}'.format(schema, fc, letter_assignment.decode('utf-8')))
-
-        # Domains
-        subtypes = arcpy.da.ListSubtypes(fc)
-        created_table = []
-        for stcode, v1 in subtypes.items():
-            for k2, v2 in v1.items():
-                if k2 == 'FieldValues':
-                    for dmfield, v3 in v2.items():
-                        if v3[1] is not None:
-                            dmname = slugify(
-                            v3[1].name, separator='_', lowercase=False)
-                            dmtable = dmname + '_lut'
-                            if dmtable not in created_table:
-                                if letter_assignment[0] >= 122:
-                                    letter_assignment = bytes([letter_assignment[0], letter_assignment[1] + 1])
-                                else:
-                                    letter_assignment = bytes([letter_assignment[0] + 1, letter_assignment[1]])
-                                items.append('LEFT OUTER JOIN \n\tlookup_tables."{}" {} on aa."{}" = {}."Code"'.format(
-                                    dmtable, letter_assignment.decode('utf-8'), dmfield, letter_assignment.decode('utf-8')
-                                ))
-                                fields_to_be_replaced.append(
-                                    {'from': 'aa."{}"'.format(dmfield), 
-                                    'to': '{}."Description" as "{}"'.format(letter_assignment.decode('utf-8'), dmfield)})
-                                created_table.append(dmtable)
-        
-        # Subtypes
-        if subtypes: 
-            subtype_fields = {key: value['SubtypeField']
-                            for key, value in subtypes.items()}
-            subtype_values = {key: value['Name']
-                            for key, value in subtypes.items()}
-            key, field = list(subtype_fields.items())[0]
-            if len(field) > 0:
-                # find subtype field type
-                field_type = None
-                for f in arcpy.ListFields(fc):
-                    if f.name == field:
-                        field_type = f.type
-
-                # convert field to upper case and try again if not found
-                if field_type == None:
-                    field = field.upper()
-                    for f in arcpy.ListFields(fc):
-                        if f.name.upper() == field:
-                            field_type = f.type
-                subtypes_table = "{0}_{1}_lut".format(fc, field)
-                if letter_assignment[0] >= 122:
-                    letter_assignment = bytes([letter_assignment[0], letter_assignment[1] + 1])
-                else:
-                    letter_assignment = bytes([letter_assignment[0] + 1, letter_assignment[1]])
-                items.append('LEFT OUTER JOIN \n\tlookup_tables."{}" {} on aa."{}" = {}."{}"'.format(
-                    subtypes_table, letter_assignment.decode('utf-8'), field, letter_assignment.decode('utf-8'), field
-                ))
-                fields_to_be_replaced.append({'from': 'aa."{}"'.format(field), 'to': '{}."Description" as "{}"'.format(letter_assignment.decode('utf-8'), field)})
-        
-        result = '\n'.join(items)
-        for field in fields_to_be_replaced:
-            _field_from = '\t{},'.format(field['from'])
-            _field_to = '\t{},'.format(field['to'])
-
-            result = result.replace(_field_from, _field_to, 1)
-        
-        result = "{});\n\n".format(result)
-        result = "{0};\n".format(result, fc)
-        result = "{0}CREATE SEQUENCE final_data.{1}_ogc_fid_seq INCREMENT 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1;\n".format(result, fc)
-        result = '{0}SELECT setval(''\'final_data.{1}_ogc_fid_seq''\', coalesce(max(id), 1)) from  final_data.{1};\n'.format(result, fc)
-        result = '{0}ALTER TABLE final_data.{1} RENAME id TO ogc_fid;\n'.format(result, fc)
-        result = '{0}ALTER TABLE final_data.{1} ALTER COLUMN ogc_fid SET DEFAULT nextval(''\'final_data.{1}_ogc_fid_seq''\'::regclass);\n'.format(result, fc)
-        result = '{0}ALTER TABLE final_data.{1} ADD PRIMARY KEY (ogc_fid);\n'.format(result, fc)
-        result = "{0}CREATE INDEX {1}_geom_geom_idx ON final_data.{1} USING gist (geom) TABLESPACE pg_default;\n".format(result, fc)
-
-        self.write_it(self.f_create_views, "{}\n\n".format(result))
-
-    def _get_layer_fields(self, layer, letter_assignment):
-        fields = []
-        subtypes = arcpy.da.ListSubtypes(layer)
-        for stcode, v1 in subtypes.items():
-            for k2, v2 in v1.items():
-                if k2 == 'FieldValues':
-                    for dmfield, v3 in v2.items():
-                        if dmfield == 'OBJECTID':
-                            fields.append('\t{}."{}",'.format(letter_assignment.decode('utf-8'), 'id'))
-                            fields.append('\t{}."{}",'.format(letter_assignment.decode('utf-8'), 'geom'))
-                        elif dmfield.lower() == 'shape':
-                            continue
-                        else:
-                            fields.append('\t{}."{}",'.format(letter_assignment.decode('utf-8'), dmfield))
-            break
-        fields[-1] = fields[-1].replace(',', '')
-        return fields
-        
-    def process_views(self):
-        # get featureclasses outside of datasets
-        self.write_it(self.f_create_views, "{}".format('CREATE SCHEMA IF NOT EXISTS final_data;\n\n'))
-
-        for layer in arcpy.ListFeatureClasses("*"):
-            self._generate_view_for_layer(layer, schema='public')
-
-        # get fetatureclasses within datasets
-        fds_list = arcpy.ListDatasets("*", "Feature")
-        for fds in fds_list:
-            for layer in arcpy.ListFeatureClasses("*", "", fds):
-                self._generate_view_for_layer(layer, schema=fds)
+    # Process Partitions
+    # Layers of the yaml Partitions mapping are created as partitioned tables
+    #   range: field, bounds (a partition between consecutive bounds)
+    #   list: field, values (default: the subtype codes of the subtype field)
+    #   hash: field, partitions
+    #   grid: cell size in t_srs units, partitions (grid cells hashed to partitions)
+    # Values outside of the range and list partitions go to a default partition
+    #
+    def process_partitions(self):
+        print("\nProcessing partitions ...")
+
+        for layer, rule in self.partitions.items():
+            rule = dict(rule or {})
+            method = next((m for m in PARTITION_METHODS if m in rule), None)
+            if not self.catalog.exists(layer) or method is None:
+                print(" {} has no partition rule or does not exist, skipped".format(layer))
+                continue
+
+            if method == 'grid':
+                if self.catalog.get_layer(layer).kind != 'FeatureClass':
+                    print(" {} has no geometry, skipped".format(layer))
+                    continue
+                self.ddl.add_partition(layer, method, 'geom', rule['grid'], int(rule.get('partitions', 8)))
+                print(" {0} (grid {1}, {2} partitions)".format(layer, rule['grid'], rule.get('partitions', 8)))
+                continue
+
+            field, field_type = self.find_field(layer, rule[method])
+            if field_type is None:
+                print(" {0}: field {1} not found, skipped".format(layer, rule[method]))
+                continue
+            # the OBJECTID is loaded as the id column
+            column = 'id' if field_type == 'OID' else field
+
+            values = None
+            if method == 'range':
+                values = list(rule.get('bounds') or [])
+            elif method == 'list':
+                values = list(rule.get('values') or self.catalog.subtypes(layer).keys())
+
+            if values is not None and len(values) < (2 if method == 'range' else 1):
+                print(" {} has no partition values, skipped".format(layer))
+                continue
+
+            filters = self.partition_filters(method, field, field_type, values)
+            self.ddl.add_partition(layer, method, column, values, int(rule.get('partitions', 8)), filters)
+            print(" {0} ({1} on {2}, {3} partitions)".format(
+                layer, method, field, len(self.ddl.partitions[layer].children)))
 
     # -------------------------------------------------------------------------------
-    # Compose and write sql to alter the schema of a table
+    # Where clauses reading the rows of each range or list partition from the file
+    # geodatabase, the last one reads the rows of the default partition
     #
-    def split_schemas(self, table, schema):
-        str_split_schemas = "ALTER TABLE \"{0}\" SET SCHEMA \"{1}\";\n".format(
-            table, schema)
-        self.write_it(self.f_split_schemas, str_split_schemas)
+    def partition_filters(self, method, field, field_type, values):
+        literals = [self.where_literal(value, field_type) for value in values or []]
+        if method == 'range':
+            filters = ['"{0}" >= {1} AND "{0}" < {2}'.format(field, literals[n], literals[n + 1])
+                       for n in range(len(literals) - 1)]
+            filters.append('"{0}" IS NULL OR "{0}" < {1} OR "{0}" >= {2}'.format(field, literals[0], literals[-1]))
+        elif method == 'list':
+            filters = ['"{0}" = {1}'.format(field, value) for value in literals]
+            filters.append('"{0}" IS NULL OR "{0}" NOT IN ({1})'.format(field, ', '.join(literals)))
+        else:
+            filters = []
+
+        return filters
+
+    # literal of a value in the where clause of the file geodatabase
+    def where_literal(self, value, field_type):
+        if field_type == 'Date':
+            return "date '{}'".format(value)
+        if field_type in ('String', 'GUID', 'GlobalID'):
+            return "'{}'".format(str(value).replace("'", "''"))
+
+        return str(value)
 
     # -------------------------------------------------------------------------------
-    # Create indexes
+    # Process Layout
+    # Cluster the feature classes in spatial order (hilbert or gist) and add brin indexes
+    # on the geometry of the feature classes with at least brin_rows rows
     #
-    def create_index(self, table, field):
-        idx_name = "{0}_{1}_idx".format(table, field)
+    def process_layout(self, cluster=None, brin_rows=None):
+        print("\nProcessing layout ...")
 
-        if idx_name not in self.indexes:
-            self.indexes.append(idx_name)
-            str_index = "CREATE UNIQUE INDEX \"{0}\" ON \"{1}\" (\"{2}\"); \n".format(
-                idx_name, table, field)
-            self.write_it(self.f_create_indexes, str_index)
+        for layer, rows in self.list_layers():
+            if self.catalog.get_layer(layer).kind != 'FeatureClass':
+                continue
+
+            if cluster:
+                self.ddl.add_cluster(layer, 'geom', cluster)
+
+            if brin_rows and rows >= brin_rows:
+                self.ddl.add_index(layer, 'geom', unique=False, method='brin')
 
     # -------------------------------------------------------------------------------
-    # Create foreign key constraints
+    # Process Views
+    # Prepare the final_data layers, the layers joined with their domain and subtype
+    # lookup tables (descriptions instead of codes), as views, materialized views or tables
     #
-    def create_foreign_key_constraint(self, table_details, fkey, table_master, pkey):
-        fkey_name = "{0}_{1}".format(table_details[0:30], table_master[0:30])
-
-        if fkey_name not in self.constraints:
-            self.constraints.append(fkey_name)
-            str_constraint = 'ALTER TABLE "{0}" ADD CONSTRAINT "{1}" FOREIGN KEY ("{2}") REFERENCES "{3}" ("{4}") NOT VALID; \n'
-            str_constraint = str_constraint.format(table_details, fkey_name, fkey, table_master, pkey)
-            self.write_it(self.f_create_constraints, str_constraint)
+    def process_views(self, mode='table'):
+        print("\nProcessing final data ({}) ...".format(mode))
+
+        self.ddl.final_data_mode = mode
+        for layer in self.catalog.all_layers():
+            self.ddl.add_final_data(layer, self.final_data_statements(layer, mode))
+
+    def final_data_statements(self, layer, mode):
+        target = '"{0}"."{1}"'.format(self.ddl.final_data_schema, layer)
+        subtype_field, subtype_table, domains = self.get_layer_lookups(layer)
+
+        columns = []
+        joins = []
+        aliases = {}
+        has_geometry = False
+
+        # one join (alias t1 ... tn) per lookup table and field
+        def join(table, field, code):
+            if (table, field) not in aliases:
+                alias = 't{}'.format(len(aliases) + 1)
+                aliases[(table, field)] = alias
+                joins.append('LEFT OUTER JOIN "{4}"."{0}" {1} ON t0."{2}" = {1}."{3}"'.format(
+                    table, alias, field, code, self.lookup_schema))
+
+            return aliases[(table, field)]
+
+        for field in self.catalog.fields(layer):
+            if field.type == 'OID':
+                columns.insert(0, 't0."id" AS "ogc_fid"')
+            elif field.type == 'Geometry':
+                has_geometry = True
+                columns.append('t0."geom"')
+            elif field.name == subtype_field and subtype_table:
+                alias = join(subtype_table, field.name, field.name)
+                columns.append('{0}."Description" AS "{1}"'.format(alias, field.name))
+            elif field.name in domains:
+                tables = domains[field.name]
+                if len(set(tables.values())) == 1 or not subtype_field:
+                    alias = join(list(tables.values())[0], field.name, 'Code')
+                    columns.append('{0}."Description" AS "{1}"'.format(alias, field.name))
+                else:
+                    # the domain of the field depends on the subtype
+                    cases = ' '.join('WHEN {0} THEN {1}."Description"'.format(code, join(table, field.name, 'Code'))
+                                     for code, table in sorted(tables.items()))
+                    columns.append('CASE t0."{0}" {1} ELSE t0."{2}"::varchar END AS "{2}"'.format(
+                        subtype_field, cases, field.name))
+            else:
+                columns.append('t0."{}"'.format(field.name))
+
+        select = 'SELECT {0}\n  FROM "{1}"."{2}" t0'.format(
+            ',\n       '.join(columns), self.table_schemas.get(layer, self.default_schema), layer)
+        if joins:
+            select = '{0}\n  {1}'.format(select, '\n  '.join(joins))
+
+        if mode == 'view':
+            return ['CREATE VIEW {0} AS\n{1}'.format(target, select)]
+
+        if mode == 'matview':
+            # a unique index is required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+            statements = [
+                'CREATE MATERIALIZED VIEW {0} AS\n{1}'.format(target, select),
+                'CREATE UNIQUE INDEX "{0}" ON {1} ("ogc_fid")'.format(
+                    self.ddl.make_name('{}_ogc_fid_idx'.format(layer), ('final_data', layer, 'ogc_fid')), target)
+            ]
+        else:
+            sequence = '"{0}"."{1}"'.format(self.ddl.final_data_schema, self.ddl.make_name(
+                '{}_ogc_fid_seq'.format(layer), ('final_data', layer, 'seq')))
+            statements = [
+                'CREATE TABLE {0} AS\n{1}'.format(target, select),
+                'CREATE SEQUENCE {0} INCREMENT 1 MINVALUE 1 MAXVALUE 2147483647 CACHE 1 OWNED BY {1}."ogc_fid"'.format(
+                    sequence, target),
+                "SELECT setval('{0}', coalesce(max(\"ogc_fid\"), 1)) FROM {1}".format(sequence, target),
+                "ALTER TABLE {0} ALTER COLUMN \"ogc_fid\" SET DEFAULT nextval('{1}'::regclass)".format(
+                    target, sequence),
+                'ALTER TABLE {0} ADD CONSTRAINT "{1}" PRIMARY KEY ("ogc_fid")'.format(
+                    target, self.ddl.make_name('{}_pkey'.format(layer), ('final_data', layer, 'pkey')))
+            ]
+
+        if has_geometry:
+            statements.append('CREATE INDEX "{0}" ON {1} USING gist ("geom")'.format(
+                self.ddl.make_name('{}_geom_geom_idx'.format(layer), ('final_data', layer, 'geom')), target))
+
+        return statements
 
     # -------------------------------------------------------------------------------
-    # Create feature class view with relation
+    # Subtype field, subtypes table and coded value domain tables per field and subtype
     #
-    def create_view_feature_class(self, table_details, fkey, table_master, pkey):
-        view_name = "{0}_{1}_{2}_view".format(
-            table_details, fkey, table_master)
+    def get_layer_lookups(self, layer):
+        subtype_field = None
+        subtype_table = None
+        domains = {}
 
-        if view_name not in self.views:
-            self.views.append(view_name)
-            str_view = 'ALTER TABLE "{0}" ADD CONSTRAINT "{1}" FOREIGN KEY ("{2}") REFERENCES "{3}" ("{4}") NOT VALID; \n'
-            str_view = str_view.format(
-                table_details, view_name, fkey, table_master, pkey)
-            self.write_it(self.f_create_view, str_view)
+        for code, subtype in self.catalog.subtypes(layer).items():
+            if subtype.get('SubtypeField'):
+                subtype_field, field_type = self.find_field(layer, subtype['SubtypeField'])
+                subtype_table = slugify("{0}_{1}_sub".format(layer, subtype_field), separator='_', lowercase=False)
+                if subtype_table not in self.lookup_tables:
+                    subtype_table = None
+
+            for field, (default, domain) in subtype.get('FieldValues', {}).items():
+                if domain is None:
+                    continue
+
+                table = slugify(domain, separator='_', lowercase=False) + '_lut'
+                if table in self.lookup_tables:
+                    domains.setdefault(field, {})[code] = table
+
+        return subtype_field, subtype_table, domains
 
     # -------------------------------------------------------------------------------
-    # Write headers to sql files
+    # Move table to schema
     #
-    def write_headers(self):
-        str_message = "SET client_min_messages TO error;\n"
+    def split_schemas(self, table, schema):
+        self.table_schemas[table] = schema
+        self.ddl.add_move(table, schema)
 
-        self.write_it(self.f_create_schemas, str_message)
-        self.write_it(self.f_create_indexes, str_message)
-        self.write_it(self.f_create_constraints, str_message)
-        self.write_it(self.f_split_schemas, str_message)
-        self.write_it(self.f_fix_data_errors, str_message)
+    # -------------------------------------------------------------------------------
+    # Create indexes
+    #
+    def create_index(self, table, field, schema=None):
+        self.ddl.add_index(table, field, schema)
 
     # -------------------------------------------------------------------------------
-    # Write string to given open file
+    # Create foreign key constraints
     #
-    def write_it(self, out_file, string):
-        out_file.write(string)
+    def create_foreign_key_constraint(self, table_details, fkey, table_master, pkey, master_schema=None):
+        self.ddl.add_foreign_key(table_details, fkey, table_master, pkey, master_schema)
 
     def create_yaml(self):
         # initialize dictionaries
@@ -685,19 +704,25 @@ class FileGDB:
             yaml.dump(tablesdict, outfile)
 
     def get_feature_datasets(self):
-        fdslist = arcpy.ListDatasets()
+        fdslist = self.catalog.list_datasets()
         return fdslist
 
     def get_feature_classes(self, fds):
-        fclist = arcpy.ListFeatureClasses("*", "", fds)
+        fclist = self.catalog.list_feature_classes(fds)
         return fclist
 
     def get_tables(self):
-        tableslist = arcpy.ListTables("*")
+        tableslist = self.catalog.list_tables()
         return tableslist
 
-    def cleanup(self):
-        print("Cleanup temporary lookup tables...")
-        lutslist = arcpy.ListTables("*_lut")
-        for lut in lutslist:
-            arcpy.Delete_management(lut)
+    # -------------------------------------------------------------------------------
+    # List tables and feature classes with their row counts, largest first
+    #
+    def list_layers(self):
+        layers = []
+        for layer in self.catalog.all_layers():
+            layers.append((layer, self.catalog.row_count(layer)))
+
+        layers.sort(key=lambda item: (-item[1], item[0]))
+        return layers
+
@@ -0,0 +1,287 @@
+##
+# gdb_items.py
+#
+# Description: Catalog backend without arcpy, the datasets, layers, domains, subtypes and
+#              relationship classes are parsed from the XML definitions of the GDB_Items
+#              system table, read with the OpenFileGDB driver of GDAL (GDAL 3.6 or later)
+#              Runs on any platform, no ArcGIS licence required
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import xml.etree.ElementTree as ET
+
+from fgdb2postgis.catalog import Catalog, Domain, Field, Layer, Relationship
+
+try:
+    from osgeo import gdal, ogr
+except ImportError:
+    gdal = ogr = None
+
+# root element of the item definitions
+ITEM_KINDS = {
+    'DEFeatureDataset': 'FeatureDataset',
+    'DEFeatureClassInfo': 'FeatureClass',
+    'DETableInfo': 'Table',
+    'DERelationshipClassInfo': 'RelationshipClass',
+    'GPCodedValueDomain2': 'CodedValue',
+    'GPRangeDomain2': 'Range'
+}
+
+# field type of domains, as reported by arcpy
+DOMAIN_TYPES = {
+    'esriFieldTypeSmallInteger': 'Short',
+    'esriFieldTypeInteger': 'Long',
+    'esriFieldTypeBigInteger': 'BigInteger',
+    'esriFieldTypeSingle': 'Float',
+    'esriFieldTypeDouble': 'Double',
+    'esriFieldTypeString': 'Text',
+    'esriFieldTypeDate': 'Date'
+}
+
+# field type of the OGR layer fields, when the definition has no field array
+OGR_FIELD_TYPES = {
+    'Integer': 'Integer',
+    'Integer(Int16)': 'SmallInteger',
+    'Integer64': 'BigInteger',
+    'Real': 'Double',
+    'Real(Float32)': 'Single',
+    'String': 'String',
+    'String(UUID)': 'GUID',
+    'Date': 'DateOnly',
+    'Time': 'TimeOnly',
+    'DateTime': 'Date',
+    'Binary': 'Blob'
+}
+
+
+# -------------------------------------------------------------------------------
+# XML helpers, the namespaces of the definitions are ignored
+#
+def local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def child(element, name):
+    if element is None:
+        return None
+
+    return next((item for item in element if local_name(item.tag) == name), None)
+
+
+def children(element, name):
+    if element is None:
+        return []
+
+    return [item for item in element if local_name(item.tag) == name]
+
+
+def text(element, name, default=None):
+    item = child(element, name)
+    if item is None or item.text is None:
+        return default
+
+    return item.text.strip()
+
+
+def names(element, name):
+    return [item.text.strip() for item in children(child(element, name), 'Name') if item.text]
+
+
+# a class name of a relationship may be qualified (e.g. \Dataset\parcels)
+def base_name(name):
+    return name.replace('/', '\\').rsplit('\\', 1)[-1]
+
+
+# -------------------------------------------------------------------------------
+# Kind of item of a definition, None for items not kept in the catalog
+#
+def item_kind(definition):
+    root = ET.fromstring(definition)
+    return ITEM_KINDS.get(local_name(root.tag)), root
+
+
+def domain_value(value, field_type):
+    if value is None:
+        return None
+    if field_type in ('Short', 'Long', 'BigInteger'):
+        return int(value)
+    if field_type in ('Float', 'Double'):
+        return float(value)
+
+    return value
+
+
+# -------------------------------------------------------------------------------
+# Parse a domain definition (GPCodedValueDomain2, GPRangeDomain2)
+#
+def parse_domain(root):
+    kind = ITEM_KINDS[local_name(root.tag)]
+    field_type = DOMAIN_TYPES.get(text(root, 'FieldType'), 'Text')
+
+    coded_values = None
+    if kind == 'CodedValue':
+        coded_values = {}
+        for coded_value in children(child(root, 'CodedValues'), 'CodedValue'):
+            coded_values[domain_value(text(coded_value, 'Code'), field_type)] = text(coded_value, 'Name', '')
+
+    return Domain(text(root, 'DomainName'), kind, field_type, coded_values)
+
+
+# -------------------------------------------------------------------------------
+# Parse a table or feature class definition (DETableInfo, DEFeatureClassInfo)
+# The subtypes are returned in the form of arcpy.da.ListSubtypes: {code: {Name, Default,
+# SubtypeField, FieldValues: {field: (default, domain name)}}}, code 0 without subtypes
+#
+def parse_layer(root, dataset=''):
+    kind = ITEM_KINDS[local_name(root.tag)]
+
+    fields = []
+    field_values = {}
+    for field in children(child(child(root, 'Fields'), 'FieldArray'), 'Field'):
+        name = text(field, 'Name')
+        field_type = text(field, 'Type', '').replace('esriFieldType', '')
+        fields.append(Field(name, field_type, int(text(field, 'Length', 0))))
+        field_values[name] = (text(field, 'DefaultValue'), text(child(field, 'Domain'), 'DomainName'))
+
+    # domains assigned to the fields (when the field array does not carry them)
+    for info in children(child(root, 'GPFieldInfoExs'), 'GPFieldInfoEx'):
+        name = text(info, 'Name')
+        default, domain = field_values.get(name, (None, None))
+        field_values[name] = (text(info, 'DefaultValue', default), text(info, 'DomainName', domain))
+
+    subtype_field = text(root, 'SubtypeFieldName', '')
+    default_code = text(root, 'DefaultSubtypeCode')
+    subtypes = {}
+    for subtype in children(child(root, 'Subtypes'), 'Subtype'):
+        code = int(text(subtype, 'SubtypeCode'))
+        values = dict(field_values)
+        for info in children(child(subtype, 'FieldInfos'), 'SubtypeFieldInfo'):
+            values[text(info, 'FieldName')] = (text(info, 'DefaultValue'), text(info, 'DomainName'))
+
+        subtypes[code] = {'Name': text(subtype, 'SubtypeName', ''),
+                          'Default': default_code is not None and code == int(default_code),
+                          'SubtypeField': subtype_field, 'FieldValues': values}
+
+    if not subtype_field or not subtypes:
+        subtypes = {0: {'Name': '', 'Default': True, 'SubtypeField': '', 'FieldValues': field_values}}
+
+    return Layer(text(root, 'Name'), dataset, kind, fields, subtypes, names(root, 'RelationshipClassNames'))
+
+
+# -------------------------------------------------------------------------------
+# Parse a relationship class definition (DERelationshipClassInfo)
+# The origin keys are (key, role) as reported by arcpy, the primary key first
+#
+def parse_relationship(root):
+    keys = []
+    for key in children(child(root, 'OriginClassKeys'), 'RelationshipClassKey'):
+        keys.append((text(key, 'ObjectKeyName'), text(key, 'KeyRole', '').replace('esriRelKeyRole', '')))
+    keys.sort(key=lambda key: key[1] != 'OriginPrimary')
+
+    return Relationship(
+        text(root, 'Name'),
+        base_name(names(root, 'OriginClassNames')[0]),
+        base_name(names(root, 'DestinationClassNames')[0]),
+        keys,
+        text(root, 'IsAttachmentRelationship', 'false').lower() == 'true')
+
+
+class GdbItemsCatalog(Catalog):
+    def __init__(self, workspace):
+        Catalog.__init__(self, workspace)
+        self.dataset = None
+
+    def open(self):
+        if gdal is None:
+            raise ImportError("GDAL is required for --catalog=gdal (pip install GDAL)")
+
+        if self.dataset is None:
+            gdal.UseExceptions()
+            self.dataset = gdal.OpenEx(self.workspace, gdal.OF_VECTOR,
+                                       allowed_drivers=['OpenFileGDB'], open_options=['LIST_ALL_TABLES=YES'])
+
+        return self.dataset
+
+    # -------------------------------------------------------------------------------
+    # Path and definition of the items of the GDB_Items system table
+    #
+    def read_items(self):
+        items = []
+        for feature in self.open().GetLayerByName('GDB_Items'):
+            definition = feature.GetField('Definition')
+            if definition:
+                items.append((feature.GetField('Path') or '', definition))
+
+        return items
+
+    def read(self):
+        self.load_items(self.read_items())
+
+        # layers without a field array in their definition
+        for name, layer in list(self.layers.items()):
+            if not layer.fields:
+                self.layers[name] = layer._replace(fields=self.layer_fields(name))
+
+    # -------------------------------------------------------------------------------
+    # Fill the catalog from the (path, definition) items
+    # A layer belongs to the feature dataset of its path (\Dataset\layer)
+    #
+    def load_items(self, items):
+        datasets = set()
+        layers = []
+        for item_path, definition in items:
+            kind, root = item_kind(definition)
+            if kind == 'FeatureDataset':
+                datasets.add(text(root, 'Name'))
+            elif kind in ('Table', 'FeatureClass'):
+                parts = item_path.strip('\\').split('\\')
+                layers.append(parse_layer(root, parts[-2] if len(parts) > 1 and kind == 'FeatureClass' else ''))
+            elif kind == 'RelationshipClass':
+                rel = parse_relationship(root)
+                self.relationships[rel.name] = rel
+            elif kind in ('CodedValue', 'Range'):
+                domain = parse_domain(root)
+                self.domains[domain.name] = domain
+
+        self.datasets = sorted(datasets)
+        self.feature_classes = {fds: [] for fds in [''] + self.datasets}
+        for layer in layers:
+            self.layers[layer.name] = layer
+            self.add_name(layer.name)
+            if layer.kind == 'Table':
+                self.tables.append(layer.name)
+            else:
+                self.feature_classes.setdefault(layer.dataset, []).append(layer.name)
+
+        self.tables.sort()
+        for fc_list in self.feature_classes.values():
+            fc_list.sort()
+
+    def layer_fields(self, name):
+        layer = self.open().GetLayerByName(name)
+        fields = [Field(layer.GetFIDColumn() or 'OBJECTID', 'OID', 4)]
+        if layer.GetGeomType() != ogr.wkbNone:
+            fields.append(Field(layer.GetGeometryColumn() or 'SHAPE', 'Geometry', 0))
+
+        definition = layer.GetLayerDefn()
+        for index in range(definition.GetFieldCount()):
+            field = definition.GetFieldDefn(index)
+            field_type = field.GetTypeName()
+            if field.GetSubType() != ogr.OFSTNone:
+                field_type = '{0}({1})'.format(field_type, ogr.GetFieldSubTypeName(field.GetSubType()))
+            fields.append(Field(field.GetName(), OGR_FIELD_TYPES.get(field_type, 'String'), field.GetWidth()))
+
+        return fields
+
+    def count_rows(self, name):
+        return self.open().GetLayerByName(name).GetFeatureCount()
+
+    def read_oid_range(self, name):
+        sql = 'SELECT MIN("{0}"), MAX("{0}") FROM "{1}"'.format(self.oid_field(name), name)
+        result = self.open().ExecuteSQL(sql)
+        try:
+            feature = result.GetNextFeature()
+            return (feature.GetField(0), feature.GetField(1)) if feature else (None, None)
+        finally:
+            self.open().ReleaseResultSet(result)
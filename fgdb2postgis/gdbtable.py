@@ -0,0 +1,705 @@
+##
+# gdbtable.py
+#
+# Description: Read the .gdbtable/.gdbtablx files of a file geodatabase (10.x format) without
+#              GDAL or arcpy. The files are memory mapped, the fixed width columns (integers,
+#              doubles, dates, OBJECTID) are decoded to NumPy arrays a block of rows at a time
+#              and the variable length columns (strings, blobs, geometries) are kept as offsets
+#              and lengths into the mapped file (zero copy slices)
+#              GdbTableSource feeds the COPY loader (--engine=gdbtable) with whole blocks of
+#              encoded rows, only the geometries are converted row by row
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import mmap
+import re
+import struct
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from os import path
+
+import numpy as np
+
+from fgdb2postgis.copy_loader import parse_srid
+
+# field types of the field descriptions, named as by arcpy
+GDB_TYPES = {
+    0: 'SmallInteger',
+    1: 'Integer',
+    2: 'Single',
+    3: 'Double',
+    4: 'String',
+    5: 'Date',
+    6: 'OID',
+    7: 'Geometry',
+    8: 'Blob',
+    9: 'Raster',
+    10: 'GUID',
+    11: 'GlobalID',
+    12: 'XML',
+    13: 'BigInteger',
+    14: 'DateOnly',
+    15: 'TimeOnly',
+    16: 'TimestampOffset'
+}
+
+# stored width and little endian dtype of the fixed width types (None: raw bytes)
+FIXED_TYPES = {
+    'SmallInteger': (2, '<i2'),
+    'Integer': (4, '<i4'),
+    'Single': (4, '<f4'),
+    'Double': (8, '<f8'),
+    'Date': (8, '<f8'),
+    'BigInteger': (8, '<i8'),
+    'DateOnly': (8, '<f8'),
+    'TimeOnly': (8, '<f8'),
+    'TimestampOffset': (10, np.dtype([('days', '<f8'), ('offset', '<i2')])),
+    'GUID': (16, None),
+    'GlobalID': (16, None)
+}
+
+# geometry type of the table header, as reported by arcpy
+SHAPE_TYPES = {1: 'Point', 2: 'Multipoint', 3: 'Polyline', 4: 'Polygon', 9: 'MultiPatch'}
+
+# shape types of the geometry blobs: (kind, has_z, has_m), general types carry z, m flags
+BLOB_TYPES = {
+    1: ('point', False, False), 9: ('point', True, False), 21: ('point', False, True), 11: ('point', True, True),
+    8: ('multipoint', False, False), 20: ('multipoint', True, False), 28: ('multipoint', False, True),
+    18: ('multipoint', True, True),
+    3: ('polyline', False, False), 10: ('polyline', True, False), 23: ('polyline', False, True),
+    13: ('polyline', True, True),
+    5: ('polygon', False, False), 19: ('polygon', True, False), 25: ('polygon', False, True),
+    15: ('polygon', True, True),
+    50: ('polyline', None, None), 51: ('polygon', None, None), 52: ('point', None, None),
+    53: ('multipoint', None, None)
+}
+SHAPE_Z = 0x80000000
+SHAPE_M = 0x40000000
+SHAPE_CURVES = 0x20000000
+
+# days from 1899-12-30 (date values) to 2000-01-01 (PostgreSQL epoch)
+GDB_EPOCH = datetime(1899, 12, 30)
+PG_EPOCH_DAYS = 36526
+MS_PER_DAY = 86400000
+
+BLOCK_ROWS = 16384
+HEX_DIGITS = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+# byte order of the GUID text (the first three groups are little endian)
+GUID_ORDER = [3, 2, 1, 0, 5, 4, 7, 6, 8, 9, 10, 11, 12, 13, 14, 15]
+
+SYSTEM_CATALOG = 'a00000001.gdbtable'
+
+GdbField = namedtuple('GdbField', 'name alias type nullable width')
+GeometryInfo = namedtuple('GeometryInfo', 'xorigin yorigin xyscale morigin mscale zorigin zscale')
+Column = namedtuple('Column', 'field nulls values starts lengths')
+
+
+# -------------------------------------------------------------------------------
+# Variable length integers, one at a position (header) or one per row (vectorized)
+#
+def read_varuint(buffer, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def read_varuints(data, pos):
+    values = np.zeros(len(pos), dtype=np.int64)
+    sizes = np.zeros(len(pos), dtype=np.int64)
+    active = np.arange(len(pos))
+    shift = 0
+    while len(active):
+        byte = data[pos[active] + sizes[active]].astype(np.int64)
+        values[active] |= (byte & 0x7F) << shift
+        sizes[active] += 1
+        active = active[(byte & 0x80) != 0]
+        shift += 7
+
+    return values, sizes
+
+
+# count signed varints from pos (sign in bit 6 of the first byte), returns values and end
+def read_varints(buffer, pos, count):
+    data = np.frombuffer(buffer, dtype=np.uint8, offset=pos)
+    ends = np.flatnonzero(data < 0x80)[:count]
+    if len(ends) < count:
+        raise ValueError("Truncated geometry")
+
+    data = data[:ends[-1] + 1].astype(np.int64)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    index = np.repeat(np.arange(count), np.diff(np.concatenate((starts, [len(data)]))))
+    rank = np.arange(len(data)) - starts[index]
+
+    parts = np.where(rank == 0, data & 0x3F, (data & 0x7F) << np.maximum(rank * 7 - 1, 0))
+    values = np.add.reduceat(parts, starts)
+    values[(data[starts] & 0x40) != 0] *= -1
+
+    return values, pos + len(data)
+
+
+# flat index of the ranges [start, start + length)
+def ranges(starts, lengths):
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+
+
+def gather(data, pos, width):
+    return data[pos[:, None] + np.arange(width)]
+
+
+# -------------------------------------------------------------------------------
+# Geometry blob to (ISO) WKB, None for empty geometries
+# Polygon rings are grouped in order: a clockwise ring starts a polygon, the
+# counter-clockwise rings after it are its holes
+#
+def decode_shape(blob, info):
+    shape_type, pos = read_varuint(blob, 0)
+    kind, has_z, has_m = BLOB_TYPES.get(shape_type & 0xFF, (None, None, None))
+    if kind is None or shape_type & SHAPE_CURVES:
+        raise ValueError("Unsupported geometry type {}".format(shape_type))
+    if has_z is None:
+        has_z, has_m = bool(shape_type & SHAPE_Z), bool(shape_type & SHAPE_M)
+
+    dims = 2 + has_z + has_m
+    iso = 1000 * (has_z + 2 * has_m)
+
+    if kind == 'point':
+        scales = [(info.xorigin, info.xyscale), (info.yorigin, info.xyscale)]
+        if has_z:
+            scales.append((info.zorigin, info.zscale))
+        if has_m:
+            scales.append((info.morigin, info.mscale))
+
+        values = []
+        for origin, scale in scales:
+            value, pos = read_varuint(blob, pos)
+            values.append((value - 1) / scale + origin if value else np.nan)
+        if np.isnan(values[0]):
+            return None
+        return struct.pack('<BI{}d'.format(dims), 1, 1 + iso, *values)
+
+    points, pos = read_varuint(blob, pos)
+    if not points:
+        return None
+
+    parts = 1
+    if kind != 'multipoint':
+        parts, pos = read_varuint(blob, pos)
+
+    # bounding box
+    for corner in range(4):
+        bound, pos = read_varuint(blob, pos)
+
+    counts = []
+    for part in range(parts - 1):
+        count, pos = read_varuint(blob, pos)
+        counts.append(count)
+    counts.append(points - sum(counts))
+
+    xy, pos = read_varints(blob, pos, 2 * points)
+    xy = np.cumsum(xy.reshape(points, 2), axis=0) / info.xyscale + (info.xorigin, info.yorigin)
+    coords = [xy]
+    if has_z:
+        z, pos = read_varints(blob, pos, points)
+        coords.append((np.cumsum(z) / info.zscale + info.zorigin)[:, None])
+    if has_m:
+        if blob[pos] == 0x42:
+            coords.append(np.full((points, 1), np.nan))
+        else:
+            m, pos = read_varints(blob, pos, points)
+            coords.append((np.cumsum(m) / info.mscale + info.morigin)[:, None])
+    coords = np.ascontiguousarray(np.hstack(coords), dtype='<f8')
+
+    if kind == 'multipoint':
+        point = struct.pack('<BI', 1, 1 + iso)
+        return struct.pack('<BII', 1, 4 + iso, points) + b''.join(point + row.tobytes() for row in coords)
+
+    splits = np.cumsum(counts)[:-1]
+    lines = np.split(coords, splits)
+    if kind == 'polyline':
+        if parts == 1:
+            return struct.pack('<BII', 1, 2 + iso, points) + coords.tobytes()
+        return struct.pack('<BII', 1, 5 + iso, parts) + b''.join(
+            struct.pack('<BII', 1, 2 + iso, len(line)) + line.tobytes() for line in lines)
+
+    polygons = []
+    for ring in lines:
+        x, y = ring[:, 0], ring[:, 1]
+        clockwise = np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]) < 0
+        if clockwise or not polygons:
+            polygons.append([])
+        polygons[-1].append(struct.pack('<I', len(ring)) + ring.tobytes())
+
+    wkbs = [struct.pack('<BII', 1, 3 + iso, len(rings)) + b''.join(rings) for rings in polygons]
+    if len(wkbs) == 1:
+        return wkbs[0]
+
+    return struct.pack('<BII', 1, 6 + iso, len(wkbs)) + b''.join(wkbs)
+
+
+# -------------------------------------------------------------------------------
+# A .gdbtable file and its .gdbtablx row offsets, both memory mapped
+#
+class GdbTable:
+    def __init__(self, table_path):
+        self.path = table_path
+        self.files = []
+        self.buffer = self.map(table_path)
+        self.data = np.frombuffer(self.buffer, dtype=np.uint8)
+        self.tablx = self.map(path.splitext(table_path)[0] + '.gdbtablx')
+        self.geometry = None
+        self.geometry_info = None
+        self.read_header()
+        self.read_tablx_header()
+
+    def map(self, file_path):
+        with open(file_path, 'rb') as f:
+            self.files.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        return self.files[-1]
+
+    def close(self):
+        self.data = self.tablx_data = None
+        for mapped in self.files:
+            try:
+                mapped.close()
+            except BufferError:
+                # slices handed out still reference the file, it is unmapped when they are released
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # -------------------------------------------------------------------------------
+    # Header and field descriptions
+    #
+    def read_header(self):
+        magic, self.valid_rows = struct.unpack_from('<ii', self.buffer, 0)
+        fields_offset = struct.unpack_from('<q', self.buffer, 32)[0]
+        header_size, version, flags, field_count = struct.unpack_from('<iiih', self.buffer, fields_offset)
+        if magic != 3 or version != 4:
+            raise ValueError("{}: unsupported .gdbtable version (10.x format only)".format(self.path))
+
+        shape_type = SHAPE_TYPES.get(flags & 0xFF)
+        if shape_type:
+            self.geometry = (shape_type, bool(flags & SHAPE_Z), bool(flags & SHAPE_M))
+
+        pos = fields_offset + 14
+        self.fields = []
+        for index in range(field_count):
+            name, pos = self.read_utf16(pos)
+            alias, pos = self.read_utf16(pos)
+            field_type = GDB_TYPES.get(self.buffer[pos], 'Unknown')
+            pos += 1
+
+            if field_type == 'Geometry':
+                flags = self.buffer[pos + 1]
+                pos = self.read_geometry_info(pos + 2)
+                width = 0
+            elif field_type == 'String':
+                width, flags = struct.unpack_from('<iB', self.buffer, pos)
+                default_size, pos = read_varuint(self.buffer, pos + 5)
+                pos += default_size
+            elif field_type in ('OID', 'Blob', 'GUID', 'GlobalID', 'XML'):
+                width, flags = self.buffer[pos], self.buffer[pos + 1]
+                pos += 2
+            elif field_type in FIXED_TYPES:
+                width, flags, default_size = self.buffer[pos], self.buffer[pos + 1], self.buffer[pos + 2]
+                pos += 3 + default_size
+            else:
+                raise ValueError("{0}: unsupported field type of {1}".format(self.path, name))
+
+            self.fields.append(GdbField(name, alias, field_type, bool(flags & 1), width))
+
+        self.nullable = len([field for field in self.fields if field.nullable])
+
+    def read_utf16(self, pos):
+        size = self.buffer[pos] * 2
+        return self.buffer[pos + 1:pos + 1 + size].decode('utf-16-le'), pos + 1 + size
+
+    def read_geometry_info(self, pos):
+        size = struct.unpack_from('<h', self.buffer, pos)[0]
+        pos += 2 + size
+
+        geometry_flags = self.buffer[pos]
+        has_m, has_z = bool(geometry_flags & 2), bool(geometry_flags & 4)
+        pos += 1
+
+        names = ['xorigin', 'yorigin', 'xyscale'] + (['morigin', 'mscale'] if has_m else []) + \
+                (['zorigin', 'zscale'] if has_z else [])
+        values = dict(zip(names, struct.unpack_from('<{}d'.format(len(names)), self.buffer, pos)))
+        pos += 8 * len(names)
+        self.geometry_info = GeometryInfo(values['xorigin'], values['yorigin'], values['xyscale'],
+                                          values.get('morigin', 0.0), values.get('mscale', 1.0),
+                                          values.get('zorigin', 0.0), values.get('zscale', 1.0))
+
+        # tolerances and extent, the optional z and m extents are detected by the grid sizes after them
+        pos += 8 * (1 + has_m + has_z) + 32
+        for extra in (0, 16, 32):
+            if self.buffer[pos + extra] == 0 and 1 <= struct.unpack_from('<i', self.buffer, pos + extra + 1)[0] <= 3:
+                pos += extra
+                break
+
+        grids = struct.unpack_from('<i', self.buffer, pos + 1)[0]
+        return pos + 5 + 8 * grids
+
+    # -------------------------------------------------------------------------------
+    # Row offsets: one entry of offset_size bytes per OBJECTID, 0 for deleted rows
+    # Sparse files only store the blocks of 1024 rows flagged in a trailing bitmap
+    #
+    def read_tablx_header(self):
+        magic, blocks, self.total_rows, self.offset_size = struct.unpack_from('<4i', self.tablx, 0)
+        self.tablx_data = np.frombuffer(self.tablx, dtype=np.uint8)
+        self.block_slots = None
+
+        if blocks != -(-self.total_rows // 1024):
+            trailer = 16 + blocks * 1024 * self.offset_size
+            words, total_blocks = struct.unpack_from('<ii', self.tablx, trailer)
+            bitmap = np.frombuffer(self.tablx, dtype=np.uint8, count=words * 4, offset=trailer + 16)
+            present = np.unpackbits(bitmap, bitorder='little')[:total_blocks].astype(bool)
+            self.block_slots = np.full(total_blocks, -1, dtype=np.int64)
+            self.block_slots[present] = np.arange(present.sum())
+
+    def row_offsets(self, start=None, stop=None):
+        start = max(start or 1, 1)
+        stop = min(stop or self.total_rows + 1, self.total_rows + 1)
+        oids = np.arange(start, max(stop, start), dtype=np.int64)
+        index = oids - 1
+
+        if self.block_slots is not None:
+            slots = self.block_slots[index // 1024]
+            oids, index = oids[slots >= 0], index[slots >= 0]
+            index = slots[slots >= 0] * 1024 + index % 1024
+
+        raw = gather(self.tablx_data, 16 + index * self.offset_size, self.offset_size).astype(np.int64)
+        offsets = np.zeros(len(oids), dtype=np.int64)
+        for byte in range(self.offset_size):
+            offsets |= raw[:, byte] << (8 * byte)
+
+        present = offsets > 0
+        return oids[present], offsets[present]
+
+    # -------------------------------------------------------------------------------
+    # Read the columns of the rows with OBJECTID in [start, stop)
+    # Returns the OBJECTIDs and a Column per field name: null flags and values (fixed width)
+    # or starts and lengths in the file (variable width). The fields before the last one
+    # requested are walked to find the positions of the values in each row
+    #
+    def read(self, names=None, start=None, stop=None):
+        wanted = set(names if names is not None else [field.name for field in self.fields])
+        oids, pos = self.row_offsets(start, stop)
+        rows = len(oids)
+        pos = pos + 4
+
+        flag_bytes = -(-self.nullable // 8)
+        flags = gather(self.data, pos, flag_bytes) if flag_bytes else None
+        pos += flag_bytes
+
+        columns = {}
+        nullable = 0
+        for field in self.fields:
+            if not wanted.difference(columns):
+                break
+            if field.type == 'OID':
+                continue
+
+            nulls = np.zeros(rows, dtype=bool)
+            if field.nullable:
+                nulls = (flags[:, nullable // 8] >> (nullable % 8) & 1).astype(bool)
+                nullable += 1
+            present = np.flatnonzero(~nulls)
+
+            if field.type in FIXED_TYPES:
+                width, dtype = FIXED_TYPES[field.type]
+                values = None
+                if field.name in wanted:
+                    raw = np.zeros((rows, width), dtype=np.uint8)
+                    raw[present] = gather(self.data, pos[present], width)
+                    values = raw if dtype is None else raw.view(dtype).reshape(rows)
+                pos[present] += width
+                columns[field.name] = Column(field, nulls, values, None, None)
+            elif field.type == 'Raster':
+                raise ValueError("{0}: raster field {1} is not supported".format(self.path, field.name))
+            else:
+                starts = np.zeros(rows, dtype=np.int64)
+                lengths = np.zeros(rows, dtype=np.int64)
+                lengths[present], sizes = read_varuints(self.data, pos[present])
+                starts[present] = pos[present] + sizes
+                pos[present] = starts[present] + lengths[present]
+                columns[field.name] = Column(field, nulls, None, starts, lengths)
+
+        return oids, {name: column for name, column in columns.items() if name in wanted}
+
+    # geometry blobs of a column, None for nulls
+    def shapes(self, column):
+        view = memoryview(self.buffer)
+        return [None if null else view[s:s + n]
+                for s, n, null in zip(column.starts.tolist(), column.lengths.tolist(), column.nulls.tolist())]
+
+    # -------------------------------------------------------------------------------
+    # Python values of a column (as returned by arcpy cursors), None for nulls
+    # Strings are decoded, blobs are zero copy memoryview slices of the file
+    # Geometries that can not be decoded (curves, multipatches) are None, their
+    # row index and error are added to errors
+    #
+    def values(self, column, errors=None):
+        field_type = column.field.type
+        view = memoryview(self.buffer)
+
+        if field_type in ('String', 'XML'):
+            values = [str(view[s:s + n], 'utf-8') for s, n in zip(column.starts.tolist(), column.lengths.tolist())]
+        elif field_type == 'Blob':
+            values = [view[s:s + n] for s, n in zip(column.starts.tolist(), column.lengths.tolist())]
+        elif field_type == 'Geometry':
+            values = []
+            for row, shape in enumerate(self.shapes(column)):
+                try:
+                    values.append(None if shape is None else decode_shape(shape, self.geometry_info))
+                except Exception as error:
+                    values.append(None)
+                    if errors is not None:
+                        errors.append((row, "{0}: {1}".format(type(error).__name__, error)))
+        elif field_type in ('GUID', 'GlobalID'):
+            values = [text.tobytes().decode('ascii') for text in guid_text(column.values)]
+        elif field_type in ('Date', 'DateOnly', 'TimeOnly'):
+            values = [GDB_EPOCH + timedelta(milliseconds=ms) for ms in to_milliseconds(column.values).tolist()]
+            if field_type == 'DateOnly':
+                values = [value.date() for value in values]
+            elif field_type == 'TimeOnly':
+                values = [value.time() for value in values]
+        elif field_type == 'TimestampOffset':
+            values = [(GDB_EPOCH + timedelta(milliseconds=ms)).replace(tzinfo=timezone(timedelta(minutes=offset)))
+                      for ms, offset in zip(to_milliseconds(column.values['days']).tolist(),
+                                            column.values['offset'].tolist())]
+        else:
+            values = column.values.tolist()
+
+        if column.nulls.any():
+            values = [None if null else value for null, value in zip(column.nulls.tolist(), values)]
+
+        return values
+
+
+def to_milliseconds(days):
+    return np.round(days * MS_PER_DAY).astype(np.int64)
+
+
+# GUID bytes (rows, 16) to text {XXXXXXXX-XXXX-XXXX-XXXX-XXXXXXXXXXXX} (rows, 38)
+def guid_text(raw):
+    raw = raw[:, GUID_ORDER]
+    digits = np.empty((len(raw), 32), dtype=np.uint8)
+    digits[:, 0::2] = HEX_DIGITS[raw >> 4]
+    digits[:, 1::2] = HEX_DIGITS[raw & 0x0F]
+
+    text = np.empty((len(raw), 38), dtype=np.uint8)
+    text[:, [0, 9, 14, 19, 24, 37]] = np.frombuffer(b'{----}', dtype=np.uint8)
+    text[:, [i for i in range(1, 37) if i not in (9, 14, 19, 24)]] = digits
+    return text
+
+
+# -------------------------------------------------------------------------------
+# COPY BINARY payload of a column: big endian bytes (rows, width) of a fixed width
+# type, as encoded by the copy_loader field encoders
+#
+def copy_values(column, oids=None):
+    field_type = column.field.type if column is not None else 'OID'
+
+    if field_type == 'OID':
+        return oids.astype('>i4').view(np.uint8).reshape(-1, 4)
+    if field_type in ('GUID', 'GlobalID'):
+        return guid_text(column.values)
+    if field_type == 'Date':
+        values = (to_milliseconds(column.values) - PG_EPOCH_DAYS * MS_PER_DAY) * 1000
+        return values.astype('>i8').view(np.uint8).reshape(-1, 8)
+    if field_type == 'DateOnly':
+        values = np.floor(column.values).astype(np.int64) - PG_EPOCH_DAYS
+        return values.astype('>i4').view(np.uint8).reshape(-1, 4)
+    if field_type == 'TimeOnly':
+        values = (to_milliseconds(column.values) % MS_PER_DAY) * 1000
+        return values.astype('>i8').view(np.uint8).reshape(-1, 8)
+    if field_type == 'TimestampOffset':
+        values = to_milliseconds(column.values['days']) - column.values['offset'].astype(np.int64) * 60000
+        values = (values - PG_EPOCH_DAYS * MS_PER_DAY) * 1000
+        return values.astype('>i8').view(np.uint8).reshape(-1, 8)
+
+    width, dtype = FIXED_TYPES[field_type]
+    return column.values.astype('>' + dtype[1:]).view(np.uint8).reshape(-1, width)
+
+
+# -------------------------------------------------------------------------------
+# Encode a block of rows as COPY BINARY tuples with numpy
+# parts: per column (lengths, kind, source, starts), lengths -1 for nulls and kind one of
+# fixed (rows x width bytes), file (slices of data) or buffer (slices of source)
+#
+def encode_rows(data, parts, rows):
+    sizes = [4 + np.maximum(lengths, 0) for lengths, kind, source, starts in parts]
+    row_sizes = 2 + np.sum(sizes, axis=0) if parts else np.full(rows, 2)
+    row_starts = np.cumsum(row_sizes) - row_sizes
+
+    out = np.empty(int(row_sizes.sum()), dtype=np.uint8)
+    out[row_starts[:, None] + np.arange(2)] = np.frombuffer(struct.pack('!h', len(parts)), dtype=np.uint8)
+
+    pos = row_starts + 2
+    for (lengths, kind, source, starts), size in zip(parts, sizes):
+        out[pos[:, None] + np.arange(4)] = lengths.astype('>i4').view(np.uint8).reshape(-1, 4)
+        present = np.flatnonzero(lengths > 0)
+        target = pos[present] + 4
+
+        if kind == 'fixed':
+            out[target[:, None] + np.arange(source.shape[1])] = source[present]
+        else:
+            out[ranges(target, lengths[present])] = (data if kind == 'file' else source)[
+                ranges(starts[present], lengths[present])]
+        pos += size
+
+    return out
+
+
+# -------------------------------------------------------------------------------
+# Table files by table name (lower case), from the names of the system catalog (a00000001):
+# the table of the row with OBJECTID n is stored in a<n in 8 hex digits>.gdbtable
+#
+def table_files(workspace):
+    with GdbTable(path.join(workspace, SYSTEM_CATALOG)) as catalog:
+        oids, columns = catalog.read(['Name'])
+        return {name.lower(): 'a{:08x}.gdbtable'.format(oid)
+                for oid, name in zip(oids.tolist(), catalog.values(columns['Name']))}
+
+
+class GdbTableSource:
+    def __init__(self, workspace, a_srs, t_srs, block_rows=BLOCK_ROWS):
+        if parse_srid(a_srs) != parse_srid(t_srs):
+            raise ValueError("The gdbtable reader does not reproject, use --reproject=client or server")
+
+        self.workspace = workspace
+        self.block_rows = block_rows
+        self.tables = {}
+        self.files = None
+        self.lock = threading.Lock()
+
+    def table(self, layer):
+        with self.lock:
+            if self.files is None:
+                self.files = table_files(self.workspace)
+
+            if layer not in self.tables:
+                if layer.lower() not in self.files:
+                    raise IOError('"{}" does not exist'.format(layer))
+                self.tables[layer] = GdbTable(path.join(self.workspace, self.files[layer.lower()]))
+
+            return self.tables[layer]
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+
+    def describe(self, layer):
+        table = self.table(layer)
+        fields = [(field.name, field.type, field.width) for field in table.fields]
+
+        return fields, table.geometry
+
+    # OBJECTID ranges of the chunked loads, other where clauses are not supported
+    def oid_blocks(self, table, where):
+        start, stop = 1, table.total_rows + 1
+        if where:
+            match = re.match(r'^"?\w+"?\s*>=\s*(\d+)\s+AND\s+"?\w+"?\s*<\s*(\d+)$', where.strip())
+            if match is None:
+                raise ValueError("The gdbtable reader only reads OBJECTID ranges, not {}".format(where))
+            start, stop = max(int(match.group(1)), 1), min(int(match.group(2)), stop)
+
+        return [(block, min(block + self.block_rows, stop)) for block in range(start, stop, self.block_rows)]
+
+    def field_names(self, table, cursor_fields):
+        geometry = next((field.name for field in table.fields if field.type == 'Geometry'), None)
+        return [geometry if name == 'SHAPE@WKB' else name for name in cursor_fields if name != 'OID@']
+
+    # -------------------------------------------------------------------------------
+    # Rows as tuples of the cursor fields (OID@, SHAPE@WKB and field names)
+    #
+    def rows(self, layer, cursor_fields, where=None):
+        table = self.table(layer)
+        names = self.field_names(table, cursor_fields)
+
+        for start, stop in self.oid_blocks(table, where):
+            oids, columns = table.read(names, start, stop)
+            errors = []
+            values = iter([table.values(columns[name], errors) for name in names])
+            columns = [oids.tolist() if name == 'OID@' else next(values) for name in cursor_fields]
+            for row, error in errors:
+                print(" Warning: {0} OBJECTID {1} loaded without geometry ({2})".format(layer, oids[row], error))
+            for row in zip(*columns):
+                yield row
+
+    # -------------------------------------------------------------------------------
+    # Blocks of COPY BINARY rows (row count, data, row errors) of the loader columns
+    # (name, pg_type, cursor_field, encoder); the geometries are decoded and encoded one by one,
+    # rows with unsupported (curves, multipatches) or invalid geometries are skipped
+    #
+    def copy_blocks(self, layer, columns, where=None):
+        table = self.table(layer)
+        cursor_fields = [column[2] for column in columns if column[2] != 'OID@']
+        names = dict(zip(cursor_fields, self.field_names(table, cursor_fields)))
+
+        for start, stop in self.oid_blocks(table, where):
+            oids, values = table.read(list(names.values()), start, stop)
+            keep = np.ones(len(oids), dtype=bool)
+            errors = []
+            parts = []
+
+            for name, pg_type, cursor_field, encoder in columns:
+                if cursor_field == 'OID@':
+                    parts.append((np.full(len(oids), 4), 'fixed', copy_values(None, oids), None))
+                    continue
+
+                column = values[names[cursor_field]]
+                lengths = np.where(column.nulls, -1, 0)
+
+                if column.field.type == 'Geometry':
+                    encoded = []
+                    for row, shape in enumerate(table.shapes(column)):
+                        if shape is None:
+                            continue
+                        try:
+                            wkb = decode_shape(shape, table.geometry_info)
+                            if wkb is None:
+                                lengths[row] = -1
+                                continue
+                            encoded.append(encoder(wkb)[4:])
+                            lengths[row] = len(encoded[-1])
+                        except Exception as error:
+                            keep[row] = False
+                            errors.append((int(oids[row]), "{0}: {1}".format(type(error).__name__, error)))
+                    buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+                    starts = np.cumsum(np.maximum(lengths, 0)) - np.maximum(lengths, 0)
+                    parts.append((lengths, 'buffer', buffer, starts))
+                elif column.values is None:
+                    lengths = np.where(column.nulls, -1, column.lengths)
+                    parts.append((lengths, 'file', None, column.starts))
+                else:
+                    source = copy_values(column)
+                    lengths = np.where(column.nulls, -1, source.shape[1])
+                    parts.append((lengths, 'fixed', source, None))
+
+            if not keep.all():
+                parts = [(lengths[keep], kind, source if kind != 'fixed' else source[keep],
+                          starts[keep] if starts is not None else None)
+                         for lengths, kind, source, starts in parts]
+
+            rows = int(keep.sum())
+            yield rows, encode_rows(table.data, parts, rows).tobytes(), errors
@@ -0,0 +1,77 @@
+##
+# manifest.py
+#
+# Description: Keep track of the completed phases and loaded layers of a run
+#              so that an interrupted conversion can be resumed
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import json
+import threading
+from datetime import datetime
+from os import path, replace
+
+
+def timestamp():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+class Manifest:
+    def __init__(self, manifest_path, resume=False):
+        self.path = manifest_path
+        self.resume = resume
+        self.lock = threading.Lock()
+        self.data = {'started': timestamp(), 'phases': {}, 'layers': {}}
+
+        if resume and path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+            print("\nResuming run started {0} ({1})".format(self.data['started'], self.path))
+        else:
+            self.save()
+
+    def save(self):
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+
+        replace(tmp_path, self.path)
+
+    # -------------------------------------------------------------------------------
+    # Phases
+    #
+    # phases that recorded errors are run again
+    def phase_done(self, phase):
+        return self.resume and self.data['phases'].get(phase, {}).get('errors', 1) == 0
+
+    def complete_phase(self, phase, errors=0):
+        with self.lock:
+            self.data['phases'][phase] = {'finished': timestamp(), 'errors': errors}
+            self.save()
+
+    # run phase unless already completed in the resumed run
+    def run(self, phase, func, *args, **kwargs):
+        if self.phase_done(phase):
+            print("\nSkipping {0} (completed {1}) ...".format(
+                phase, self.data['phases'][phase]['finished']))
+            return None
+
+        # phases return their error count, anything else (None, bool) counts as no errors
+        result = func(*args, **kwargs)
+        self.complete_phase(phase, result if type(result) is int else 0)
+        return result
+
+    # -------------------------------------------------------------------------------
+    # Layers
+    #
+    def layer_rows(self, layer):
+        if not self.resume or layer not in self.data['layers']:
+            return None
+
+        return self.data['layers'][layer]['rows']
+
+    def complete_layer(self, layer, rows):
+        with self.lock:
+            self.data['layers'][layer] = {'finished': timestamp(), 'rows': rows}
+            self.save()
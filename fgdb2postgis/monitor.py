@@ -0,0 +1,188 @@
+##
+# monitor.py
+#
+# Description: Background progress monitor of the load and index phases
+#              Polls pg_stat_progress_copy, pg_stat_progress_create_index and
+#              pg_stat_activity on a separate connection, reports rows/s, bytes/s,
+#              index build phase and ETA per table, stalls and lock waits
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import threading
+import time
+
+import psycopg2
+
+# pg_stat_progress_copy is available from PostgreSQL 14
+COPY_SQL = (
+    "SELECT p.pid, c.relname, p.tuples_processed, p.bytes_processed, p.bytes_total "
+    "  FROM pg_stat_progress_copy p JOIN pg_class c ON c.oid = p.relid "
+    " WHERE p.datname = current_database()")
+
+# pg_stat_progress_create_index is available from PostgreSQL 12
+INDEX_SQL = (
+    "SELECT p.pid, c.relname, i.relname, p.phase, p.blocks_done, p.blocks_total, "
+    "       p.tuples_done, p.tuples_total "
+    "  FROM pg_stat_progress_create_index p JOIN pg_class c ON c.oid = p.relid "
+    "  LEFT JOIN pg_class i ON i.oid = p.index_relid "
+    " WHERE p.datname = current_database()")
+
+ACTIVITY_SQL = (
+    "SELECT a.pid, a.wait_event_type, a.wait_event, "
+    "       extract(epoch FROM now() - a.query_start), left(a.query, 120), "
+    "       pg_blocking_pids(a.pid), "
+    "       (SELECT left(b.query, 120) FROM pg_stat_activity b "
+    "         WHERE b.pid = (pg_blocking_pids(a.pid))[1]) "
+    "  FROM pg_stat_activity a "
+    " WHERE a.datname = current_database() AND a.pid <> pg_backend_pid() AND a.state = 'active'")
+
+
+def format_bytes(value):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(value) < 1024:
+            return "{0:.1f} {1}".format(value, unit)
+        value /= 1024.0
+
+    return "{0:.1f} TB".format(value)
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return '--:--:--'
+
+    seconds = int(seconds)
+    return "{0:02d}:{1:02d}:{2:02d}".format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+# -------------------------------------------------------------------------------
+# Turn successive samples into progress lines
+# A sample holds the rows of the copy, index and activity queries
+#
+class ProgressTracker:
+    def __init__(self, expected_rows=None, stall_seconds=60):
+        self.expected_rows = expected_rows or {}
+        self.stall_seconds = stall_seconds
+        self.previous = {}
+        self.changed = {}
+        self.reported = set()
+
+    def report(self, sample, now):
+        lines = []
+        events = []
+        current = {}
+
+        for pid, table, tuples, bytes_done, bytes_total in sample.get('copy', []):
+            key = (pid, table, 'copy')
+            current[key] = (now, tuples, bytes_done)
+            rows_rate, bytes_rate = self.rates(key, now, tuples, bytes_done)
+
+            eta = None
+            expected = self.expected_rows.get(table)
+            if bytes_total and bytes_rate:
+                eta = (bytes_total - bytes_done) / bytes_rate
+            elif expected and rows_rate:
+                eta = max(expected - tuples, 0) / rows_rate
+
+            lines.append(" {0}: copy {1} rows{2} ({3:.0f} rows/s, {4}/s) ETA {5}".format(
+                table, tuples, ' of {}'.format(expected) if expected else '',
+                rows_rate or 0, format_bytes(bytes_rate or 0), format_eta(eta)))
+
+        for pid, table, index, phase, blocks_done, blocks_total, tuples_done, tuples_total in sample.get('index', []):
+            key = (pid, table, 'index')
+            done, total = (blocks_done, blocks_total) if blocks_total else (tuples_done, tuples_total)
+            current[key] = (now, done, 0)
+            rate, _ = self.rates(key, now, done, 0)
+
+            eta = (total - done) / rate if total and rate else None
+            percent = ' {:.0f}%'.format(100.0 * done / total) if total else ''
+            lines.append(" {0}: index {1} {2}{3} ETA {4}".format(
+                table, index or '', phase, percent, format_eta(eta)))
+
+        # stalled: no progress for stall_seconds
+        for key, value in current.items():
+            previous = self.previous.get(key)
+            if previous is None or previous[1:] != value[1:]:
+                self.changed[key] = now
+            elif now - self.changed.get(key, now) >= self.stall_seconds:
+                lines.append(" {0}: no progress for {1:.0f}s (pid {2})".format(
+                    key[1], now - self.changed[key], key[0]))
+                if key not in self.reported:
+                    self.reported.add(key)
+                    events.append(('stall', key[1], now - self.changed[key]))
+
+        for pid, wait_type, wait_event, running, query, blocking, blocking_query in sample.get('activity', []):
+            if wait_type == 'Lock':
+                lines.append(" pid {0} waiting {1:.0f}s for {2} lock: {3}".format(
+                    pid, running or 0, wait_event, query))
+                if blocking:
+                    lines.append("  blocked by pid {0}: {1}".format(
+                        ', '.join(str(b) for b in blocking), blocking_query))
+                if (pid, query) not in self.reported:
+                    self.reported.add((pid, query))
+                    events.append(('lock_wait', query, running or 0))
+
+        self.previous = current
+        self.changed = {key: value for key, value in self.changed.items() if key in current}
+
+        return lines, events
+
+    def rates(self, key, now, count, bytes_done):
+        previous = self.previous.get(key)
+        if previous is None or now <= previous[0]:
+            return None, None
+
+        elapsed = now - previous[0]
+        return (count - previous[1]) / elapsed, (bytes_done - previous[2]) / elapsed
+
+
+# -------------------------------------------------------------------------------
+# Poll the progress views on a separate connection until stopped
+#
+class ProgressMonitor(threading.Thread):
+    def __init__(self, conn_string, interval=5, expected_rows=None, stall_seconds=60, metrics=None):
+        threading.Thread.__init__(self, name='fgdb2postgis-monitor', daemon=True)
+        self.conn_string = conn_string
+        self.interval = interval
+        self.metrics = metrics
+        self.tracker = ProgressTracker(expected_rows, stall_seconds)
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            conn = psycopg2.connect(self.conn_string, application_name='fgdb2postgis_monitor')
+        except psycopg2.Error as error:
+            print(" Monitor: unable to connect ({})".format(str(error).strip()))
+            return
+
+        conn.autocommit = True
+        try:
+            queries = {'activity': ACTIVITY_SQL}
+            if conn.server_version >= 120000:
+                queries['index'] = INDEX_SQL
+            if conn.server_version >= 140000:
+                queries['copy'] = COPY_SQL
+
+            while not self.stopped.wait(self.interval):
+                sample = {}
+                with conn.cursor() as cursor:
+                    for name, query in queries.items():
+                        cursor.execute(query)
+                        sample[name] = cursor.fetchall()
+
+                lines, events = self.tracker.report(sample, time.time())
+                if lines:
+                    print("\nProgress ({}):".format(time.strftime('%H:%M:%S')))
+                    print('\n'.join(lines))
+
+                if self.metrics is not None:
+                    for phase, table, duration in events:
+                        self.metrics.event(phase, table, duration=round(duration, 4))
+        except psycopg2.Error as error:
+            print(" Monitor: {}".format(str(error).strip()))
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
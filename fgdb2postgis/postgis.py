@@ -7,20 +7,55 @@
 # Copyright: Cartologic 2017-2020
 #
 ##
+import copy
+import subprocess
 import sys
-from os import path, system
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from os import environ, path
 
 import psycopg2
 from psycopg2 import sql
 
+from fgdb2postgis.copy_loader import ArcpySource, CopyLoader, lookup_table_columns, parse_srid, quote_ident
+from fgdb2postgis.ddl_executor import DDLExecutor, DDLGraph, Statement
+from fgdb2postgis.gdbtable import GdbTableSource
+from fgdb2postgis.monitor import ProgressMonitor
+from fgdb2postgis.reproject import STAGING_SCHEMA, ClientReprojector, server_graph, staging_tables
+from fgdb2postgis.sql_script import ScriptRunner
+from fgdb2postgis.telemetry import Metrics
+
+# session settings of the bulk load profile
+BULK_SESSION_SQL = [
+    "SET synchronous_commit = off",
+    "SET maintenance_work_mem = '1GB'",
+    "SET max_parallel_maintenance_workers = 4"
+]
+
+
 class PostGIS:
-    def __init__(self, host, port, user, password, dbname, t_srs):
+    def __init__(self, host, port, user, password, dbname, t_srs, bulk=False, metrics=None, monitor=None,
+                 reproject='loader', schema_prefix=''):
         self.dbname = dbname
         self.t_srs = t_srs
         self.host = host
         self.port = port
         self.user = user
         self.password = password
+        self.bulk = bulk
+        self.session_sql = list(BULK_SESSION_SQL) if bulk else []
+        self.metrics = metrics or Metrics()
+        self.monitor = monitor
+        self.reproject = reproject
+        # with a schema prefix (batch mode) the tables are created in "<prefix>public",
+        # unqualified names of the sql scripts resolve there through the search path
+        self.schema_prefix = schema_prefix
+        self.schema = schema_prefix + 'public' if schema_prefix else 'public'
+        if schema_prefix:
+            self.session_sql.append('SET search_path TO "{}", public'.format(self.schema))
+        # server side reprojection loads the layers into a staging schema
+        self.load_schema = schema_prefix + STAGING_SCHEMA if reproject == 'server' else self.schema
         self.conn = None
         self.conn_string = (
             "dbname={0} host={1} port={2} user={3} password={4}".format(
@@ -34,16 +69,34 @@ class PostGIS:
         print(' Port: {}'.format(self.port))
         print(' User: {}'.format(self.user))
         print(' Password: {}'.format(self.password))
+        if self.bulk:
+            print(' Profile: bulk load ({})'.format(', '.join(self.session_sql)))
+        if self.reproject != 'loader':
+            print(' Reproject: {}'.format(self.reproject))
+        if self.schema_prefix:
+            print(' Schema prefix: {}'.format(self.schema_prefix))
 
     def connect(self):
         try:
             self.conn = psycopg2.connect(self.conn_string)
             print('\nConnect to database ...')
+
+            with self.conn.cursor() as cursor:
+                for statement in self.session_sql:
+                    cursor.execute(statement)
+            self.conn.commit()
         except psycopg2.Error as err:
             print(str(err))
             print('\nUnable to connect to database {} ...'.format(self.dbname))
             sys.exit(1)
 
+    # another session with the same settings (e.g. loading data while the main connection
+    # creates the lookup tables), connect() opens its connection
+    def new_session(self):
+        session = copy.copy(self)
+        session.conn = None
+        return session
+
     def disconnect(self):
         if self.conn:
             self.conn.commit()
@@ -51,32 +104,449 @@ class PostGIS:
 
         print("\nDisconnect from database ...")
 
-    def load_database(self, filegdb):
-
-        print("\nLoading database tables ...")
-
-        cmd = 'ogr2ogr -f "PostgreSQL" "PG:{0}" \
-			-progress \
-			-append \
-			-a_srs {1} \
-			-t_srs {2} \
-			-lco fid=id \
-			-lco launder=no \
-			-lco geometry_name=geom \
-                        -overwrite \
-                        -nlt PROMOTE_TO_MULTI \
-                        -nlt CONVERT_TO_LINEAR  \
-			--config OGR_TRUNCATE YES \
-			--config PG_USE_COPY YES \
-			{3}'.format(self.conn_string, filegdb.a_srs, self.t_srs, filegdb.workspace)
-        
+    # -------------------------------------------------------------------------------
+    # Report the progress of the database sessions while the block runs
+    # (enabled with the monitor interval in seconds)
+    #
+    @contextmanager
+    def monitoring(self, filegdb=None):
+        if not self.monitor:
+            yield
+            return
+
+        expected_rows = dict(filegdb.list_layers()) if filegdb is not None else {}
+        monitor = ProgressMonitor(self.conn_string, self.monitor, expected_rows, metrics=self.metrics)
+        monitor.start()
+        try:
+            yield
+        finally:
+            monitor.stop()
+
+    def load_database(self, filegdb, jobs=1, engine='ogr2ogr', manifest=None, chunk_rows=None):
+        if manifest is not None and manifest.phase_done('load_database'):
+            print("\nSkipping load_database (completed) ...")
+            return None
+
+        if self.load_schema != 'public':
+            with self.conn.cursor() as cursor:
+                cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(self.load_schema)))
+            self.conn.commit()
+
+        with self.monitoring(filegdb):
+            # resumed runs load layer by layer, to skip the completed ones,
+            # partitioned tables are created before their rows are appended
+            if jobs > 1 or engine != 'ogr2ogr' or (manifest is not None and manifest.resume) or filegdb.ddl.partitions:
+                results = self.load_layers(filegdb, jobs, engine, manifest, chunk_rows)
+                failed = [layer for layer, result in results.items() if result['returncode'] != 0]
+            else:
+                print("\nLoading database tables ...")
+
+                cmd = self.ogr2ogr_command(filegdb)
+                cmd.insert(1, '-progress')
+
+                results = None
+                try:
+                    output = self.ogr2ogr_output()
+                    failed = subprocess.call(cmd, env=self.ogr2ogr_env(), stdout=output, stderr=output) != 0
+                except Exception as error:
+                    print("An error occurred:", type(error).__name__, "–", error)
+                    failed = True
+
+        if manifest is not None and not failed:
+            manifest.complete_phase('load_database')
+
+        return results
+
+    # -------------------------------------------------------------------------------
+    # Source of the copy loader, client and server reprojection read the layers in the source srs
+    # The gdbtable engine reads the files without arcpy, as do the partitioned tables created
+    # for the ogr2ogr engine with the gdal catalog (only described, the rows are loaded by ogr2ogr)
+    #
+    def layer_source(self, filegdb, engine):
+        if engine == 'gdbtable' or (engine == 'ogr2ogr' and filegdb.backend == 'gdal'):
+            source_class = GdbTableSource
+        else:
+            source_class = ArcpySource
+
+        if self.reproject == 'loader' and engine != 'ogr2ogr':
+            return source_class(filegdb.workspace, filegdb.a_srs, self.t_srs)
+
+        return source_class(filegdb.workspace, filegdb.a_srs, filegdb.a_srs)
+
+    # -------------------------------------------------------------------------------
+    # Load layers one by one using a pool of workers
+    # Each worker runs an ogr2ogr process or a COPY stream (engines copy and gdbtable) per layer
+    # Layers are submitted largest first so that the longest loads start early
+    # Layers with more than chunk_rows rows are split into OBJECTID ranges loaded
+    # into the same table by several workers, the table is finished after the last chunk
+    # Partitioned layers are loaded the same way, one chunk per range or list partition
+    # (OBJECTID ranges for hash and grid partitions)
+    #
+    def load_layers(self, filegdb, jobs, engine='ogr2ogr', manifest=None, chunk_rows=None):
+        print("\nLoading database tables ({0}, {1} jobs) ...".format(engine, jobs))
+
+        layers = filegdb.list_layers()
+        results = {}
+
+        if manifest is not None and manifest.resume:
+            pending = []
+            for layer, rows in layers:
+                if self.layer_loaded(manifest, layer, rows):
+                    print(" {0} ({1} rows, already loaded)".format(layer, rows))
+                else:
+                    pending.append((layer, rows))
+            layers = pending
+
+        loader = None
+        table_loader = None
+        reprojector = None
+        source = None
+        if engine != 'ogr2ogr' or filegdb.ddl.partitions:
+            source = self.layer_source(filegdb, engine)
+            if self.reproject == 'client':
+                reprojector = ClientReprojector(filegdb.a_srs, self.t_srs)
+
+            srid = parse_srid(filegdb.a_srs if self.reproject == 'server' else self.t_srs)
+            loader = CopyLoader(self.conn_string, source, srid, schema=self.load_schema,
+                                unlogged=self.bulk, session_sql=self.session_sql,
+                                reprojector=reprojector, spatial_index=self.reproject != 'server')
+
+            # the ogr2ogr engine appends to the partitioned tables created by the copy loader
+            if engine == 'ogr2ogr':
+                table_loader, loader = loader, None
+
+        def load_layer(layer):
+            if loader is not None:
+                return loader.load_layer(layer)
+
+            return self.load_layer(filegdb, layer)
+
+        def load_chunk(layer, where):
+            if loader is not None:
+                return loader.load_chunk(layer, where)
+
+            return self.load_layer(filegdb, layer, where, append=True)
+
+        def create_chunks(layer):
+            if layer in filegdb.ddl.partitions:
+                return (loader or table_loader).create_chunked_table(
+                    layer, filegdb.ddl.partition_clause(layer),
+                    filegdb.ddl.partition_children(layer, self.load_schema, self.bulk))
+            if loader is not None:
+                return loader.create_chunked_table(layer)
+
+            return self.create_chunked_table(filegdb, layer)
+
+        def finish_chunks(layer):
+            if layer in filegdb.ddl.partitions:
+                return (loader or table_loader).finish_chunked_table(layer)
+            if loader is not None:
+                return loader.finish_chunked_table(layer)
+
+            return self.finish_chunked_table(filegdb, layer)
+
+        def record(layer, rows, returncode, error, duration, chunks=None):
+            results[layer] = {
+                'rows': rows,
+                'returncode': returncode,
+                'error': error
+            }
+
+            self.metrics.event(
+                'load_layer', layer, duration=round(duration, 4),
+                rows=rows if returncode == 0 else 0,
+                bytes=loader.byte_counts.get(layer) if loader is not None else None,
+                error=error if returncode != 0 else None, chunks=chunks)
+
+            if returncode == 0:
+                print(" {0} ({1} rows{2})".format(layer, rows, ', {} chunks'.format(chunks) if chunks else ''))
+                if manifest is not None:
+                    manifest.complete_layer(layer, rows)
+            else:
+                print(" {0} failed with exit code {1}".format(layer, returncode))
+                print("  {}".format(error))
+
+        # a step that raises fails its layer only (the tables of chunked layers are created here)
+        def timed(func, *args):
+            start = time.time()
+            try:
+                returncode, error = func(*args)
+            except Exception as exception:
+                returncode, error = -1, "{0}: {1}".format(type(exception).__name__, exception)
+            return returncode, error, time.time() - start
+
+        # chunked layers: where clauses, start time, chunks left and chunk errors
+        chunked = {}
+        for layer, rows in layers:
+            chunks = filegdb.catalog.layer_chunks(layer, chunk_rows) if chunk_rows and jobs > 1 else []
+            partition = filegdb.ddl.partitions.get(layer)
+            if partition is not None:
+                if partition.filters:
+                    chunks = partition.filters
+                elif not chunks:
+                    chunks = filegdb.catalog.layer_chunks(layer, -(-rows // jobs)) or [None]
+
+            if len(chunks) > 1 or partition is not None:
+                chunked[layer] = {'chunks': chunks, 'start': None, 'left': len(chunks), 'errors': []}
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {}
+            for layer, rows in layers:
+                if layer not in chunked:
+                    futures[executor.submit(timed, load_layer, layer)] = (layer, rows, 'layer')
+                    continue
+
+                # the empty table is created before its chunks are queued
+                state = chunked[layer]
+                state['start'] = time.time()
+                returncode, error, duration = timed(create_chunks, layer)
+                if returncode != 0:
+                    record(layer, rows, returncode, error, duration)
+                    continue
+
+                for where in state['chunks']:
+                    futures[executor.submit(timed, load_chunk, layer, where)] = (layer, rows, 'chunk')
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    layer, rows, step = futures.pop(future)
+                    returncode, error, duration = future.result()
+
+                    if step == 'layer':
+                        record(layer, rows, returncode, error, duration)
+                        continue
+
+                    state = chunked[layer]
+                    if step == 'chunk':
+                        state['left'] -= 1
+                        if returncode != 0:
+                            state['errors'].append((returncode, error))
+                        if state['left'] > 0:
+                            continue
+                        if not state['errors']:
+                            futures[executor.submit(timed, finish_chunks, layer)] = (layer, rows, 'finish')
+                            continue
+                        returncode, error = state['errors'][0][0], '\n  '.join(e[1] for e in state['errors'])
+
+                    record(layer, rows, returncode, error, time.time() - state['start'], len(state['chunks']))
+
+        if reprojector is not None:
+            reprojector.close()
+        if hasattr(source, 'close'):
+            source.close()
+
+        failed = [layer for layer, result in results.items() if result['returncode'] != 0]
+        print("\nLoaded {0} of {1} layers".format(len(results) - len(failed), len(results)))
+        if failed:
+            print(" Failed: {}".format(", ".join(sorted(failed))))
+
+        return results
+
+    # -------------------------------------------------------------------------------
+    # A layer is loaded if the manifest and the database table agree on the source rows
+    #
+    def layer_loaded(self, manifest, layer, rows):
+        if manifest.layer_rows(layer) != rows:
+            return False
+
+        return self.count_rows(layer, self.load_schema) == rows
+
+    def count_rows(self, table, schema='public'):
+        cursor = self.conn.cursor()
         try:
-            system(cmd)
+            cursor.execute(sql.SQL("SELECT count(*) FROM {}.{}").format(
+                sql.Identifier(schema), sql.Identifier(table)))
+            count = cursor.fetchone()[0]
+            self.conn.commit()
+        except psycopg2.Error:
+            self.conn.rollback()
+            count = None
+        finally:
+            cursor.close()
+
+        return count
+
+    def load_layer(self, filegdb, layer, where=None, append=False, create=False):
+        cmd = self.ogr2ogr_command(filegdb, layer, where=where, append=append, create=create)
+
+        try:
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  universal_newlines=True, env=self.ogr2ogr_env())
         except Exception as error:
-            print("An error occurred:", type(error).__name__, "–", error)
+            return -1, "{0}: {1}".format(type(error).__name__, error)
+
+        return proc.returncode, proc.stderr.strip()
+
+    # -------------------------------------------------------------------------------
+    # Chunked ogr2ogr load: an empty table is created (no spatial index), the chunks
+    # are appended with their source OBJECTID as id, the sequence and the spatial
+    # index are set at the end
+    #
+    def create_chunked_table(self, filegdb, layer):
+        where = '"{0}" < {1}'.format(filegdb.catalog.oid_field(layer), filegdb.catalog.oid_range(layer)[0])
+        return self.load_layer(filegdb, layer, where, create=True)
+
+    def finish_chunked_table(self, filegdb, layer):
+        table = "{0}.{1}".format(quote_ident(self.load_schema), quote_ident(layer))
+        statements = ["SELECT setval(pg_get_serial_sequence('{0}', 'id'), coalesce(max(\"id\"), 1)) FROM {1}".format(
+            table.replace("'", "''"), table)]
+        if filegdb.catalog.get_layer(layer).kind == 'FeatureClass' and self.reproject != 'server':
+            statements.append('CREATE INDEX {0} ON {1} USING GIST ("geom")'.format(
+                quote_ident("{}_geom_geom_idx".format(layer)), table))
+
+        conn = psycopg2.connect(self.conn_string)
+        try:
+            with conn.cursor() as cursor:
+                for statement in self.session_sql + statements:
+                    cursor.execute(statement)
+            conn.commit()
+        except psycopg2.Error as error:
+            conn.rollback()
+            return 1, str(error).strip()
+        finally:
+            conn.close()
+
+        return 0, ''
+
+    def ogr2ogr_command(self, filegdb, layer=None, table=None, where=None, append=False, create=False):
+        # server side reprojection loads in the source srs (sync loads are always reprojected)
+        server = self.reproject == 'server' and table is None
+        # layers are loaded into the load schema, sync loads name their staging table
+        schema = self.load_schema if table is None and self.load_schema != 'public' else None
+        conn_string = self.conn_string
+        if schema:
+            conn_string += ' active_schema={}'.format(schema)
+
+        cmd = [
+            'ogr2ogr', '-f', 'PostgreSQL', 'PG:{}'.format(conn_string),
+            '-append',
+            '-a_srs', filegdb.a_srs,
+            '-t_srs', filegdb.a_srs if server else self.t_srs,
+            '-lco', 'fid=id',
+            '-lco', 'launder=no',
+            '-lco', 'geometry_name=geom',
+            '-nlt', 'PROMOTE_TO_MULTI',
+            '-nlt', 'CONVERT_TO_LINEAR',
+            '--config', 'PG_USE_COPY', 'YES',
+        ]
+
+        # chunks of a layer are appended to the table created for them, keeping the source ids
+        if append:
+            cmd += ['-preserve_fid']
+        else:
+            cmd += ['-overwrite', '--config', 'OGR_TRUNCATE', 'YES']
+
+        if where:
+            cmd += ['-where', where]
+
+        if schema:
+            cmd += ['-lco', 'SCHEMA={}'.format(schema)]
+
+        if server or create:
+            cmd += ['-lco', 'SPATIAL_INDEX=NO']
+
+        if table:
+            cmd += ['-nln', table]
+
+        if self.bulk:
+            cmd += ['-lco', 'UNLOGGED=ON']
+
+        cmd.append(filegdb.workspace)
+
+        if layer:
+            cmd.append(layer)
+
+        return cmd
+
+    # ogr2ogr sessions of the bulk load profile do not wait for WAL flushes
+    def ogr2ogr_env(self):
+        env = dict(environ)
+        if self.bulk:
+            env['PGOPTIONS'] = "{} -c synchronous_commit=off".format(env.get('PGOPTIONS', '')).strip()
+
+        return env
+
+    # output of the single ogr2ogr process: sys.stdout when it is a file (the log of a batch
+    # conversion, see batch.convert_workspace), otherwise the inherited standard output
+    def ogr2ogr_output(self):
+        try:
+            sys.stdout.flush()
+            sys.stdout.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+        return sys.stdout
+
+    # -------------------------------------------------------------------------------
+    # Finish bulk load: switch unlogged tables to logged and analyze them
+    # Referenced tables are switched first, a logged table cannot reference an unlogged one
+    #
+    def finish_bulk_load(self, filegdb, jobs=1):
+        if not self.bulk:
+            return 0
+
+        print("\nSwitching tables to logged and analyzing ...")
+
+        schemas = [self.schema] + [schema for schema in filegdb.schemas if schema != self.schema]
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT c.oid::regclass::text, "
+            "       array(SELECT DISTINCT f.confrelid::regclass::text FROM pg_constraint f "
+            "             JOIN pg_class r ON r.oid = f.confrelid "
+            "             WHERE f.conrelid = c.oid AND f.contype = 'f' "
+            "               AND f.confrelid <> c.oid AND r.relpersistence = 'u') "
+            "  FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            " WHERE c.relkind = 'r' AND c.relpersistence = 'u' AND n.nspname = ANY(%s)",
+            (schemas,))
+        tables = cursor.fetchall()
+        cursor.close()
+        self.conn.commit()
+
+        graph = DDLGraph()
+        logged = {}
+        for table, references in tables:
+            logged[table] = Statement('ALTER TABLE {} SET LOGGED'.format(table), 'bulk load', 'set_logged', [table])
+
+        for table, references in tables:
+            logged[table].deps.update(logged[ref] for ref in references if ref in logged)
+            analyze = Statement('ANALYZE {}'.format(table), 'bulk load', 'analyze', [table])
+            analyze.deps.add(logged[table])
+            graph.statements += [logged[table], analyze]
+
+        with self.monitoring():
+            return self.execute_ddl(graph, jobs)
+
+    # -------------------------------------------------------------------------------
+    # Create the domain and subtype tables (list of values) in lookup_tables schema
+    # The values are collected from the file geodatabase, which is only read
+    #
+    def load_lookup_tables(self, filegdb, schema=None):
+        print("\nLoading lookup tables ...")
+
+        schema = schema or filegdb.lookup_schema
+        loader = CopyLoader(self.conn_string, None, None, schema=schema,
+                            unlogged=self.bulk, session_sql=self.session_sql)
+        errors = 0
+        for table, (field, field_type, values) in sorted(filegdb.lookup_tables.items()):
+            rows = [(oid, code, desc) for oid, (code, desc) in enumerate(values, 1)]
+            returncode, error = loader.load_table(
+                table, lookup_table_columns(field, field_type), rows, conn=self.conn)
+
+            if returncode != 0:
+                errors += 1
+                print(" {0} failed".format(table))
+                print("  {}".format(error))
+            else:
+                self.metrics.add(rows=len(rows), bytes=loader.byte_counts.get(table))
+
+        print(" {0} of {1} lookup tables loaded".format(len(filegdb.lookup_tables) - errors,
+                                                       len(filegdb.lookup_tables)))
+        return errors
 
     def update_views(self):
         print("\nUpdating database views ...")
+        errors = 0
         sql_files = [
             'information_schema_views.sql',
             'foreign_key_constraints_vw.sql'
@@ -85,49 +555,264 @@ class PostGIS:
         for sql_file in sql_files:
             sql_file = path.join(path.abspath(
                 path.dirname(__file__)), 'sql_files/{}'.format(sql_file))
-            self.execute_sql_file(sql_file)
+            errors += self.execute_sql_file(sql_file)
+
+        return errors
 
     def create_schemas(self, filegdb):
         print("\nCreating schemas ...")
 
+        errors = 0
         sql_files = ['create_schemas.sql']
         for sql_file in sql_files:
             sql_file = path.join(filegdb.sqlfolder_path, sql_file)
-            self.execute_sql_file(sql_file)
+            errors += self.execute_sql_file(sql_file)
 
-    def apply_sql(self, filegdb):
+        return errors
+
+    def apply_sql(self, filegdb, manifest=None, jobs=1):
         print("\nApplying sql scripts ...")
         sql_files = [
-            'fix_data_errors.sql',
             'create_indexes.sql',
             'create_constraints.sql',
-            'split_schemas.sql',
-            'create_views.sql'
+            'split_schemas.sql'
         ]
+        ddl_files = ['create_indexes.sql', 'create_constraints.sql', 'split_schemas.sql']
 
-        for sql_file in sql_files:
-            sql_file = path.join(filegdb.sqlfolder_path, sql_file)
-            print(" {}".format(sql_file))
-            self.execute_sql_file(sql_file)
+        with self.monitoring():
+            for sql_file in sql_files:
+                if jobs > 1 and sql_file in ddl_files:
+                    if sql_file == ddl_files[0]:
+                        with self.metrics.phase('apply_sql:ddl'):
+                            self.apply_ddl(filegdb, ddl_files, manifest, jobs)
+                    continue
 
-    def execute_sql_file(self, sql_file):
-        with open(sql_file, 'r', encoding="utf-8") as f:
-            sql_statements = f.read()
+                phase = 'apply_sql:{}'.format(sql_file)
+                sql_file = path.join(filegdb.sqlfolder_path, sql_file)
+                print(" {}".format(sql_file))
 
-        cursor = self.conn.cursor()
-        statements = sql_statements.split(';')
+                with self.metrics.phase(phase):
+                    if manifest is None:
+                        self.execute_sql_file(sql_file)
+                    else:
+                        manifest.run(phase, self.execute_sql_file, sql_file)
 
-        # Remove any empty statements
-        statements = [stmt.strip() for stmt in statements if stmt.strip()]
+    # -------------------------------------------------------------------------------
+    # Execute index, constraint and schema statements in parallel as one dependency graph
+    # and validate the foreign key constraints
+    # The statements are taken from the ddl model the sql files are rendered from
+    #
+    def apply_ddl(self, filegdb, ddl_files, manifest=None, jobs=4):
+        if manifest is not None:
+            ddl_files = [f for f in ddl_files if not manifest.phase_done('apply_sql:{}'.format(f))]
 
-        # Execute each SQL statement
-        for statement in statements:
-            sql_line = sql.SQL(statement)
-            try:
-                cursor.execute(sql_line)
-            except psycopg2.Error as e:
-                print("Exception:", str(e))
-                self.conn.rollback()  # Rollback the transaction
+        graph = DDLGraph(self.orphaned_keys(filegdb.ddl.orphans_table))
+        for sql_file in ddl_files:
+            print(" {}".format(path.join(filegdb.sqlfolder_path, sql_file)))
+            for line, statement in enumerate(filegdb.ddl.statements(sql_file), 1):
+                graph.add(statement, "{0}:{1}".format(sql_file, line))
 
-        cursor.close()
-        self.conn.commit()
\ No newline at end of file
+        if not graph.statements:
+            return 0
+
+        print(" Running {0} statements on {1} connections ...".format(len(graph.statements), jobs))
+        errors = self.execute_ddl(graph, jobs)
+
+        if manifest is not None:
+            for sql_file in ddl_files:
+                manifest.complete_phase('apply_sql:{}'.format(sql_file), errors)
+
+        return errors
+
+    # -------------------------------------------------------------------------------
+    # Reproject the layers loaded in the source srs into the public schema
+    # (server side reprojection), chunks of ids are transformed in parallel
+    #
+    def reproject_layers(self, filegdb, jobs=1):
+        if self.reproject != 'server':
+            return 0
+
+        tables = staging_tables(self.conn, self.load_schema)
+        print("\nReprojecting {0} tables to {1} ({2} jobs) ...".format(len(tables), self.t_srs, jobs))
+
+        graph = server_graph(tables, parse_srid(self.t_srs), self.schema, self.bulk, staging=self.load_schema)
+        with self.monitoring():
+            return self.execute_ddl(graph, jobs)
+
+    # -------------------------------------------------------------------------------
+    # Rewrite the feature classes in spatial order, one layer per connection
+    #
+    def cluster_layers(self, filegdb, jobs=1):
+        ddl = filegdb.ddl
+        if not ddl.clusters:
+            return 0
+
+        print("\nClustering {0} layers ({1}, {2} jobs) ...".format(
+            len(ddl.clusters), ', '.join(sorted(set(c.method for c in ddl.clusters.values()))), jobs))
+
+        graph = DDLGraph()
+        header = [Statement(sql_text, 'cluster', 'function') for sql_text in ddl.cluster_header()]
+        graph.statements += header
+
+        clusters = []
+        for cluster in ddl.clusters.values():
+            stmt = Statement(ddl.cluster_statement(cluster), 'cluster:{}'.format(cluster.table),
+                             'cluster', [cluster.table])
+            stmt.deps.update(header)
+            clusters.append(stmt)
+        graph.statements += clusters
+
+        for sql_text in ddl.cluster_footer():
+            stmt = Statement(sql_text, 'cluster', 'function')
+            stmt.after.update(clusters)
+            graph.statements.append(stmt)
+
+        with self.monitoring():
+            return self.execute_ddl(graph, jobs)
+
+    # -------------------------------------------------------------------------------
+    # Check the relations for orphan keys in parallel before the constraints are created
+    # and optionally fix them (insert the missing keys or nullify the foreign keys)
+    # The results are written to the report table
+    #
+    def check_orphans(self, filegdb, jobs=1, fix=None):
+        ddl = filegdb.ddl
+        print("\nChecking relations for orphan keys ({0} relations, {1} jobs) ...".format(
+            len(ddl.relations), jobs))
+
+        if not ddl.relations:
+            return 0
+
+        graph = DDLGraph()
+        previous = None
+        for sql_text in ddl.orphans_header():
+            stmt = Statement(sql_text, 'orphans', 'report', [ddl.orphans_table])
+            if previous is not None:
+                stmt.deps.add(previous)
+            graph.statements.append(stmt)
+            previous = stmt
+        header = previous
+
+        # checks only read the tables, fixes run once all checks are done
+        checks = []
+        for rel in ddl.relations.values():
+            stmt = Statement(ddl.orphan_check(rel), 'orphans:{}'.format(rel.destination), 'check',
+                             [rel.destination, rel.origin], shared=True)
+            stmt.deps.add(header)
+            checks.append(stmt)
+        graph.statements += checks
+
+        if fix:
+            for rel in ddl.relations.values():
+                stmt = Statement(ddl.orphan_fix(rel, fix), 'orphans:{}'.format(rel.destination), 'fix',
+                                 [rel.destination, rel.origin])
+                stmt.after.update(checks)
+                graph.statements.append(stmt)
+
+        with self.monitoring():
+            errors = self.execute_ddl(graph, jobs)
+
+        self.report_orphans(ddl.orphans_table)
+        return errors
+
+    def report_orphans(self, orphans_table):
+        with self.conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT destination, foreign_key, origin, primary_key, orphan_rows, orphan_keys, "
+                "       sample_keys, fix, fixed_rows "
+                "  FROM {} WHERE orphan_rows > 0 ORDER BY orphan_rows DESC".format(orphans_table))
+            rows = cursor.fetchall()
+        self.conn.commit()
+
+        for destination, foreign_key, origin, primary_key, orphan_rows, orphan_keys, samples, fix, fixed in rows:
+            print(" {0} ({1}) -> {2} ({3}): {4} rows, {5} keys not found, e.g. {6}{7}".format(
+                destination, foreign_key, origin, primary_key, orphan_rows, orphan_keys,
+                ', '.join(samples or []), '; {0} {1} rows'.format(fix, fixed) if fix else ''))
+            self.metrics.event('orphans', destination, rows=orphan_rows)
+
+        if not rows:
+            print(" No orphan keys found")
+        elif not all(row[7] for row in rows):
+            print(" Foreign keys with orphan keys are left NOT VALID (see {})".format(orphans_table))
+
+        return len(rows)
+
+    # -------------------------------------------------------------------------------
+    # (table, column) of the foreign keys with unfixed orphan keys in the report table
+    #
+    def orphaned_keys(self, orphans_table):
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", (orphans_table,))
+            if cursor.fetchone()[0] is None:
+                keys = []
+            else:
+                cursor.execute(
+                    "SELECT destination, foreign_key FROM {} "
+                    " WHERE orphan_rows > 0 AND fix IS NULL".format(orphans_table))
+                keys = cursor.fetchall()
+        self.conn.commit()
+
+        return keys
+
+    # -------------------------------------------------------------------------------
+    # Create the final_data layers in parallel, the statements of a layer
+    # (select, sequence, primary key, gist index) run in order on one table
+    #
+    def create_final_data(self, filegdb, jobs=1):
+        ddl = filegdb.ddl
+        print("\nCreating final data ({0}, {1} layers, {2} jobs) ...".format(
+            ddl.final_data_mode, len(ddl.final_data), jobs))
+
+        graph = DDLGraph()
+        previous = None
+        for sql_text in ddl.final_data_header():
+            stmt = Statement(sql_text, 'final_data', 'schema', [ddl.final_data_schema])
+            if previous is not None:
+                stmt.deps.add(previous)
+            graph.statements.append(stmt)
+            previous = stmt
+        header = previous
+
+        for layer, statements in ddl.final_data.items():
+            previous = header
+            for line, sql_text in enumerate(statements, 1):
+                stmt = Statement(sql_text, "final_data:{0}:{1}".format(layer, line),
+                                 'final_data', ["{0}.{1}".format(ddl.final_data_schema, layer)])
+                stmt.deps.add(previous)
+                graph.statements.append(stmt)
+                previous = stmt
+
+        with self.monitoring():
+            return self.execute_ddl(graph, jobs)
+
+    def refresh_final_data(self, filegdb, jobs=1):
+        print("\nRefreshing final data ({} jobs) ...".format(jobs))
+
+        graph = DDLGraph()
+        for sql_text in filegdb.ddl.final_data_refresh():
+            graph.statements.append(Statement(sql_text, 'final_data', 'refresh'))
+
+        with self.monitoring():
+            return self.execute_ddl(graph, jobs)
+
+    def execute_ddl(self, graph, jobs):
+        executor = DDLExecutor(self.conn_string, max(jobs, 1), self.session_sql)
+        errors = executor.run(graph)
+        self.metrics.add(statements=len(graph.statements), sql_time=executor.sql_time)
+
+        return errors
+
+    # -------------------------------------------------------------------------------
+    # Execute sql file in batches of statements
+    # Failures are reported per statement with file and line
+    #
+    def execute_sql_file(self, sql_file):
+        runner = ScriptRunner(self.conn)
+        start = time.time()
+        failures = runner.run(sql_file)
+        self.metrics.add(statements=runner.executed + len(failures), sql_time=time.time() - start)
+
+        if failures:
+            print(" {0} statements executed, {1} failed".format(runner.executed, len(failures)))
+
+        return len(failures)
\ No newline at end of file
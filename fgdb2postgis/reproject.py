@@ -0,0 +1,281 @@
+##
+# reproject.py
+#
+# Description: Reproject the layers outside of the loader, on all cores
+#              client: the coordinates of a batch of rows are gathered from the WKB into
+#              NumPy arrays and transformed at once with pyproj, in a pool of processes
+#              server: the layers are loaded in the source srs into a staging schema and
+#              copied to the target tables with ST_Transform, in parallel chunks of ids
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import os
+import re
+import struct
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fgdb2postgis.copy_loader import WKB_M, WKB_SRID, WKB_Z, parse_srid, quote_ident
+from fgdb2postgis.ddl_executor import DDLGraph, Statement
+
+try:
+    import pyproj
+except ImportError:
+    pyproj = None
+
+REPROJECT_MODES = ['loader', 'client', 'server']
+STAGING_SCHEMA = 'fgdb2postgis_reproject'
+BATCH_ROWS = 5000
+CHUNK_ROWS = 250000
+
+
+# -------------------------------------------------------------------------------
+# Coordinate runs (offset, points, dimensions) of a WKB geometry
+# Points, line strings and rings store their coordinates as consecutive doubles
+#
+def coordinate_runs(wkb, offset=0, runs=None):
+    if runs is None:
+        runs = []
+
+    endian = '<' if wkb[offset] == 1 else '>'
+    code = struct.unpack_from(endian + 'I', wkb, offset + 1)[0]
+    offset += 5
+
+    if code & (WKB_Z | WKB_M | WKB_SRID):
+        geom_type = code & 0x0FFFFFFF
+        dims = 2 + bool(code & WKB_Z) + bool(code & WKB_M)
+        if code & WKB_SRID:
+            offset += 4
+    else:
+        geom_type = code % 1000
+        dims = 2 + (code // 1000 in (1, 3)) + (code // 1000 in (2, 3))
+
+    if geom_type == 1:
+        runs.append((offset, 1, dims, endian))
+        return offset + 8 * dims, runs
+
+    count = struct.unpack_from(endian + 'I', wkb, offset)[0]
+    offset += 4
+
+    if geom_type == 2:
+        runs.append((offset, count, dims, endian))
+        offset += 8 * dims * count
+    elif geom_type == 3:
+        for ring in range(count):
+            points = struct.unpack_from(endian + 'I', wkb, offset)[0]
+            runs.append((offset + 4, points, dims, endian))
+            offset += 4 + 8 * dims * points
+    elif geom_type in (4, 5, 6, 7):
+        for part in range(count):
+            offset, runs = coordinate_runs(wkb, offset, runs)
+    else:
+        raise ValueError("Unsupported WKB geometry type {}".format(code))
+
+    return offset, runs
+
+
+# -------------------------------------------------------------------------------
+# Transform the x, y of a list of WKB geometries with one call of transform(xx, yy)
+# The geometries are returned as new bytes, None values are kept
+#
+def transform_wkbs(wkbs, transform):
+    buffers = [bytearray(wkb) if wkb is not None else None for wkb in wkbs]
+
+    views = []
+    for buffer in buffers:
+        if buffer is None:
+            continue
+        for offset, points, dims, endian in coordinate_runs(buffer)[1]:
+            if points:
+                views.append(np.frombuffer(buffer, dtype=endian + 'f8', count=points * dims,
+                                           offset=offset).reshape(points, dims))
+
+    if views:
+        xx, yy = transform(np.concatenate([view[:, 0] for view in views]),
+                           np.concatenate([view[:, 1] for view in views]))
+
+        start = 0
+        for view in views:
+            end = start + len(view)
+            view[:, 0] = xx[start:end]
+            view[:, 1] = yy[start:end]
+            start = end
+
+    return [bytes(buffer) if buffer is not None else None for buffer in buffers]
+
+
+_transformers = {}
+
+
+def get_transformer(a_srs, t_srs):
+    key = (a_srs, t_srs)
+    if key not in _transformers:
+        _transformers[key] = pyproj.Transformer.from_crs(
+            'EPSG:{}'.format(parse_srid(a_srs)), 'EPSG:{}'.format(parse_srid(t_srs)), always_xy=True)
+
+    return _transformers[key]
+
+
+# worker of the process pool, rows are tuples with the geometry at geom_index
+def transform_rows(rows, geom_index, a_srs, t_srs):
+    transformer = get_transformer(a_srs, t_srs)
+    wkbs = transform_wkbs([row[geom_index] for row in rows], transformer.transform)
+
+    return [row[:geom_index] + (wkb,) + row[geom_index + 1:] for row, wkb in zip(rows, wkbs)]
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(tuple(row))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+# -------------------------------------------------------------------------------
+# Client side reprojection of the copy engine rows
+# Batches are transformed by a pool of processes (one per core by default),
+# a few batches ahead of the COPY stream, in the order they were read
+#
+class ClientReprojector:
+    def __init__(self, a_srs, t_srs, processes=None, batch_rows=BATCH_ROWS):
+        if pyproj is None:
+            raise ImportError("pyproj is required for --reproject=client (pip install pyproj)")
+
+        self.a_srs = a_srs
+        self.t_srs = t_srs
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_rows = batch_rows
+        self.executor = ProcessPoolExecutor(max_workers=self.processes)
+
+    def rows(self, rows, geom_index):
+        pending = deque()
+        for batch in batches(rows, self.batch_rows):
+            pending.append(self.executor.submit(transform_rows, batch, geom_index, self.a_srs, self.t_srs))
+            if len(pending) > 2 * self.processes:
+                for row in pending.popleft().result():
+                    yield row
+
+        while pending:
+            for row in pending.popleft().result():
+                yield row
+
+    def close(self):
+        self.executor.shutdown()
+
+
+# -------------------------------------------------------------------------------
+# Server side reprojection
+# Tables of the staging schema: name, columns [(name, type)], id sequence, min and max id
+#
+def staging_tables(conn, schema=STAGING_SCHEMA):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, "
+            "       array(SELECT a.attname::text FROM pg_attribute a "
+            "              WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped ORDER BY a.attnum), "
+            "       array(SELECT format_type(a.atttypid, a.atttypmod) FROM pg_attribute a "
+            "              WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped ORDER BY a.attnum), "
+            "       CASE WHEN EXISTS (SELECT 1 FROM pg_attribute a WHERE a.attrelid = c.oid AND a.attname = 'id') "
+            "            THEN pg_get_serial_sequence(c.oid::regclass::text, 'id') END "
+            "  FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            " WHERE n.nspname = %s AND c.relkind = 'r' ORDER BY c.relname", (schema,))
+        rows = cursor.fetchall()
+
+        tables = []
+        for table, names, types, sequence in rows:
+            min_id = max_id = None
+            if 'id' in names:
+                cursor.execute('SELECT min("id"), max("id") FROM {0}.{1}'.format(
+                    quote_ident(schema), quote_ident(table)))
+                min_id, max_id = cursor.fetchone()
+            tables.append((table, list(zip(names, types)), sequence, min_id, max_id))
+    conn.commit()
+
+    return tables
+
+
+def transform_column(name, column_type, srid):
+    if not column_type.startswith('geometry'):
+        return quote_ident(name)
+
+    target_type = re.sub(r',\s*\d+\)$', ',{})'.format(srid), column_type)
+    return 'ST_Transform({0}, {1})::{2} AS {0}'.format(quote_ident(name), srid, target_type)
+
+
+# -------------------------------------------------------------------------------
+# Graph copying the staging tables to the target schema
+# Tables with geometry: create the target, insert id chunks in parallel, then primary key,
+# id sequence and gist index; tables without geometry are moved to the target schema
+#
+def server_graph(tables, srid, schema='public', unlogged=False, chunk_rows=CHUNK_ROWS,
+                 staging=STAGING_SCHEMA):
+    graph = DDLGraph()
+    finished = []
+
+    for table, columns, sequence, min_id, max_id in tables:
+        source = '{0}.{1}'.format(quote_ident(staging), quote_ident(table))
+        target = '{0}.{1}'.format(quote_ident(schema), quote_ident(table))
+        drop = Statement('DROP TABLE IF EXISTS {} CASCADE'.format(target), table, 'reproject', [target])
+        graph.statements.append(drop)
+
+        geometry = [name for name, column_type in columns if column_type.startswith('geometry')]
+        if not geometry:
+            move = Statement('ALTER TABLE {0} SET SCHEMA {1}'.format(source, quote_ident(schema)),
+                             table, 'reproject', [target, source])
+            move.deps.add(drop)
+            graph.statements.append(move)
+            finished.append(move)
+            continue
+
+        select = ', '.join(transform_column(name, column_type, srid) for name, column_type in columns)
+        create = Statement('CREATE {0}TABLE {1} AS SELECT {2} FROM {3} WITH NO DATA'.format(
+            'UNLOGGED ' if unlogged else '', target, select, source), table, 'reproject', [target])
+        create.deps.add(drop)
+        graph.statements.append(create)
+
+        chunks = []
+        if min_id is not None:
+            for start in range(min_id, max_id + 1, chunk_rows):
+                chunk = Statement('INSERT INTO {0} SELECT {1} FROM {2} WHERE "id" >= {3} AND "id" < {4}'.format(
+                    target, select, source, start, start + chunk_rows), table, 'transform', [target], shared=True)
+                chunk.deps.add(create)
+                chunks.append(chunk)
+        graph.statements += chunks
+
+        finish = []
+        if min_id is not None or sequence:
+            finish.append('ALTER TABLE {0} ADD CONSTRAINT {1} PRIMARY KEY ("id")'.format(
+                target, quote_ident('{}_pkey'.format(table))))
+        if sequence:
+            finish += [
+                "ALTER TABLE {0} ALTER COLUMN \"id\" SET DEFAULT nextval('{1}'::regclass)".format(
+                    target, sequence.replace("'", "''")),
+                'ALTER SEQUENCE {0} OWNED BY {1}."id"'.format(sequence, target),
+                'ALTER SEQUENCE {0} SET SCHEMA {1}'.format(sequence, quote_ident(schema))
+            ]
+        finish.append('DROP TABLE {}'.format(source))
+        finish += ['CREATE INDEX {0} ON {1} USING GIST ({2})'.format(
+            quote_ident('{0}_{1}_geom_idx'.format(table, name)), target, quote_ident(name)) for name in geometry]
+
+        previous = chunks or [create]
+        for sql_text in finish:
+            stmt = Statement(sql_text, table, 'reproject', [target, source])
+            stmt.deps.update(previous)
+            graph.statements.append(stmt)
+            previous = [stmt]
+        finished += previous
+
+    if tables:
+        stmt = Statement('DROP SCHEMA IF EXISTS {}'.format(quote_ident(staging)), staging, 'reproject')
+        stmt.deps.update(finished)
+        graph.statements.append(stmt)
+
+    return graph
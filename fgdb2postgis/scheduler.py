@@ -0,0 +1,86 @@
+##
+# scheduler.py
+#
+# Description: Run the phases of a conversion as a graph of tasks with explicit dependencies
+#              A task starts as soon as the tasks it depends on are done, so independent phases
+#              (e.g. the data load and the domains, subtypes and relations processing) overlap
+#              Tasks of the same group (e.g. sharing a database connection) never run at the same time
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+from collections import OrderedDict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from fgdb2postgis.telemetry import Metrics
+
+Task = namedtuple('Task', 'name func args deps group')
+
+
+class Scheduler:
+    def __init__(self, workers=4, metrics=None):
+        self.workers = workers
+        self.metrics = metrics or Metrics()
+        self.tasks = OrderedDict()
+        self.results = {}
+
+    # -------------------------------------------------------------------------------
+    # Add a task, the dependencies must be added before it (the graph stays acyclic)
+    #
+    def add(self, name, func, *args, deps=(), group=None):
+        if name in self.tasks:
+            raise ValueError("Task {} added twice".format(name))
+
+        deps = [dep for dep in deps if dep is not None]
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError("Task {0} depends on unknown task {1}".format(name, dep))
+
+        self.tasks[name] = Task(name, func, args, set(deps), group)
+        return name
+
+    def run_task(self, task):
+        with self.metrics.phase(task.name):
+            return task.func(*task.args)
+
+    # -------------------------------------------------------------------------------
+    # Run the graph, tasks are started in the order they were added when ready
+    # The first failure stops the scheduling, running tasks are waited for and the error is raised
+    #
+    def run(self):
+        pending = OrderedDict(self.tasks)
+        done = set()
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while pending or running:
+                if error is None:
+                    busy = set(task.group for task in running.values() if task.group is not None)
+                    for task in list(pending.values()):
+                        if len(running) >= self.workers:
+                            break
+                        if task.deps <= done and (task.group is None or task.group not in busy):
+                            del pending[task.name]
+                            running[executor.submit(self.run_task, task)] = task
+                            if task.group is not None:
+                                busy.add(task.group)
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        self.results[task.name] = future.result()
+                        done.add(task.name)
+                    except BaseException as task_error:
+                        if error is None:
+                            print("\nTask {0} failed: {1}".format(task.name, task_error))
+                            error = task_error
+
+        if error is not None:
+            raise error
+
+        return self.results
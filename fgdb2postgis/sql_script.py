@@ -0,0 +1,202 @@
+##
+# sql_script.py
+#
+# Description: Split sql scripts into statements and execute them in batches
+#              The tokenizer streams the file and understands quoted strings,
+#              quoted identifiers, dollar quoting and comments
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import re
+
+import psycopg2
+
+BATCH_SIZE = 500
+
+RE_DOLLAR_TAG = re.compile(r'\$(?:[A-Za-z_][A-Za-z_0-9]*)?\$')
+RE_NON_TRANSACTIONAL = re.compile(
+    r'^(VACUUM|CREATE\s+(UNIQUE\s+)?INDEX\s+CONCURRENTLY|DROP\s+INDEX\s+CONCURRENTLY|'
+    r'REINDEX\s+.*CONCURRENTLY|CREATE\s+DATABASE|DROP\s+DATABASE|ALTER\s+SYSTEM)\b',
+    re.IGNORECASE | re.DOTALL)
+
+
+def is_ident_char(c):
+    return c.isalnum() or c == '_'
+
+
+# -------------------------------------------------------------------------------
+# Yield (statement, line number) for each statement of the given lines
+# Comments and psql meta-commands (\echo, ...) are dropped
+#
+def iter_statements(lines):
+    buf = []
+    start_line = None
+    state = None
+    tag = None
+    depth = 0
+
+    for lineno, line in enumerate(lines, 1):
+        if state is None and start_line is None and line.lstrip().startswith('\\'):
+            continue
+
+        i = 0
+        n = len(line)
+        while i < n:
+            c = line[i]
+
+            if state is None:
+                if c == '-' and line.startswith('--', i):
+                    buf.append('\n')
+                    break
+                if c == '/' and line.startswith('/*', i):
+                    state, depth = '/*', 1
+                    i += 2
+                    continue
+                if c == ';':
+                    text = ''.join(buf).strip()
+                    if text:
+                        yield text, start_line
+                    buf, start_line = [], None
+                    i += 1
+                    continue
+
+                if start_line is None and not c.isspace():
+                    start_line = lineno
+
+                if c == "'":
+                    escape = (buf and buf[-1] in 'eE' and
+                              (len(buf) < 2 or not is_ident_char(buf[-2])))
+                    state = "E'" if escape else "'"
+                elif c == '"':
+                    state = '"'
+                elif c == '$' and not (buf and is_ident_char(buf[-1])):
+                    m = RE_DOLLAR_TAG.match(line, i)
+                    if m:
+                        state, tag = '$', m.group()
+                        buf.append(tag)
+                        i = m.end()
+                        continue
+
+                buf.append(c)
+                i += 1
+
+            elif state == '/*':
+                if line.startswith('*/', i):
+                    depth -= 1
+                    i += 2
+                    if not depth:
+                        state = None
+                        buf.append(' ')
+                elif line.startswith('/*', i):
+                    depth += 1
+                    i += 2
+                else:
+                    i += 1
+
+            elif state == '$':
+                if line.startswith(tag, i):
+                    buf.append(tag)
+                    i += len(tag)
+                    state = None
+                else:
+                    buf.append(c)
+                    i += 1
+
+            else:
+                # quoted string or identifier, the quote is doubled to escape it
+                quote = state[-1]
+                if state == "E'" and c == '\\':
+                    buf.append(line[i:i + 2])
+                    i += 2
+                    continue
+                if c == quote:
+                    if line.startswith(quote * 2, i):
+                        buf.append(quote * 2)
+                        i += 2
+                        continue
+                    state = None
+                buf.append(c)
+                i += 1
+
+    text = ''.join(buf).strip()
+    if text:
+        yield text, start_line
+
+
+def read_statements(sql_file):
+    with open(sql_file, 'r', encoding='utf-8') as f:
+        for statement, line in iter_statements(f):
+            yield statement, line
+
+
+# -------------------------------------------------------------------------------
+# Execute the statements of a sql file in batches, one round trip per batch
+# A failing batch is rolled back to its savepoint and replayed statement by
+# statement, each one in its own savepoint, to keep the work of the others
+#
+class ScriptRunner:
+    def __init__(self, conn, batch_size=BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.failures = []
+        self.executed = 0
+
+    def run(self, sql_file):
+        batch = []
+        for statement, line in read_statements(sql_file):
+            if RE_NON_TRANSACTIONAL.match(statement):
+                self.execute_batch(sql_file, batch)
+                batch = []
+                self.execute_autocommit(sql_file, statement, line)
+                continue
+
+            batch.append((statement, line))
+            if len(batch) >= self.batch_size:
+                self.execute_batch(sql_file, batch)
+                batch = []
+
+        self.execute_batch(sql_file, batch)
+        return self.failures
+
+    def execute_batch(self, sql_file, batch):
+        if not batch:
+            return
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute('SAVEPOINT fgdb2postgis_batch;\n{};\nRELEASE SAVEPOINT fgdb2postgis_batch'.format(
+                ';\n'.join(statement for statement, line in batch)))
+            self.executed += len(batch)
+        except psycopg2.Error:
+            cursor.execute('ROLLBACK TO SAVEPOINT fgdb2postgis_batch')
+            for statement, line in batch:
+                try:
+                    cursor.execute('SAVEPOINT fgdb2postgis_statement')
+                    cursor.execute(statement)
+                    cursor.execute('RELEASE SAVEPOINT fgdb2postgis_statement')
+                    self.executed += 1
+                except psycopg2.Error as error:
+                    cursor.execute('ROLLBACK TO SAVEPOINT fgdb2postgis_statement')
+                    self.fail(sql_file, line, error)
+        finally:
+            cursor.close()
+
+        self.conn.commit()
+
+    def execute_autocommit(self, sql_file, statement, line):
+        autocommit = self.conn.autocommit
+        self.conn.autocommit = True
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute(statement)
+            self.executed += 1
+        except psycopg2.Error as error:
+            self.fail(sql_file, line, error)
+        finally:
+            self.conn.autocommit = autocommit
+
+    def fail(self, sql_file, line, error):
+        message = str(error).strip().splitlines()[0] if str(error).strip() else type(error).__name__
+        self.failures.append((sql_file, line, message))
+        print(" Exception ({0}:{1}): {2}".format(sql_file, line, message))
@@ -0,0 +1,209 @@
+##
+# sync.py
+#
+# Description: Synchronize the live PostGIS tables with the file geodatabase
+#              Layers are loaded into a staging schema and only the inserted,
+#              updated and deleted rows (per row md5 keyed on OBJECTID) are applied
+#              Lookup tables are keyed on their code field
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import psycopg2
+from psycopg2 import sql
+
+from fgdb2postgis.copy_loader import CopyLoader, lookup_table_columns
+
+STAGING_SCHEMA = 'fgdb2postgis_staging'
+KEY = 'id'
+
+
+# -------------------------------------------------------------------------------
+# Compose the set based statements applying the differences of staging to live
+#
+def delta_statements(staging, live, columns, key_column=KEY):
+    key = sql.Identifier(key_column)
+    cols = sql.SQL(', ').join(sql.Identifier(c) for c in columns)
+    s_cols = sql.SQL(', ').join(sql.SQL('s.{}').format(sql.Identifier(c)) for c in columns)
+    assignments = sql.SQL(', ').join(
+        sql.SQL('{0} = s.{0}').format(sql.Identifier(c)) for c in columns if c != key_column)
+
+    statements = [
+        sql.SQL(
+            'CREATE TEMP TABLE fgdb2postgis_delta ON COMMIT DROP AS '
+            'SELECT coalesce(s.{key}, l.{key}) AS {key}, '
+            'CASE WHEN l.{key} IS NULL THEN {insert} WHEN s.{key} IS NULL THEN {delete} ELSE {update} END AS op '
+            'FROM (SELECT {key}, md5(ROW({cols})::text) AS hash FROM {staging}) s '
+            'FULL JOIN (SELECT {key}, md5(ROW({cols})::text) AS hash FROM {live}) l ON s.{key} = l.{key} '
+            'WHERE s.hash IS DISTINCT FROM l.hash').format(
+                key=key, cols=cols, staging=staging, live=live,
+                insert=sql.Literal('I'), delete=sql.Literal('D'), update=sql.Literal('U')),
+        sql.SQL('CREATE INDEX ON fgdb2postgis_delta ({})').format(key),
+        sql.SQL('ANALYZE fgdb2postgis_delta'),
+        sql.SQL(
+            'DELETE FROM {live} l USING fgdb2postgis_delta d '
+            'WHERE l.{key} = d.{key} AND d.op = {delete}').format(
+                live=live, key=key, delete=sql.Literal('D')),
+        sql.SQL(
+            'INSERT INTO {live} ({cols}) SELECT {s_cols} FROM {staging} s '
+            'JOIN fgdb2postgis_delta d ON s.{key} = d.{key} AND d.op = {insert}').format(
+                live=live, cols=cols, s_cols=s_cols, staging=staging, key=key,
+                insert=sql.Literal('I'))
+    ]
+
+    if columns != [key_column]:
+        statements.append(sql.SQL(
+            'UPDATE {live} l SET {assignments} FROM {staging} s, fgdb2postgis_delta d '
+            'WHERE l.{key} = d.{key} AND s.{key} = d.{key} AND d.op = {update}').format(
+                live=live, assignments=assignments, staging=staging, key=key,
+                update=sql.Literal('U')))
+
+    return statements
+
+
+class DeltaSync:
+    def __init__(self, postgis, filegdb):
+        self.postgis = postgis
+        self.filegdb = filegdb
+        self.staging_schema = postgis.schema_prefix + STAGING_SCHEMA
+
+    # -------------------------------------------------------------------------------
+    # Synchronize all layers with a pool of workers
+    #
+    def sync_database(self, jobs=1):
+        print("\nSynchronizing database tables ({} jobs) ...".format(jobs))
+
+        with psycopg2.connect(self.postgis.conn_string) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL('CREATE SCHEMA IF NOT EXISTS {}').format(
+                    sql.Identifier(self.staging_schema)))
+        conn.close()
+
+        layers = [layer for layer, rows in self.filegdb.list_layers()]
+        lookup_tables = sorted(self.filegdb.lookup_tables)
+
+        def timed(func, layer):
+            start = time.time()
+            result = func(layer)
+            result['duration'] = round(time.time() - start, 4)
+            return result
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {}
+            for layer in layers:
+                futures[executor.submit(timed, self.sync_layer, layer)] = layer
+            for table in lookup_tables:
+                futures[executor.submit(timed, self.sync_lookup_table, table)] = table
+
+            for future in as_completed(futures):
+                layer = futures[future]
+                results[layer] = future.result()
+                result = results[layer]
+                self.postgis.metrics.event('sync_layer', layer, duration=result['duration'],
+                                           rows=result['I'] + result['U'] + result['D'])
+
+                if result['error']:
+                    print(" {0} failed".format(layer))
+                    print("  {}".format(result['error']))
+                else:
+                    print(" {0}: {1} inserted, {2} updated, {3} deleted{4}".format(
+                        layer, result['I'], result['U'], result['D'],
+                        ' (new table)' if result['created'] else ''))
+
+        changed = sum(r['I'] + r['U'] + r['D'] for r in results.values())
+        failed = [layer for layer, r in results.items() if r['error']]
+        print("\nSynchronized {0} of {1} layers, {2} rows changed".format(
+            len(results) - len(failed), len(results), changed))
+
+        return results
+
+    # -------------------------------------------------------------------------------
+    # Load layer into the staging schema and apply the differences to the live table
+    #
+    def sync_layer(self, layer):
+        result = {'I': 0, 'U': 0, 'D': 0, 'created': False, 'error': ''}
+        schema = self.filegdb.table_schemas.get(layer, self.filegdb.default_schema)
+
+        cmd = self.postgis.ogr2ogr_command(
+            self.filegdb, layer, table="{0}.{1}".format(self.staging_schema, layer))
+        try:
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  universal_newlines=True, env=self.postgis.ogr2ogr_env())
+        except Exception as error:
+            result['error'] = "{0}: {1}".format(type(error).__name__, error)
+            return result
+
+        if proc.returncode != 0:
+            result['error'] = proc.stderr.strip() or "ogr2ogr exit code {}".format(proc.returncode)
+            return result
+
+        return self.apply_staging(layer, schema, KEY, result)
+
+    # -------------------------------------------------------------------------------
+    # Copy lookup table values into the staging schema and apply the differences
+    # The serial id is not compared, rows are matched on the code field
+    #
+    def sync_lookup_table(self, table, schema=None):
+        schema = schema or self.filegdb.lookup_schema
+        result = {'I': 0, 'U': 0, 'D': 0, 'created': False, 'error': ''}
+        field, field_type, values = self.filegdb.lookup_tables[table]
+
+        loader = CopyLoader(self.postgis.conn_string, None, None, schema=self.staging_schema)
+        rows = [(oid, code, desc) for oid, (code, desc) in enumerate(values, 1)]
+        returncode, error = loader.load_table(table, lookup_table_columns(field, field_type), rows)
+        if returncode != 0:
+            result['error'] = error
+            return result
+
+        return self.apply_staging(table, schema, field, result, exclude=[KEY])
+
+    # -------------------------------------------------------------------------------
+    # Apply the differences of the staging table to the live table,
+    # or move the staging table in place if the live table does not exist
+    #
+    def apply_staging(self, table, schema, key_column, result, exclude=()):
+        staging = sql.Identifier(self.staging_schema, table)
+        live = sql.Identifier(schema, table)
+
+        conn = psycopg2.connect(self.postgis.conn_string)
+        try:
+            with conn.cursor() as cursor:
+                live_columns = self.get_columns(cursor, schema, table)
+
+                if not live_columns:
+                    cursor.execute(sql.SQL('ALTER TABLE {0} SET SCHEMA {1}').format(
+                        staging, sql.Identifier(schema)))
+                    result['created'] = True
+                else:
+                    staging_columns = self.get_columns(cursor, self.staging_schema, table)
+                    columns = [c for c in staging_columns if c in live_columns and c not in exclude]
+
+                    for statement in delta_statements(staging, live, columns, key_column):
+                        cursor.execute(statement)
+
+                    cursor.execute('SELECT op, count(*) FROM fgdb2postgis_delta GROUP BY op')
+                    for op, count in cursor.fetchall():
+                        result[op] = count
+
+                    cursor.execute(sql.SQL('DROP TABLE {}').format(staging))
+
+            conn.commit()
+        except psycopg2.Error as error:
+            conn.rollback()
+            result['error'] = str(error).strip()
+        finally:
+            conn.close()
+
+        return result
+
+    def get_columns(self, cursor, schema, table):
+        cursor.execute(
+            'SELECT column_name FROM information_schema.columns '
+            'WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position',
+            (schema, table))
+        return [row[0] for row in cursor.fetchall()]
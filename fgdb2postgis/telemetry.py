@@ -0,0 +1,166 @@
+##
+# telemetry.py
+#
+# Description: Record structured performance events of the conversion phases and layers
+#              Events are kept in memory and written as json lines to the metrics file
+#              Each event carries duration, rows, bytes, arcpy calls, sql statements
+#              and the peak resident memory of the process
+# Author: George Ioannou
+# Copyright: Cartologic 2017-2020
+#
+##
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# -------------------------------------------------------------------------------
+# Peak resident set size of the process in bytes (None if not available)
+#
+def peak_rss():
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                    'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+                    'PagefileUsage', 'PeakPagefileUsage')]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+
+    return None
+
+
+def new_event(phase, layer=None):
+    return {
+        'time': datetime.now().isoformat(timespec='milliseconds'),
+        'phase': phase,
+        'layer': layer,
+        'duration': None,
+        'rows': None,
+        'bytes': None,
+        'arcpy_calls': None,
+        'statements': None,
+        'sql_time': None,
+        'peak_rss': None
+    }
+
+
+class Metrics:
+    def __init__(self, metrics_file=None):
+        self.metrics_file = metrics_file
+        self.file = open(metrics_file, 'a', encoding='utf-8') if metrics_file else None
+        self.catalog = None
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def arcpy_calls(self):
+        return self.catalog.arcpy_calls if self.catalog is not None else 0
+
+    def stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+
+        return self.local.stack
+
+    # -------------------------------------------------------------------------------
+    # Time a phase, counters added while it runs are accumulated in its event
+    #
+    @contextmanager
+    def phase(self, phase, layer=None):
+        event = new_event(phase, layer)
+        arcpy_calls = self.arcpy_calls()
+        start = time.time()
+
+        self.stack().append(event)
+        try:
+            yield event
+        finally:
+            self.stack().pop()
+            event['duration'] = round(time.time() - start, 4)
+            event['arcpy_calls'] = self.arcpy_calls() - arcpy_calls
+            self.emit(event)
+
+    def run(self, phase, func, *args):
+        with self.phase(phase):
+            return func(*args)
+
+    # add counters (rows, bytes, statements, sql_time) to the running phases
+    def add(self, **counters):
+        for event in self.stack():
+            for key, value in counters.items():
+                if value is not None:
+                    event[key] = round((event[key] or 0) + value, 4)
+
+    # -------------------------------------------------------------------------------
+    # Record a finished unit of work (e.g. a layer load)
+    #
+    def event(self, phase, layer=None, **values):
+        event = new_event(phase, layer)
+        event.update(values)
+        self.add(rows=event['rows'], bytes=event['bytes'],
+                 statements=event['statements'], sql_time=event['sql_time'])
+        self.emit(event)
+
+    def emit(self, event):
+        event['peak_rss'] = peak_rss()
+
+        with self.lock:
+            self.events.append(event)
+            if self.file:
+                self.file.write(json.dumps(event, default=str) + '\n')
+                self.file.flush()
+
+    # -------------------------------------------------------------------------------
+    # Print the slowest phases and layers
+    #
+    def summary(self, limit=10):
+        phases = [e for e in self.events if e['layer'] is None]
+        layers = [e for e in self.events if e['layer'] is not None]
+
+        print("\nSlowest phases:")
+        print(" {0:<40} {1:>10} {2:>12} {3:>8} {4:>10}".format(
+            'phase', 'seconds', 'rows', 'arcpy', 'sql'))
+        for e in sorted(phases, key=lambda e: -e['duration'])[:limit]:
+            print(" {0:<40} {1:>10.2f} {2:>12} {3:>8} {4:>10}".format(
+                e['phase'], e['duration'], e['rows'] or '', e['arcpy_calls'] or '', e['statements'] or ''))
+
+        if layers:
+            print("\nSlowest layers:")
+            print(" {0:<40} {1:<14} {2:>10} {3:>12} {4:>14}".format(
+                'layer', 'phase', 'seconds', 'rows', 'bytes'))
+            for e in sorted(layers, key=lambda e: -(e['duration'] or 0))[:limit]:
+                print(" {0:<40} {1:<14} {2:>10.2f} {3:>12} {4:>14}".format(
+                    e['layer'], e['phase'], e['duration'] or 0, e['rows'] or '', e['bytes'] or ''))
+
+        rss = peak_rss()
+        if rss:
+            print("\nPeak memory: {:.1f} MB".format(rss / 1048576))
+
+        if self.metrics_file:
+            print("Metrics: {}".format(self.metrics_file))
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
@@ -17,6 +17,10 @@ setup(
         'ruamel.yaml>=0.16.10',
         'awesome-slugify>=1.6.5'
     ],
+    extras_require={
+        'reproject': ['pyproj>=2.6.1'],
+        'gdal': ['GDAL>=3.6']
+    },
     license="GNU",
     keywords='fgdb2postgis',
     classifiers=[
@@ -24,9 +28,13 @@ setup(
         'Intended Audience :: Science/Research',
         'Programming Language :: Python',
         'Topic :: Scientific/Engineering :: GIS',
-        'Operating System :: Microsoft :: Windows'
+        'Operating System :: Microsoft :: Windows',
+        'Operating System :: POSIX :: Linux'
     ],
     entry_points={
-        'console_scripts': ['fgdb2postgis = fgdb2postgis.__main__:main']
+        'console_scripts': [
+            'fgdb2postgis = fgdb2postgis.__main__:main',
+            'fgdb2postgis-batch = fgdb2postgis.batch:main'
+        ]
     },
 )
@@ -0,0 +1,71 @@
+import subprocess
+import sys
+from contextlib import redirect_stdout
+
+from benchmarks import synthetic_arcpy
+
+sys.modules.setdefault('arcpy', synthetic_arcpy)
+
+from fgdb2postgis import batch  # noqa: E402
+from fgdb2postgis.__main__ import Options, parse_options  # noqa: E402
+from fgdb2postgis.postgis import PostGIS  # noqa: E402
+
+
+def test_expand_workspaces(tmp_path):
+    for name in ('b.gdb', 'a.gdb', 'notes.txt'):
+        (tmp_path / name).mkdir()
+
+    pattern = str(tmp_path / '*.gdb')
+    workspaces = batch.expand_workspaces([pattern, str(tmp_path / 'a.gdb'), 'missing.gdb'])
+    assert workspaces == [str(tmp_path / 'a.gdb'), str(tmp_path / 'b.gdb'), 'missing.gdb']
+
+
+def test_target_names():
+    workspaces = ['data/Attica Region.gdb', 'other/attica-region.gdb', 'data/' + 'x' * 80 + '.gdb']
+
+    names = batch.target_names(workspaces, 'database', 'Reg_')
+    assert names['data/Attica Region.gdb'] == 'reg_attica_region'
+    assert names['other/attica-region.gdb'] == 'reg_attica_region_2'
+    assert len(names[workspaces[2]]) == 63
+
+    # prefixed tool schemas must fit in an identifier
+    names = batch.target_names(workspaces, 'schema')
+    assert len(names[workspaces[2]] + '_fgdb2postgis_reproject') <= 63
+
+
+def test_target_options():
+    options = parse_options([('-p', 'gis'), ('--jobs', '4'), ('--monitor', '5'), ('--bulk', '')])
+    assert options == Options(pgdb='gis', jobs=4, monitor=5.0, bulk=True)
+    assert batch.connections_needed(options) == 8
+
+    target = batch.target_options(options, 'a.gdb', 'attica', 'database')
+    assert (target.fgdb, target.pgdb, target.schema_prefix, target.jobs) == ('a.gdb', 'attica', '', 4)
+
+    target = batch.target_options(options, 'a.gdb', 'attica', 'schema')
+    assert (target.pgdb, target.schema_prefix) == ('gis', 'attica_')
+
+
+def test_summary(capsys):
+    results = [
+        {'workspace': 'a.gdb', 'target': 'a', 'status': 'ok', 'error': None, 'duration': 1.5,
+         'layers': 3, 'failed_layers': []},
+        {'workspace': 'b.gdb', 'target': 'b', 'status': 'failed', 'error': None, 'duration': 2,
+         'layers': 2, 'failed_layers': ['roads']}
+    ]
+    assert batch.summary(results, 3.5) == 1
+
+    output = capsys.readouterr().out
+    assert 'Failed layers: roads' in output
+    assert '1 of 2 geodatabases converted' in output
+
+
+def test_ogr2ogr_output_goes_to_the_log(tmp_path):
+    postgis = PostGIS('localhost', 5432, 'postgres', '', 'gis', 'EPSG:3857')
+
+    with open(str(tmp_path / 'a.gdb.log'), 'w', encoding='utf-8') as log, redirect_stdout(log):
+        print('Loading database tables ...')
+        output = postgis.ogr2ogr_output()
+        subprocess.call([sys.executable, '-c', 'print("ogr2ogr progress")'], stdout=output, stderr=output)
+
+    assert output is log
+    assert (tmp_path / 'a.gdb.log').read_text() == 'Loading database tables ...\nogr2ogr progress\n'
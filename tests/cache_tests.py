@@ -0,0 +1,105 @@
+import sys
+from os import path
+
+import pytest
+
+from benchmarks import synthetic_arcpy
+from benchmarks.synthetic_gdbtable import write_catalog, write_items
+
+sys.modules.setdefault('arcpy', synthetic_arcpy)
+
+from fgdb2postgis.__main__ import Options, metadata_tasks  # noqa: E402
+from fgdb2postgis.cache import schema_items  # noqa: E402
+from fgdb2postgis.filegdb import FileGDB  # noqa: E402
+from fgdb2postgis.scheduler import Scheduler  # noqa: E402
+
+SQL_FILES = ['create_schemas.sql', 'create_indexes.sql', 'create_constraints.sql', 'split_schemas.sql']
+
+
+# GDB_Items of the synthetic catalog, a definition per layer, relationship class and domain
+def synthetic_items(changed=()):
+    catalog = synthetic_arcpy.get_catalog()
+    names = list(catalog.layers) + list(catalog.relationships) + [domain.name for domain in catalog.domains]
+
+    return [(name, '\\{}'.format(name), '<Item><Name>{0}</Name><Version>{1}</Version></Item>'.format(
+        name, 2 if name in changed else 1)) for name in names]
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    synthetic_arcpy.configure(datasets=2, layers=3, root_layers=1, tables=2, rows=20)
+    workspace = str(tmp_path / 'synthetic.gdb')
+    write_catalog(workspace, [])
+    write_items(workspace, synthetic_items())
+
+    return workspace
+
+
+def run(workspace, **options):
+    filegdb = FileGDB(workspace, 'EPSG:3857', cache=True)
+    scheduler = Scheduler()
+    metadata_tasks(scheduler, filegdb, Options(fgdb=workspace, cache=True, **options))
+    scheduler.run()
+
+    sql = {}
+    for name in SQL_FILES:
+        with open(path.join(filegdb.sqlfolder_path, name), encoding='utf-8') as f:
+            sql[name] = f.read()
+
+    return filegdb, sql
+
+
+def test_schema_items(workspace):
+    items = schema_items(workspace)
+    assert sorted(items) == sorted(name.lower() for name, item_path, definition in synthetic_items())
+    assert schema_items(path.dirname(workspace)) is None
+
+
+def test_warm_cache_restores_catalog_and_model(workspace):
+    cold, cold_sql = run(workspace)
+    assert not cold.restored and cold.catalog.arcpy_calls > 0
+    assert path.exists(cold.cache_path)
+
+    warm, warm_sql = run(workspace)
+    assert warm.restored
+    assert warm.catalog.arcpy_calls == 0
+    assert warm_sql == cold_sql
+    assert warm.lookup_tables == cold.lookup_tables
+    assert warm.table_schemas == cold.table_schemas
+
+
+def test_changed_layer_is_read_again(workspace):
+    cold, cold_sql = run(workspace)
+
+    write_items(workspace, synthetic_items(changed=['fc_1_2']))
+    changed, changed_sql = run(workspace)
+
+    # list calls (datasets, tables, root and dataset feature classes) and the changed layer only
+    assert not changed.restored
+    assert changed.catalog.arcpy_calls == 3 + 2 + 2
+    assert changed.catalog.state() == cold.catalog.state()
+    assert changed_sql == cold_sql
+
+
+def test_options_and_yaml_invalidate_the_model(workspace):
+    run(workspace)
+
+    # the catalog is restored, the layout processing counts the rows of the layers
+    clustered, sql = run(workspace, cluster='gist')
+    assert not clustered.restored
+    assert clustered.catalog.arcpy_calls == len(clustered.catalog.layers)
+    assert run(workspace, cluster='gist')[0].restored
+
+    with open(clustered.yamlfile_path, 'a', encoding='utf-8') as f:
+        f.write('\n# edited\n')
+    edited, sql = run(workspace)
+    assert not edited.restored and edited.catalog.arcpy_calls == 0
+
+
+def test_workspace_without_system_tables(tmp_path):
+    synthetic_arcpy.configure(datasets=1, layers=2, root_layers=0, tables=1, rows=10)
+    workspace = str(tmp_path / 'other.gdb')
+
+    run(workspace)
+    warm, sql = run(workspace)
+    assert warm.restored and warm.catalog.arcpy_calls == 0
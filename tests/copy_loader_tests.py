@@ -0,0 +1,171 @@
+import os
+import struct
+from datetime import datetime
+
+import pytest
+
+from fgdb2postgis.copy_loader import (COPY_HEADER, COPY_TRAILER, CopyLoader,
+                                      CopyStream, encode_row, encode_timestamp,
+                                      lookup_table_columns, table_columns, to_ewkb)
+
+
+POLYGON_WKB = (b'\x01' + struct.pack('<II', 3, 1) + struct.pack('<I', 4) +
+               struct.pack('<8d', 0, 0, 1, 0, 1, 1, 0, 0))
+
+
+class FakeSource:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def describe(self, layer):
+        fields = [
+            ('OBJECTID', 'OID', 4),
+            ('Shape', 'Geometry', 0),
+            ('NAME', 'String', 20),
+            ('CODE', 'SmallInteger', 2),
+            ('AREA', 'Double', 8)
+        ]
+        return fields, ('Polygon', False, False)
+
+    def rows(self, layer, cursor_fields, where=None):
+        assert cursor_fields == ['OID@', 'SHAPE@WKB', 'NAME', 'CODE', 'AREA']
+        return iter(self._rows)
+
+
+def read_rows(data):
+    # decode binary COPY data into lists of raw field values
+    assert data.startswith(COPY_HEADER)
+    assert data.endswith(COPY_TRAILER)
+    offset = len(COPY_HEADER)
+    rows = []
+    while True:
+        (count,) = struct.unpack_from('!h', data, offset)
+        offset += 2
+        if count == -1:
+            break
+        row = []
+        for _ in range(count):
+            (length,) = struct.unpack_from('!i', data, offset)
+            offset += 4
+            if length == -1:
+                row.append(None)
+            else:
+                row.append(data[offset:offset + length])
+                offset += length
+        rows.append(row)
+    return rows
+
+
+def test_table_columns_match_ogr2ogr_layout():
+    fields, geometry = FakeSource([]).describe('parcels')
+    columns = table_columns(fields, geometry, 2100)
+
+    assert [(c[0], c[1]) for c in columns] == [
+        ('id', 'SERIAL'),
+        ('geom', 'geometry(MultiPolygon,2100)'),
+        ('NAME', 'varchar(20)'),
+        ('CODE', 'smallint'),
+        ('AREA', 'double precision')
+    ]
+
+
+def test_xml_and_unsupported_fields(capsys):
+    fields = [('OBJECTID', 'OID', 4), ('DOC', 'XML', 0), ('IMAGE', 'Raster', 0)]
+    columns = table_columns(fields, None, 2100, 'scans')
+
+    assert [(c[0], c[1]) for c in columns] == [('id', 'SERIAL'), ('DOC', 'varchar')]
+    assert 'scans.IMAGE of type Raster' in capsys.readouterr().out
+
+
+def test_describe_errors_fail_the_layer():
+    class MissingSource(FakeSource):
+        def describe(self, layer):
+            raise IOError('cannot open {}'.format(layer))
+
+    assert CopyLoader('', MissingSource([]), 2100).load_layer('parcels') == (-1, 'OSError: cannot open parcels')
+
+
+def test_lookup_table_rows():
+    columns = lookup_table_columns('Code', 'SmallInteger')
+    stream = CopyStream(columns, iter([(1, 10, 'Paved'), (2, 20, None)]), 1 << 20)
+
+    assert [(c[0], c[1]) for c in columns] == [
+        ('id', 'SERIAL'), ('Code', 'smallint'), ('Description', 'varchar')]
+    assert read_rows(stream.read()) == [
+        [struct.pack('!i', 1), struct.pack('!h', 10), b'Paved'],
+        [struct.pack('!i', 2), struct.pack('!h', 20), None]]
+
+
+def test_to_ewkb_promotes_polygon_and_sets_srid():
+    ewkb = to_ewkb(POLYGON_WKB, 2100)
+    code, srid, parts = struct.unpack_from('<IiI', ewkb, 1)
+
+    assert code == 0x20000006
+    assert srid == 2100
+    assert parts == 1
+    assert ewkb[13:] == POLYGON_WKB[:1] + struct.pack('<I', 3) + POLYGON_WKB[5:]
+
+
+def test_to_ewkb_keeps_iso_z_flag():
+    wkb = b'\x01' + struct.pack('<I', 1001) + struct.pack('<3d', 1, 2, 3)
+    ewkb = to_ewkb(wkb, 4326)
+
+    assert struct.unpack_from('<Ii', ewkb, 1) == (0x80000001 | 0x20000000, 4326)
+    assert ewkb[9:] == wkb[5:]
+
+
+def test_encode_timestamp():
+    assert encode_timestamp(datetime(2000, 1, 2)) == struct.pack('!iq', 8, 86400 * 1000000)
+
+
+def test_copy_stream_batches_by_bytes():
+    rows = [(i, POLYGON_WKB, 'name {}'.format(i), i % 3, None) for i in range(1, 101)]
+    columns = table_columns(*FakeSource(rows).describe('parcels'), srid=2100)
+    row_size = len(encode_row([c[3] for c in columns], rows[0]))
+
+    stream = CopyStream(columns, rows, batch_bytes=row_size * 10)
+    chunks = []
+    while True:
+        chunk = stream.read()
+        if not chunk:
+            break
+        chunks.append(chunk)
+
+    assert len(chunks) == 11
+    assert all(len(chunk) < row_size * 12 for chunk in chunks)
+
+    decoded = read_rows(b''.join(chunks))
+    assert len(decoded) == 100
+    assert stream.row_count == 100
+    assert struct.unpack('!i', decoded[0][0]) == (1,)
+    assert decoded[99][2] == b'name 100'
+    assert decoded[5][4] is None
+
+
+def test_copy_stream_reports_row_errors():
+    rows = [(1, POLYGON_WKB, 'ok', 1, 1.0), (2, b'\x01' + struct.pack('<I', 8), 'curve', 1, 1.0)]
+    columns = table_columns(*FakeSource(rows).describe('parcels'), srid=2100)
+
+    stream = CopyStream(columns, rows)
+    data = stream.read()
+
+    assert len(read_rows(data)) == 1
+    assert stream.errors[0][0] == 2
+
+
+@pytest.mark.skipif('FGDB2POSTGIS_TEST_DSN' not in os.environ,
+                    reason='FGDB2POSTGIS_TEST_DSN is not set')
+def test_copy_loader_postgis():
+    import psycopg2
+
+    dsn = os.environ['FGDB2POSTGIS_TEST_DSN']
+    rows = [(i, POLYGON_WKB, 'name {}'.format(i), i % 3, float(i)) for i in range(1, 1001)]
+    loader = CopyLoader(dsn, FakeSource(rows), 2100, batch_bytes=4096)
+
+    assert loader.load_layer('copy_loader_test') == (0, '')
+
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT count(*), max(id), min(ST_SRID(geom)), '
+                       'min(GeometryType(geom)) FROM "copy_loader_test"')
+        assert cursor.fetchone() == (1000, 1000, 2100, 'MULTIPOLYGON')
+        cursor.execute('DROP TABLE "copy_loader_test"')
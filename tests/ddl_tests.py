@@ -0,0 +1,182 @@
+from fgdb2postgis.ddl import MAX_IDENTIFIER, DDLModel
+from fgdb2postgis.ddl_executor import DDLExecutor, DDLGraph
+
+
+def test_objects_are_kept_once():
+    model = DDLModel()
+    first = model.add_index('roads', 'CODE')
+    second = model.add_index('roads', 'CODE')
+    model.add_foreign_key('roads', 'CODE', 'codes_lut', 'Code', 'lookup_tables')
+    model.add_foreign_key('roads', 'CODE', 'codes_lut', 'Code', 'lookup_tables')
+
+    assert first is second
+    assert model.statements('create_indexes.sql') == ['CREATE UNIQUE INDEX "roads_CODE_idx" ON "roads" ("CODE")']
+    assert model.statements('create_constraints.sql') == [
+        'ALTER TABLE "roads" ADD CONSTRAINT "roads_codes_lut" FOREIGN KEY ("CODE") '
+        'REFERENCES "lookup_tables"."codes_lut" ("Code") NOT VALID']
+
+
+def test_names_do_not_collide():
+    model = DDLModel()
+    prefix = 'transportation_network_segments_'
+    fk1 = model.add_foreign_key(prefix + 'primary', 'ROUTE_ID', prefix + 'routes_master', 'ROUTE_ID')
+    fk2 = model.add_foreign_key(prefix + 'primary', 'ROUTE_ID', prefix + 'routes_history', 'ROUTE_ID')
+    # same tables, other column
+    fk3 = model.add_foreign_key(prefix + 'primary', 'ALT_ROUTE_ID', prefix + 'routes_master', 'ROUTE_ID')
+
+    names = [fk1.name, fk2.name, fk3.name]
+    assert len(set(names)) == 3
+    assert all(len(name.encode('utf-8')) <= MAX_IDENTIFIER for name in names)
+
+    # names depend on the object only, not on the model instance
+    again = DDLModel().add_foreign_key(prefix + 'primary', 'ROUTE_ID', prefix + 'routes_master', 'ROUTE_ID')
+    assert again.name == fk1.name
+
+
+def test_render(tmp_path):
+    model = DDLModel()
+    model.add_schema('public')
+    model.add_schema('transport')
+    model.add_move('roads', 'transport')
+    model.add_relation('routes', 'ROUTE_ID', 'roads', 'ROUTE_ID')
+    model.render(str(tmp_path))
+
+    assert (tmp_path / 'create_schemas.sql').read_text() == (
+        'CREATE EXTENSION IF NOT EXISTS postgis;\n'
+        'DROP SCHEMA IF EXISTS "transport" CASCADE;\n'
+        'CREATE SCHEMA "transport";\n')
+    assert (tmp_path / 'split_schemas.sql').read_text() == 'ALTER TABLE "roads" SET SCHEMA "transport";\n'
+    assert 'NOT EXISTS (SELECT 1 FROM "routes" o WHERE o."ROUTE_ID" = d."ROUTE_ID")' in (
+        tmp_path / 'find_data_errors.sql').read_text()
+
+
+def test_orphan_statements():
+    model = DDLModel()
+    model.add_relation('routes', 'ROUTE_ID', 'roads', 'ROUTE_CODE')
+    rel = next(iter(model.relations.values()))
+
+    check = model.orphan_check(rel, samples=5)
+    assert check.startswith('INSERT INTO "fgdb2postgis_report"."orphans"')
+    assert "SELECT 'routes', 'ROUTE_ID', 'roads', 'ROUTE_CODE', count(*)" in check
+    assert '(array_agg(DISTINCT d."ROUTE_CODE"::text))[1:5]' in check
+    assert 'd."ROUTE_CODE" IS NOT NULL AND NOT EXISTS' in check
+
+    # the missing keys of the origin are the foreign keys of the destination
+    insert = model.orphan_fix(rel, 'insert')
+    assert 'INSERT INTO "routes" ("ROUTE_ID")\n    SELECT DISTINCT d."ROUTE_CODE" FROM "roads" d' in insert
+    assert 'master.id' not in insert
+    assert 'UPDATE "roads" d SET "ROUTE_CODE" = NULL' in model.orphan_fix(rel, 'nullify')
+    assert model.statements('fix_data_errors.sql') == [insert]
+
+
+def test_orphaned_foreign_keys_are_not_validated():
+    model = DDLModel()
+    model.add_foreign_key('roads', 'ROUTE_CODE', 'routes', 'ROUTE_ID')
+    model.add_foreign_key('bridges', 'ROUTE_CODE', 'routes', 'ROUTE_ID')
+
+    graph = DDLGraph(novalidate=[('roads', 'ROUTE_CODE')])
+    for statement in model.statements('create_constraints.sql'):
+        graph.add(statement, 'create_constraints.sql')
+
+    validated = [stmt.tables for stmt in graph.statements if stmt.kind == 'validate']
+    assert validated == [{'bridges'}]
+
+
+def test_cluster_and_brin():
+    model = DDLModel()
+    model.add_cluster('roads', 'geom', 'hilbert')
+    model.add_cluster('rivers', 'geom', 'gist')
+    model.add_index('roads', 'geom', unique=False, method='brin')
+
+    statements = model.statements('cluster_layers.sql')
+    assert statements[0].startswith('CREATE OR REPLACE FUNCTION public.fgdb2postgis_hilbert(')
+    assert 'EXECUTE \'CLUSTER "roads" USING "roads_geom_hilbert_idx"\'' in statements[1]
+    assert statements[2] == 'CLUSTER "rivers" USING "rivers_geom_geom_idx"'
+    assert statements[3].startswith('DROP FUNCTION IF EXISTS public.fgdb2postgis_hilbert(')
+
+    # batch conversions into one database do not share the function
+    prefixed = DDLModel('attica_')
+    prefixed.add_cluster('roads', 'geom', 'hilbert')
+    assert prefixed.cluster_header()[0].startswith('CREATE OR REPLACE FUNCTION "attica_public".fgdb2postgis_hilbert(')
+    assert '"attica_public".fgdb2postgis_hilbert((ST_XMin' in prefixed.cluster_statement(prefixed.clusters['roads'])
+    assert prefixed.cluster_footer()[0].startswith('DROP FUNCTION IF EXISTS "attica_public".fgdb2postgis_hilbert(')
+
+    assert model.statements('create_indexes.sql') == ['CREATE INDEX "roads_geom_brin_idx" ON "roads" USING brin ("geom")']
+    graph = DDLGraph()
+    graph.add(model.statements('create_indexes.sql')[0], 'create_indexes.sql')
+    assert graph.statements[0].kind == 'index'
+
+
+def test_partitions():
+    model = DDLModel()
+    model.add_partition('parcels', 'range', 'CREATED', ['2010-01-01', '2015-01-01', '2020-01-01'])
+    model.add_partition('points', 'grid', 'geom', 1000, 4)
+    model.add_index('parcels', 'PARCEL_ID')
+    model.add_index('parcels', 'CREATED')
+    model.add_foreign_key('owners', 'PARCEL_ID', 'parcels', 'PARCEL_ID')
+    model.add_move('parcels', 'cadastre')
+    model.add_cluster('points', 'geom', 'gist')
+
+    assert model.partition_clause('parcels') == 'PARTITION BY RANGE ("CREATED")'
+    assert model.partition_clause('points') == (
+        'PARTITION BY HASH ((floor((ST_XMin("geom") + ST_XMax("geom")) / 2 / 1000)), '
+        '(floor((ST_YMin("geom") + ST_YMax("geom")) / 2 / 1000)))')
+    assert model.partition_children('parcels', 'public', unlogged=True) == [
+        'CREATE UNLOGGED TABLE "public"."parcels_p1" PARTITION OF "public"."parcels" '
+        "FOR VALUES FROM ('2010-01-01') TO ('2015-01-01')",
+        'CREATE UNLOGGED TABLE "public"."parcels_p2" PARTITION OF "public"."parcels" '
+        "FOR VALUES FROM ('2015-01-01') TO ('2020-01-01')",
+        'CREATE UNLOGGED TABLE "public"."parcels_default" PARTITION OF "public"."parcels" DEFAULT']
+    assert model.partition_children('points')[3] == (
+        'CREATE TABLE "points_p4" PARTITION OF "points" FOR VALUES WITH (MODULUS 4, REMAINDER 3)')
+
+    # unique indexes need the partition key, foreign keys a unique index
+    assert model.statements('create_indexes.sql') == [
+        'CREATE INDEX "parcels_PARCEL_ID_idx" ON "parcels" ("PARCEL_ID")',
+        'CREATE UNIQUE INDEX "parcels_CREATED_idx" ON "parcels" ("CREATED")']
+    assert model.statements('create_constraints.sql') == []
+    assert model.statements('split_schemas.sql') == [
+        'ALTER TABLE "{}" SET SCHEMA "cadastre"'.format(table)
+        for table in ('parcels', 'parcels_p1', 'parcels_p2', 'parcels_default')]
+    assert model.statements('cluster_layers.sql') == []
+
+
+class FailingExecutor(DDLExecutor):
+    def __init__(self, failing):
+        DDLExecutor.__init__(self, '', jobs=2)
+        self.failing = failing
+        self.executed = []
+
+    def execute(self, stmt, session):
+        self.executed.append(stmt.sql)
+        if stmt.sql in self.failing:
+            stmt.error = 'failed'
+        return stmt
+
+
+def test_dependents_of_failed_statements_are_skipped(capsys):
+    model = DDLModel()
+    model.add_index('routes', 'ROUTE_ID')
+    model.add_index('roads', 'ROAD_ID')
+    model.add_foreign_key('roads', 'ROUTE_CODE', 'routes', 'ROUTE_ID')
+    model.add_foreign_key('bridges', 'ROAD_ID', 'roads', 'ROAD_ID')
+    model.add_move('roads', 'transport')
+
+    graph = DDLGraph()
+    for sql_file in ('create_indexes.sql', 'create_constraints.sql', 'split_schemas.sql'):
+        for statement in model.statements(sql_file):
+            graph.add(statement, sql_file)
+
+    index = next(stmt for stmt in graph.statements if stmt.kind == 'index' and stmt.tables == {'routes'})
+    executor = FailingExecutor([index.sql])
+
+    assert executor.run(graph) == 1
+    skipped = [stmt for stmt in graph.statements if stmt.skipped]
+    assert [stmt.kind for stmt in skipped] == ['foreign_key', 'validate']
+    assert [stmt.error for stmt in skipped] == [
+        'dependency failed: create_indexes.sql', 'dependency failed: create_constraints.sql']
+    assert not any(stmt.sql in executor.executed for stmt in skipped)
+
+    # statements ordered after the failed ones still run
+    assert 'ALTER TABLE "roads" SET SCHEMA "transport"' in executor.executed
+    assert '1 failed, 2 skipped' in capsys.readouterr().out
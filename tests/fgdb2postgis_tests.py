@@ -1,13 +1,283 @@
+import multiprocessing
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import path
 
-from nose.tools import *
-import fgdb2postgis
+import pytest
 
-def setup():
-    print "SETUP!"
+from benchmarks import synthetic_arcpy
 
-def teardown():
-    print "TEAR DOWN!"
+sys.modules.setdefault('arcpy', synthetic_arcpy)
 
-def test_basic():
-    print "I RAN!"
-    
\ No newline at end of file
+from fgdb2postgis.__main__ import Options, metadata_tasks, parse_options  # noqa: E402
+from fgdb2postgis.catalog import oid_chunks  # noqa: E402
+from fgdb2postgis.copy_loader import ARCPY_LOCK, ArcpySource, CopyStream, table_columns  # noqa: E402
+from fgdb2postgis.filegdb import FileGDB  # noqa: E402
+from fgdb2postgis.postgis import PostGIS  # noqa: E402
+from fgdb2postgis.scheduler import Scheduler  # noqa: E402
+from fgdb2postgis.sync import DeltaSync  # noqa: E402
+
+
+@pytest.fixture
+def filegdb(tmp_path):
+    synthetic_arcpy.configure(datasets=2, layers=3, root_layers=1, tables=2, rows=20)
+
+    filegdb = FileGDB(str(tmp_path / 'synthetic.gdb'), 'EPSG:3857')
+    filegdb.open_files()
+    filegdb.process_domains()
+    filegdb.process_subtypes()
+    filegdb.process_relations()
+    filegdb.process_schemas()
+    filegdb.close_files()
+    return filegdb
+
+
+def read_sql(filegdb, name):
+    with open(path.join(filegdb.sqlfolder_path, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_yaml_maps_datasets_to_schemas(filegdb):
+    assert filegdb.schemas == ['Dataset_1', 'Dataset_2', 'lookup_tables']
+    assert filegdb.table_schemas['fc_2_3'] == 'Dataset_2'
+
+
+def test_lookup_tables(filegdb):
+    # three coded value domains, the range domain is skipped, one subtypes table per layer
+    domains = sorted(t for t in filegdb.lookup_tables if t.endswith('_lut'))
+    assert domains == ['Domain_1_lut', 'Domain_2_lut', 'Domain_3_lut']
+    assert len(filegdb.lookup_tables) == 3 + len(filegdb.catalog.all_layers())
+    assert filegdb.lookup_tables['fc_1_SUBTYPE_sub'] == (
+        'SUBTYPE', 'SmallInteger', [(1, 'Subtype 1'), (2, 'Subtype 2'), (3, 'Subtype 3')])
+
+
+def test_relations_and_constraints(filegdb):
+    indexes = read_sql(filegdb, 'create_indexes.sql')
+    constraints = read_sql(filegdb, 'create_constraints.sql')
+
+    assert 'ON "lookup_tables"."Domain_1_lut" ("Code")' in indexes
+    assert 'CREATE UNIQUE INDEX "table_1_TABLE_ID_idx" ON "table_1" ("TABLE_ID")' in indexes
+    assert constraints.count('REFERENCES "table_') == len(filegdb.catalog.list_relationships())
+
+
+def test_synthetic_rows_encode(filegdb):
+    source = ArcpySource(filegdb.workspace, 'EPSG:3857', 'EPSG:3857')
+    fields, geometry = source.describe('fc_1_1')
+    columns = table_columns(fields, geometry, 3857)
+    rows = source.rows('fc_1_1', [column[2] for column in columns])
+
+    stream = CopyStream(columns, rows, 1 << 20)
+    while stream.read():
+        pass
+
+    assert stream.row_count == 20
+    assert stream.errors == []
+
+
+def test_final_data_joins_every_domain_field(tmp_path):
+    synthetic_arcpy.configure(datasets=1, layers=1, root_layers=0, tables=0, rows=5,
+                              domains=40, domain_fields=30)
+
+    filegdb = FileGDB(str(tmp_path / 'synthetic.gdb'), 'EPSG:3857')
+    filegdb.open_files()
+    filegdb.process_domains()
+    filegdb.process_subtypes()
+    filegdb.process_schemas()
+    filegdb.process_views('table')
+    filegdb.close_files()
+
+    statements = filegdb.ddl.final_data['fc_1_1']
+    select = statements[0]
+    assert select.startswith('CREATE TABLE "final_data"."fc_1_1" AS')
+    assert '"lookup_tables"."fc_1_1_SUBTYPE_sub" t1 ON t0."SUBTYPE" = t1."SUBTYPE"' in select
+    assert 't31."Description" AS "STATUS_30"' in select
+    assert select.count('LEFT OUTER JOIN') == 31
+
+    assert any('PRIMARY KEY ("ogc_fid")' in s for s in statements)
+    assert statements[-1] == 'CREATE INDEX "fc_1_1_geom_geom_idx" ON "final_data"."fc_1_1" USING gist ("geom")'
+
+
+def test_final_data_materialized_views(filegdb):
+    filegdb.open_files()
+    filegdb.process_views('matview')
+    filegdb.close_files()
+
+    statements = filegdb.ddl.final_data['table_1']
+    assert statements[0].startswith('CREATE MATERIALIZED VIEW "final_data"."table_1" AS')
+    assert 'CREATE UNIQUE INDEX "table_1_ogc_fid_idx" ON "final_data"."table_1" ("ogc_fid")' in statements
+    assert 'REFRESH MATERIALIZED VIEW CONCURRENTLY "final_data"."table_1"' in filegdb.ddl.final_data_refresh()
+
+
+def test_layout_of_feature_classes(filegdb):
+    filegdb.open_files()
+    filegdb.process_layout('hilbert', 20)
+    filegdb.close_files()
+
+    feature_classes = [layer for layer in filegdb.catalog.all_layers() if not layer.startswith('table_')]
+    assert list(filegdb.ddl.clusters) == sorted(feature_classes)
+    assert 'USING brin ("geom")' in read_sql(filegdb, 'create_indexes.sql')
+    assert 'CLUSTER "fc_1_1" USING "fc_1_1_geom_hilbert_idx"' in read_sql(filegdb, 'cluster_layers.sql')
+
+
+def test_sync_loads_the_staging_tables_with_ogr2ogr():
+    assert parse_options([('-p', 'gis'), ('--sync', '')]).sync
+
+    with pytest.raises(SystemExit):
+        parse_options([('-p', 'gis'), ('--sync', ''), ('--engine', 'gdbtable')])
+
+
+def test_arcpy_reads_run_one_at_a_time(filegdb, monkeypatch):
+    active = []
+    peak = []
+    enter, exit = synthetic_arcpy.SearchCursor.__enter__, synthetic_arcpy.SearchCursor.__exit__
+
+    def counting_enter(cursor):
+        active.append(cursor)
+        peak.append(len(active))
+        return enter(cursor)
+
+    def counting_exit(cursor, *args):
+        active.remove(cursor)
+        return exit(cursor, *args)
+
+    monkeypatch.setattr(synthetic_arcpy.SearchCursor, '__enter__', counting_enter)
+    monkeypatch.setattr(synthetic_arcpy.SearchCursor, '__exit__', counting_exit)
+    source = ArcpySource(filegdb.workspace, 'EPSG:3857', 'EPSG:3857')
+
+    def read(layer):
+        rows = []
+        for row in source.rows(layer, ['OID@']):
+            time.sleep(0.001)
+            rows.append(row)
+        return rows
+
+    layers = [layer for layer, rows in filegdb.list_layers()]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert all(len(rows) == 20 for rows in executor.map(read, layers))
+    assert max(peak) == 1
+
+    # a stream closed before the end of the rows releases arcpy
+    fields, geometry = source.describe('fc_1_1')
+    columns = table_columns(fields, geometry, 3857)
+    stream = CopyStream(columns, source.rows('fc_1_1', [column[2] for column in columns]), batch_bytes=1)
+    stream.read()
+    stream.close()
+    assert ARCPY_LOCK.acquire(blocking=False)
+    ARCPY_LOCK.release()
+
+
+def test_sync_reports_a_missing_ogr2ogr(filegdb, monkeypatch):
+    def run(cmd, **kwargs):
+        raise FileNotFoundError("No such file or directory: 'ogr2ogr'")
+
+    monkeypatch.setattr(subprocess, 'run', run)
+    sync = DeltaSync(PostGIS('localhost', 5432, 'postgres', '', 'gis', 'EPSG:3857'), filegdb)
+    assert sync.sync_layer('fc_1_1')['error'] == "FileNotFoundError: No such file or directory: 'ogr2ogr'"
+
+
+def test_oid_chunks():
+    assert oid_chunks(1, 100, 100, 30) == [(1, 26), (26, 51), (51, 76), (76, 101)]
+    # sparse ids, the ranges still cover min to max
+    assert oid_chunks(5, 1000, 10, 4) == [(5, 337), (337, 669), (669, 1001)]
+
+
+def test_chunks_read_the_rows_of_a_serial_load(filegdb):
+    assert filegdb.catalog.layer_chunks('fc_1_1', 20) == []
+
+    chunks = filegdb.catalog.layer_chunks('fc_1_1', 6)
+    assert chunks[0] == '"OBJECTID" >= 1 AND "OBJECTID" < 6'
+    assert len(chunks) == 4
+
+    source = ArcpySource(filegdb.workspace, 'EPSG:3857', 'EPSG:3857')
+    fields = ['OID@', 'NAME', 'SHAPE@WKB']
+    serial = list(source.rows('fc_1_1', fields))
+    chunked = [row for where in chunks for row in source.rows('fc_1_1', fields, where)]
+    assert chunked == serial
+
+
+def test_ogr2ogr_chunk_commands(filegdb):
+    postgis = PostGIS('localhost', 5432, 'postgres', '', 'gis', 'EPSG:3857')
+
+    create = postgis.ogr2ogr_command(filegdb, 'fc_1_1', where='"OBJECTID" < 1', create=True)
+    assert '-overwrite' in create and 'SPATIAL_INDEX=NO' in create
+    assert create[create.index('-where') + 1] == '"OBJECTID" < 1'
+
+    # chunks append with their source ids and never truncate the table
+    append = postgis.ogr2ogr_command(filegdb, 'fc_1_1', where=filegdb.catalog.layer_chunks('fc_1_1', 6)[1],
+                                     append=True)
+    assert '-preserve_fid' in append and '-append' in append
+    assert '-overwrite' not in append and 'OGR_TRUNCATE' not in append
+
+
+def test_partitioned_table_errors_fail_their_layer_only(filegdb, monkeypatch):
+    def describe(source, layer):
+        raise ImportError('No module named arcpy')
+
+    monkeypatch.setattr(ArcpySource, 'describe', describe)
+    monkeypatch.setattr(PostGIS, 'load_layer', lambda postgis, filegdb, layer, *args, **kwargs: (0, ''))
+    filegdb.ddl.add_partition('fc_1_1', 'hash', 'id', None, 2)
+
+    results = PostGIS('localhost', 5432, 'postgres', '', 'gis', 'EPSG:3857').load_layers(filegdb, 2)
+    assert results.pop('fc_1_1') == {'rows': 20, 'returncode': -1, 'error': 'ImportError: No module named arcpy'}
+    assert results and all(result['returncode'] == 0 for result in results.values())
+
+
+def test_partitions_from_yaml(tmp_path):
+    synthetic_arcpy.configure(datasets=1, layers=2, root_layers=0, tables=1, rows=20)
+    with open(str(tmp_path / 'synthetic.gdb.yml'), 'w', encoding='utf-8') as f:
+        f.write('Schemas: [Dataset_1]\n'
+                'FeatureDatasets:\n  Dataset_1: [Dataset_1]\n'
+                'Partitions:\n'
+                '  fc_1_1: {list: SUBTYPE}\n'
+                '  fc_1_2: {range: CREATED, bounds: [2020-01-01, 2020-07-01, 2021-01-01]}\n'
+                '  table_1: {hash: OBJECTID, partitions: 4}\n'
+                '  missing: {hash: OBJECTID}\n')
+
+    filegdb = FileGDB(str(tmp_path / 'synthetic.gdb'), 'EPSG:3857')
+
+    # the gdbtable engine can not load the rows of range and list partitions
+    with pytest.raises(SystemExit):
+        metadata_tasks(Scheduler(), filegdb, Options(fgdb=filegdb.workspace, engine='gdbtable'))
+    metadata_tasks(Scheduler(), filegdb, Options(fgdb=filegdb.workspace, engine='gdbtable', reproject='server'))
+
+    filegdb.open_files()
+    filegdb.process_partitions()
+
+    partitions = filegdb.ddl.partitions
+    assert list(partitions) == ['fc_1_1', 'fc_1_2', 'table_1']
+    assert partitions['fc_1_1'].values == [1, 2, 3]
+    assert partitions['fc_1_1'].filters[-1] == '"SUBTYPE" IS NULL OR "SUBTYPE" NOT IN (1, 2, 3)'
+    assert partitions['fc_1_2'].filters[0] == '"CREATED" >= date \'2020-01-01\' AND "CREATED" < date \'2020-07-01\''
+    assert (partitions['table_1'].column, partitions['table_1'].children) == (
+        'id', ['table_1_p1', 'table_1_p2', 'table_1_p3', 'table_1_p4'])
+
+
+def test_metadata_tasks_write_the_serial_sql_files(filegdb, tmp_path):
+    (tmp_path / 'scheduled').mkdir()
+    scheduled = FileGDB(str(tmp_path / 'scheduled' / 'synthetic.gdb'), 'EPSG:3857')
+    scheduler = Scheduler()
+    tasks = metadata_tasks(scheduler, scheduled, Options(fgdb=scheduled.workspace))
+    scheduler.run()
+
+    assert tasks[:4] == ['scan', 'open_files', 'process_schemas', 'write_schemas']
+    for name in ('create_schemas.sql', 'create_indexes.sql', 'create_constraints.sql', 'split_schemas.sql'):
+        assert read_sql(scheduled, name) == read_sql(filegdb, name)
+
+
+# the workers inherit the synthetic arcpy module of the test process
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='synthetic arcpy needs fork')
+def test_parallel_scan_matches_the_serial_scan(filegdb, tmp_path):
+    (tmp_path / 'parallel').mkdir()
+    parallel = FileGDB(str(tmp_path / 'parallel' / 'synthetic.gdb'), 'EPSG:3857', jobs=3)
+    scheduler = Scheduler()
+    metadata_tasks(scheduler, parallel, Options(fgdb=parallel.workspace, jobs=3))
+    scheduler.run()
+
+    assert parallel.catalog.state() == filegdb.catalog.state()
+    assert list(parallel.catalog.layers) == list(filegdb.catalog.layers)
+    assert list(parallel.catalog.relationships) == list(filegdb.catalog.relationships)
+    assert parallel.catalog.arcpy_calls == filegdb.catalog.arcpy_calls
+    for name in ('create_schemas.sql', 'create_indexes.sql', 'create_constraints.sql', 'split_schemas.sql'):
+        assert read_sql(parallel, name) == read_sql(filegdb, name)
@@ -0,0 +1,231 @@
+from os import path
+
+import pytest
+
+from fgdb2postgis.catalog import Catalog
+from fgdb2postgis.filegdb import FileGDB
+from fgdb2postgis.gdb_items import GdbItemsCatalog, item_kind, parse_domain, parse_layer, parse_relationship
+
+NAMESPACES = ('xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+              'xmlns:xs="http://www.w3.org/2001/XMLSchema" '
+              'xmlns:typens="http://www.esri.com/schemas/ArcGIS/10.1"')
+
+DATASET = """<DEFeatureDataset xsi:type="typens:DEFeatureDataset" {}>
+  <CatalogPath>\\Network</CatalogPath><Name>Network</Name><DatasetType>esriDTFeatureDataset</DatasetType>
+</DEFeatureDataset>""".format(NAMESPACES)
+
+MATERIAL = """<GPCodedValueDomain2 xsi:type="typens:GPCodedValueDomain2" {}>
+  <DomainName>Pipe Material</DomainName><FieldType>esriFieldTypeSmallInteger</FieldType>
+  <MergePolicy>esriMPTDefaultValue</MergePolicy><SplitPolicy>esriSPTDefaultValue</SplitPolicy>
+  <CodedValues xsi:type="typens:ArrayOfCodedValue">
+    <CodedValue xsi:type="typens:CodedValue"><Name>Copper</Name><Code xsi:type="xs:short">1</Code></CodedValue>
+    <CodedValue xsi:type="typens:CodedValue"><Name>PVC</Name><Code xsi:type="xs:short">2</Code></CodedValue>
+  </CodedValues>
+</GPCodedValueDomain2>""".format(NAMESPACES)
+
+DIAMETER = """<GPRangeDomain2 xsi:type="typens:GPRangeDomain2" {}>
+  <DomainName>Diameter</DomainName><FieldType>esriFieldTypeDouble</FieldType>
+  <MaxValue xsi:type="xs:double">2000</MaxValue><MinValue xsi:type="xs:double">10</MinValue>
+</GPRangeDomain2>""".format(NAMESPACES)
+
+FIELDS = """<Fields xsi:type="typens:Fields"><FieldArray xsi:type="typens:ArrayOfField">
+    <Field xsi:type="typens:Field"><Name>OBJECTID</Name><Type>esriFieldTypeOID</Type><Length>4</Length></Field>
+    {}
+  </FieldArray></Fields>"""
+
+PIPES = """<DEFeatureClassInfo xsi:type="typens:DEFeatureClassInfo" {0}>
+  <CatalogPath>\\Network\\pipes</CatalogPath><Name>pipes</Name><DatasetType>esriDTFeatureClass</DatasetType>
+  {1}
+  <RelationshipClassNames xsi:type="typens:Names"><Name>owners_pipes</Name></RelationshipClassNames>
+  <SubtypeFieldName>KIND</SubtypeFieldName><DefaultSubtypeCode>1</DefaultSubtypeCode>
+  <Subtypes xsi:type="typens:ArrayOfSubtype">
+    <Subtype xsi:type="typens:Subtype"><SubtypeName>Main</SubtypeName><SubtypeCode>1</SubtypeCode>
+      <FieldInfos xsi:type="typens:ArrayOfSubtypeFieldInfo">
+        <SubtypeFieldInfo xsi:type="typens:SubtypeFieldInfo"><FieldName>MATERIAL</FieldName>
+          <DomainName>Pipe Material</DomainName><DefaultValue xsi:type="xs:short">1</DefaultValue></SubtypeFieldInfo>
+      </FieldInfos>
+    </Subtype>
+    <Subtype xsi:type="typens:Subtype"><SubtypeName>Service</SubtypeName><SubtypeCode>2</SubtypeCode></Subtype>
+  </Subtypes>
+  <FeatureType>esriFTSimple</FeatureType><ShapeType>esriGeometryPolyline</ShapeType>
+</DEFeatureClassInfo>""".format(NAMESPACES, FIELDS.format(
+    '<Field xsi:type="typens:Field"><Name>SHAPE</Name><Type>esriFieldTypeGeometry</Type><Length>0</Length></Field>'
+    '<Field xsi:type="typens:Field"><Name>KIND</Name><Type>esriFieldTypeInteger</Type><Length>4</Length></Field>'
+    '<Field xsi:type="typens:Field"><Name>MATERIAL</Name><Type>esriFieldTypeSmallInteger</Type><Length>2</Length>'
+    '</Field>'
+    '<Field xsi:type="typens:Field"><Name>DIAMETER</Name><Type>esriFieldTypeDouble</Type><Length>8</Length></Field>'
+    '<Field xsi:type="typens:Field"><Name>OWNER_ID</Name><Type>esriFieldTypeGUID</Type><Length>38</Length></Field>'))
+
+OWNERS = """<DETableInfo xsi:type="typens:DETableInfo" {0}>
+  <CatalogPath>\\owners</CatalogPath><Name>owners</Name><DatasetType>esriDTTable</DatasetType>
+  {1}
+  <GPFieldInfoExs xsi:type="typens:ArrayOfGPFieldInfoEx">
+    <GPFieldInfoEx xsi:type="typens:GPFieldInfoEx"><Name>STATUS</Name><DomainName>Pipe Material</DomainName>
+    </GPFieldInfoEx>
+  </GPFieldInfoExs>
+  <RelationshipClassNames xsi:type="typens:Names"><Name>owners_pipes</Name></RelationshipClassNames>
+</DETableInfo>""".format(NAMESPACES, FIELDS.format(
+    '<Field xsi:type="typens:Field"><Name>GlobalID</Name><Type>esriFieldTypeGlobalID</Type><Length>38</Length>'
+    '</Field>'
+    '<Field xsi:type="typens:Field"><Name>STATUS</Name><Type>esriFieldTypeSmallInteger</Type><Length>2</Length>'
+    '</Field>'))
+
+RELATIONSHIP = """<DERelationshipClassInfo xsi:type="typens:DERelationshipClassInfo" {}>
+  <CatalogPath>\\owners_pipes</CatalogPath><Name>owners_pipes</Name>
+  <OriginClassNames xsi:type="typens:Names"><Name>owners</Name></OriginClassNames>
+  <DestinationClassNames xsi:type="typens:Names"><Name>pipes</Name></DestinationClassNames>
+  <OriginClassKeys xsi:type="typens:ArrayOfRelationshipClassKey">
+    <RelationshipClassKey xsi:type="typens:RelationshipClassKey"><ObjectKeyName>OWNER_ID</ObjectKeyName>
+      <KeyRole>esriRelKeyRoleOriginForeign</KeyRole></RelationshipClassKey>
+    <RelationshipClassKey xsi:type="typens:RelationshipClassKey"><ObjectKeyName>GlobalID</ObjectKeyName>
+      <KeyRole>esriRelKeyRoleOriginPrimary</KeyRole></RelationshipClassKey>
+  </OriginClassKeys>
+  <IsAttachmentRelationship>false</IsAttachmentRelationship>
+</DERelationshipClassInfo>""".format(NAMESPACES)
+
+WORKSPACE = """<DEWorkspace xsi:type="typens:DEWorkspace" {}><CatalogPath>\\</CatalogPath></DEWorkspace>""".format(
+    NAMESPACES)
+
+ITEMS = [('\\', WORKSPACE), ('\\Network', DATASET), ('Pipe Material', MATERIAL), ('Diameter', DIAMETER),
+         ('\\Network\\pipes', PIPES), ('\\owners', OWNERS), ('\\owners_pipes', RELATIONSHIP)]
+
+
+def test_parse_domains():
+    material = parse_domain(item_kind(MATERIAL)[1])
+    assert material == ('Pipe Material', 'CodedValue', 'Short', {1: 'Copper', 2: 'PVC'})
+
+    diameter = parse_domain(item_kind(DIAMETER)[1])
+    assert (diameter.domain_type, diameter.field_type, diameter.coded_values) == ('Range', 'Double', None)
+
+
+def test_parse_layers():
+    pipes = parse_layer(item_kind(PIPES)[1], 'Network')
+    assert (pipes.name, pipes.dataset, pipes.kind) == ('pipes', 'Network', 'FeatureClass')
+    assert [(f.name, f.type) for f in pipes.fields] == [
+        ('OBJECTID', 'OID'), ('SHAPE', 'Geometry'), ('KIND', 'Integer'), ('MATERIAL', 'SmallInteger'),
+        ('DIAMETER', 'Double'), ('OWNER_ID', 'GUID')]
+    assert pipes.relationship_class_names == ['owners_pipes']
+    assert sorted(pipes.subtypes) == [1, 2]
+    assert pipes.subtypes[1]['Name'] == 'Main'
+    assert pipes.subtypes[1]['Default'] and not pipes.subtypes[2]['Default']
+    assert pipes.subtypes[1]['SubtypeField'] == 'KIND'
+    assert pipes.subtypes[1]['FieldValues']['MATERIAL'] == ('1', 'Pipe Material')
+    assert pipes.subtypes[2]['FieldValues']['MATERIAL'] == (None, None)
+
+    # without subtypes the field domains are reported under code 0, as by arcpy
+    owners = parse_layer(item_kind(OWNERS)[1])
+    assert owners.subtypes == {0: {'Name': '', 'Default': True, 'SubtypeField': '', 'FieldValues': {
+        'OBJECTID': (None, None), 'GlobalID': (None, None), 'STATUS': (None, 'Pipe Material')}}}
+
+
+def test_parse_relationship():
+    rel = parse_relationship(item_kind(RELATIONSHIP)[1])
+    assert rel == ('owners_pipes', 'owners', 'pipes',
+                   [('GlobalID', 'OriginPrimary'), ('OWNER_ID', 'OriginForeign')], False)
+
+
+def test_catalog_from_items():
+    catalog = GdbItemsCatalog('network.gdb')
+    catalog.load_items(ITEMS)
+    catalog.scanned = True
+
+    assert catalog.datasets == ['Network']
+    assert catalog.tables == ['owners']
+    assert catalog.feature_classes == {'': [], 'Network': ['pipes']}
+    assert sorted(catalog.domains) == ['Diameter', 'Pipe Material']
+    assert catalog.exists('PIPES') and catalog.oid_field('pipes') == 'OBJECTID'
+    assert catalog.arcpy_calls == 0
+
+
+def test_process_without_arcpy(tmp_path):
+    with open(str(tmp_path / 'network.gdb.yml'), 'w', encoding='utf-8') as f:
+        f.write('Schemas: [network]\nFeatureDatasets:\n  network: [Network]\n')
+
+    filegdb = FileGDB(str(tmp_path / 'network.gdb'), 'EPSG:3857', backend='gdal')
+    filegdb.catalog.load_items(ITEMS)
+    filegdb.catalog.scanned = True
+
+    filegdb.open_files()
+    filegdb.process_domains()
+    filegdb.process_subtypes()
+    filegdb.process_relations()
+    filegdb.process_schemas()
+
+    assert sorted(filegdb.lookup_tables) == ['Pipe_Material_lut', 'pipes_KIND_sub']
+    assert filegdb.lookup_tables['Pipe_Material_lut'] == ('Code', 'SmallInteger', [(1, 'Copper'), (2, 'PVC')])
+    assert filegdb.lookup_tables['pipes_KIND_sub'] == ('KIND', 'Integer', [(1, 'Main'), (2, 'Service')])
+
+    foreign_keys = [(fk.table, fk.column, fk.ref_table) for fk in filegdb.ddl.foreign_keys.values()]
+    assert ('pipes', 'OWNER_ID', 'owners') in foreign_keys
+    assert ('pipes', 'MATERIAL', 'Pipe_Material_lut') in foreign_keys
+    assert ('owners', 'STATUS', 'Pipe_Material_lut') in foreign_keys
+    assert filegdb.table_schemas == {'pipes': 'network'}
+
+
+# -------------------------------------------------------------------------------
+# Fixture geodatabase written with the OpenFileGDB driver (GDAL 3.6 or later)
+#
+def test_gdal_fixture_geodatabase(tmp_path):
+    ogr = pytest.importorskip('osgeo.ogr')
+    from osgeo import gdal, osr
+
+    gdal.UseExceptions()
+    if tuple(int(v) for v in gdal.__version__.split('.')[:2]) < (3, 6):
+        pytest.skip('OpenFileGDB write support requires GDAL 3.6')
+
+    workspace = str(tmp_path / 'fixture.gdb')
+    ds = ogr.GetDriverByName('OpenFileGDB').CreateDataSource(workspace)
+
+    domain = ogr.CreateCodedFieldDomain('Status', '', ogr.OFTInteger, ogr.OFSTInt16, {1: 'Open', 2: 'Closed'})
+    assert ds.AddFieldDomain(domain)
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(3857)
+    owners = ds.CreateLayer('owners', geom_type=ogr.wkbNone)
+    owners.CreateField(ogr.FieldDefn('OWNER_ID', ogr.OFTInteger))
+    parcels = ds.CreateLayer('parcels', srs, ogr.wkbPolygon, ['FEATURE_DATASET=Cadastre'])
+    parcels.CreateField(ogr.FieldDefn('OWNER_ID', ogr.OFTInteger))
+    status = ogr.FieldDefn('STATUS', ogr.OFTInteger)
+    status.SetSubType(ogr.OFSTInt16)
+    status.SetDomainName('Status')
+    parcels.CreateField(status)
+
+    for oid in range(1, 4):
+        feature = ogr.Feature(parcels.GetLayerDefn())
+        feature.SetField('OWNER_ID', oid)
+        feature.SetGeometry(ogr.CreateGeometryFromWkt('POLYGON ((0 0,1 0,1 1,0 0))'))
+        parcels.CreateFeature(feature)
+
+    relationship = gdal.Relationship('owners_parcels', 'owners', 'parcels', gdal.GRC_ONE_TO_MANY)
+    relationship.SetLeftTableFields(['OWNER_ID'])
+    relationship.SetRightTableFields(['OWNER_ID'])
+    assert ds.AddRelationship(relationship)
+    ds = None
+
+    catalog = GdbItemsCatalog(workspace)
+    catalog.scan()
+
+    assert catalog.datasets == ['Cadastre']
+    assert catalog.tables == ['owners']
+    assert catalog.feature_classes['Cadastre'] == ['parcels']
+    assert catalog.domains['Status'].coded_values == {1: 'Open', 2: 'Closed'}
+    assert catalog.subtypes('parcels')[0]['FieldValues']['STATUS'][1] == 'Status'
+    assert [f.type for f in catalog.fields('parcels')][:2] == ['OID', 'Geometry']
+
+    rel = catalog.relationships['owners_parcels']
+    assert (rel.origin, rel.destination, rel.origin_keys) == (
+        'owners', 'parcels', [('OWNER_ID', 'OriginPrimary'), ('OWNER_ID', 'OriginForeign')])
+    assert catalog.row_count('parcels') == 3
+    assert catalog.oid_range('parcels') == (1, 3)
+    assert path.exists(workspace)
+
+
+def test_backends_implement_the_catalog_interface():
+    class PartialCatalog(Catalog):
+        def read(self):
+            pass
+
+    with pytest.raises(TypeError):
+        PartialCatalog('network.gdb')
+
+    assert not GdbItemsCatalog.__abstractmethods__
@@ -0,0 +1,259 @@
+import struct
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+
+import pytest
+
+from benchmarks.synthetic_arcpy import SyntheticCatalog
+from benchmarks import synthetic_gdbtable
+from benchmarks.synthetic_gdbtable import (GEOMETRY_INFO, encode_shape, table_file, varuint, write_catalog,
+                                           write_table, write_workspace)
+from fgdb2postgis.copy_loader import BlockStream, CopyLoader, CopyStream, table_columns
+from fgdb2postgis.filegdb import FileGDB
+from fgdb2postgis.gdbtable import SHAPE_CURVES, GdbTable, GdbTableSource, decode_shape
+from fgdb2postgis.postgis import PostGIS
+
+
+FIELDS = [
+    ('OBJECTID', 'OID', 4, False),
+    ('SHAPE', 'Geometry', 0, True),
+    ('NAME', 'String', 20, True),
+    ('CODE', 'SmallInteger', 2, True),
+    ('COUNT', 'Integer', 4, False),
+    ('TOTAL', 'BigInteger', 8, True),
+    ('RATIO', 'Single', 4, True),
+    ('CREATED', 'Date', 8, True),
+    ('DAY', 'DateOnly', 8, True),
+    ('HOUR', 'TimeOnly', 8, True),
+    ('STAMP', 'TimestampOffset', 10, True),
+    ('GUID', 'GUID', 16, True),
+    ('DATA', 'Blob', 0, True)
+]
+
+
+def point_wkb(x, y):
+    return b'\x01' + struct.pack('<I2d', 1, x, y)
+
+
+def ring(*points):
+    return struct.pack('<I', len(points)) + struct.pack('<{}d'.format(2 * len(points)), *sum(points, ()))
+
+
+def sample_row(oid):
+    if oid % 7 == 0:
+        return (oid, None, None, None, oid, None, None, None, None, None, None, None, None)
+
+    return (
+        oid,
+        point_wkb(1000 + oid, 2000 - oid),
+        'row {}'.format(oid),
+        oid % 100,
+        oid * 3,
+        oid * 10 ** 10,
+        oid / 4,
+        datetime(2020, 1, 1) + timedelta(minutes=oid, milliseconds=250),
+        date(2019, 12, 31) + timedelta(days=oid),
+        time(oid % 24, 30, 15),
+        datetime(2021, 6, 1, 12, tzinfo=timezone(timedelta(minutes=120 - oid % 5 * 60))) + timedelta(hours=oid),
+        '{{{}}}'.format(str(uuid.UUID(int=oid * 7919)).upper()),
+        bytes(range(oid % 17))
+    )
+
+
+def rows_of(rows, deleted=()):
+    return [None if row[0] in deleted else row for row in rows]
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    # 3000 rows, block 2 (rows 1025-2048) deleted and block 3 partly deleted
+    deleted = set(range(1025, 2049)) | {2050, 2999}
+    rows = [sample_row(oid) for oid in range(1, 3001)]
+    write_catalog(str(tmp_path), ['samples', 'sparse'])
+    write_table(table_file(str(tmp_path), 9), FIELDS, rows_of(rows, deleted), ('Point', False, False))
+    write_table(table_file(str(tmp_path), 10), FIELDS, rows_of(rows, deleted), ('Point', False, False), sparse=True)
+
+    return str(tmp_path), [row for row in rows if row[0] not in deleted]
+
+
+# header and coordinates of a point, linestring or single ring polygon
+def coordinates(wkb):
+    offset = {1: 5, 2: 9, 3: 13}[wkb[1]]
+    return struct.unpack_from('<{}d'.format((len(wkb) - offset) // 8), wkb, offset)
+
+
+def header(wkb):
+    return wkb[:{1: 5, 2: 9, 3: 13}[wkb[1]]]
+
+
+def assert_rows_equal(actual, expected):
+    assert len(actual) == len(expected)
+    for got, row in zip(actual, expected):
+        for value, expected_value in zip(got, row):
+            if isinstance(expected_value, bytes) and expected_value[:1] == b'\x01' and len(expected_value) > 20:
+                assert header(value) == header(expected_value)
+                assert coordinates(value) == pytest.approx(coordinates(expected_value), abs=1e-4)
+            else:
+                assert value == expected_value
+
+
+def test_read_header_and_fields(workspace):
+    folder, rows = workspace
+    with GdbTable(table_file(folder, 9)) as table:
+        assert table.valid_rows == len(rows)
+        assert table.total_rows == 3000
+        assert table.geometry == ('Point', False, False)
+        assert table.geometry_info[:3] == GEOMETRY_INFO[:3]
+        assert [(f.name, f.type, f.nullable) for f in table.fields] == [(f[0], f[1], f[3]) for f in FIELDS]
+
+
+@pytest.mark.parametrize('layer', ['samples', 'sparse'])
+def test_rows_match_the_written_values(workspace, layer):
+    folder, rows = workspace
+    source = GdbTableSource(folder, 'EPSG:3857', 'EPSG:3857', block_rows=500)
+    cursor_fields = ['OID@', 'SHAPE@WKB'] + [field[0] for field in FIELDS[2:]]
+
+    assert_rows_equal(list(source.rows(layer, cursor_fields)), rows)
+    source.close()
+
+
+def test_oid_ranges(workspace):
+    folder, rows = workspace
+    source = GdbTableSource(folder, 'EPSG:3857', 'EPSG:3857', block_rows=100)
+
+    found = list(source.rows('sparse', ['OID@', 'NAME'], '"OBJECTID" >= 1000 AND "OBJECTID" < 2100'))
+    assert found == [(row[0], row[2]) for row in rows if 1000 <= row[0] < 2100]
+
+    with pytest.raises(ValueError):
+        list(source.rows('sparse', ['OID@'], '"CODE" = 1'))
+    with pytest.raises(IOError):
+        source.table('missing')
+    source.close()
+
+
+@pytest.mark.parametrize('layer', ['samples', 'sparse'])
+def test_copy_blocks_match_the_row_encoder(workspace, layer):
+    folder, rows = workspace
+    source = GdbTableSource(folder, 'EPSG:3857', 'EPSG:3857', block_rows=700)
+    fields, geometry = source.describe(layer)
+    columns = table_columns(fields, geometry, 3857)
+
+    blocks = BlockStream(source.copy_blocks(layer, columns), batch_bytes=4096)
+    stream = CopyStream(columns, source.rows(layer, [column[2] for column in columns]), batch_bytes=4096)
+    data = b''.join(iter(blocks.read, b''))
+
+    assert data == b''.join(iter(stream.read, b''))
+    assert blocks.row_count == len(rows)
+    assert blocks.done and not blocks.errors
+    source.close()
+
+
+def test_loader_streams_blocks_unless_reprojecting(workspace):
+    folder, rows = workspace
+    source = GdbTableSource(folder, 'EPSG:3857', 'EPSG:3857')
+    fields, geometry = source.describe('samples')
+    columns = table_columns(fields, geometry, 3857)
+
+    assert isinstance(CopyLoader('', source, 3857).layer_rows('samples', columns, geometry), BlockStream)
+    assert not isinstance(CopyLoader('', source, 3857, reprojector=object()).layer_rows('samples', columns, None),
+                          BlockStream)
+    source.close()
+
+
+def test_invalid_geometries_are_skipped(workspace):
+    folder, rows = workspace
+    source = GdbTableSource(folder, 'EPSG:3857', 'EPSG:3857')
+    fields, geometry = source.describe('samples')
+    columns = table_columns(fields, geometry, 3857)
+
+    encode_geometry = columns[1][3]
+
+    def encoder(value):
+        if coordinates(value)[0] > 1010:
+            raise ValueError('bad geometry')
+        return encode_geometry(value)
+
+    columns[1] = columns[1][:3] + (encoder,)
+    rows_read, data, errors = next(source.copy_blocks('samples', columns, '"OBJECTID" >= 1 AND "OBJECTID" < 20'))
+
+    assert rows_read == len([row for row in rows if row[0] < 20 and (row[1] is None or row[0] <= 10)])
+    assert [oid for oid, error in errors] == [11, 12, 13, 15, 16, 17, 18, 19]
+    source.close()
+
+
+def test_curves_and_multipatches_are_skipped(tmp_path, monkeypatch, capsys):
+    # true curve polyline and multipatch blobs between valid points
+    unsupported = {4: varuint(50 | SHAPE_CURVES) + b'\x00' * 8, 6: varuint(54) + b'\x00' * 8}
+    monkeypatch.setattr(synthetic_gdbtable, 'encode_shape',
+                        lambda wkb, info=GEOMETRY_INFO: unsupported.get(wkb) or encode_shape(wkb, info))
+
+    fields = FIELDS[:3]
+    rows = [(oid, oid if oid in unsupported else point_wkb(oid, oid), 'row {}'.format(oid)) for oid in range(1, 11)]
+    write_catalog(str(tmp_path), ['shapes'])
+    write_table(table_file(str(tmp_path), 9), fields, rows, ('Point', False, False))
+
+    source = GdbTableSource(str(tmp_path), 'EPSG:3857', 'EPSG:3857')
+    fields, geometry = source.describe('shapes')
+    columns = table_columns(fields, geometry, 3857)
+
+    rows_read, data, errors = next(source.copy_blocks('shapes', columns))
+    assert rows_read == 8
+    assert [oid for oid, error in errors] == [4, 6]
+    assert 'Unsupported geometry type' in errors[0][1]
+
+    found = list(source.rows('shapes', ['OID@', 'SHAPE@WKB']))
+    assert [oid for oid, shape in found if shape is None] == [4, 6]
+    assert 'shapes OBJECTID 4 loaded without geometry' in capsys.readouterr().out
+    source.close()
+
+
+def test_source_does_not_reproject(tmp_path):
+    with pytest.raises(ValueError):
+        GdbTableSource(str(tmp_path), 'EPSG:3857', 'EPSG:4326')
+
+
+def test_polygon_rings_are_grouped_by_orientation():
+    # esri polygons: clockwise outer rings, counter-clockwise holes
+    outer = ring((0.0, 0.0), (0.0, 10.0), (10.0, 10.0), (10.0, 0.0), (0.0, 0.0))
+    hole = ring((2.0, 2.0), (4.0, 2.0), (4.0, 4.0), (2.0, 4.0), (2.0, 2.0))
+    other = ring((20.0, 0.0), (20.0, 5.0), (25.0, 5.0), (25.0, 0.0), (20.0, 0.0))
+    first = b'\x01' + struct.pack('<II', 3, 2) + outer + hole
+    second = b'\x01' + struct.pack('<II', 3, 1) + other
+
+    multi = b'\x01' + struct.pack('<II', 6, 2) + first + second
+    assert decode_shape(encode_shape(multi), GEOMETRY_INFO) == multi
+    assert decode_shape(encode_shape(first), GEOMETRY_INFO) == first
+
+    line = b'\x01' + struct.pack('<II', 5, 2) + b'\x01' + struct.pack('<I', 2) + ring((0.0, 0.0), (1.0, 1.0)) + \
+        b'\x01' + struct.pack('<I', 2) + ring((5.0, 5.0), (6.0, 7.5))
+    assert decode_shape(encode_shape(line), GEOMETRY_INFO) == line
+
+
+def test_synthetic_workspace_matches_arcpy_rows(tmp_path):
+    catalog = SyntheticCatalog(rows=300, datasets=1, layers=3, root_layers=0, tables=1)
+    folder = write_workspace(str(tmp_path / 'synthetic.gdb'), catalog)
+    source = GdbTableSource(folder, 'EPSG:3857', 'EPSG:3857', block_rows=128)
+
+    for name, layer in catalog.layers.items():
+        fields, geometry = source.describe(name)
+        assert fields == [(field.name, field.type, field.length) for field in layer['fields']]
+
+        columns = table_columns(fields, geometry, 3857)
+        cursor_fields = [column[2] for column in columns]
+        assert_rows_equal(list(source.rows(name, cursor_fields)), list(catalog.rows(name, cursor_fields)))
+    source.close()
+
+
+def test_tables_of_the_gdal_catalog_are_described_without_arcpy(tmp_path):
+    catalog = SyntheticCatalog(rows=20, datasets=1, layers=1, root_layers=0, tables=1)
+    folder = write_workspace(str(tmp_path / 'synthetic.gdb'), catalog)
+    with open(folder + '.yml', 'w', encoding='utf-8') as f:
+        f.write('Partitions:\n  fc_1_1: {hash: OBJECTID, partitions: 2}\n')
+    filegdb = FileGDB(folder, 'EPSG:3857', backend='gdal')
+
+    # partitioned tables created for ogr2ogr, which reprojects the rows itself
+    source = PostGIS('localhost', 5432, 'postgres', '', 'gis', 'EPSG:4326').layer_source(filegdb, 'ogr2ogr')
+    assert isinstance(source, GdbTableSource)
+    for name, layer in catalog.layers.items():
+        assert source.describe(name)[0] == [(field.name, field.type, field.length) for field in layer['fields']]
+    source.close()
@@ -0,0 +1,23 @@
+from fgdb2postgis.manifest import Manifest
+
+
+def test_resume_runs_the_phases_with_errors_again(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    manifest = Manifest(manifest_path)
+    manifest.run('apply_sql:create_indexes.sql', lambda: 0)
+    manifest.run('apply_sql:create_constraints.sql', lambda: 2)
+    manifest.run('create_schemas', lambda: True)
+    manifest.complete_layer('roads', 100)
+
+    resumed = Manifest(manifest_path, resume=True)
+    assert resumed.phase_done('apply_sql:create_indexes.sql')
+    assert not resumed.phase_done('apply_sql:create_constraints.sql')
+    assert not resumed.phase_done('apply_sql:split_schemas.sql')
+    assert resumed.phase_done('create_schemas')
+    assert resumed.layer_rows('roads') == 100
+
+    calls = []
+    resumed.run('apply_sql:create_indexes.sql', calls.append, 'indexes')
+    resumed.run('apply_sql:create_constraints.sql', lambda: calls.append('constraints') and 0)
+    assert calls == ['constraints']
+    assert resumed.phase_done('apply_sql:create_constraints.sql')
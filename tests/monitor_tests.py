@@ -0,0 +1,42 @@
+from fgdb2postgis.monitor import ProgressTracker, format_eta
+
+
+def test_copy_rates_and_eta():
+    tracker = ProgressTracker({'roads': 1000})
+
+    tracker.report({'copy': [(101, 'roads', 100, 10240, 0)]}, 10.0)
+    lines, events = tracker.report({'copy': [(101, 'roads', 300, 30720, 0)]}, 12.0)
+
+    assert lines == [' roads: copy 300 rows of 1000 (100 rows/s, 10.0 KB/s) ETA 00:00:07']
+    assert events == []
+
+
+def test_index_phase_and_stall():
+    tracker = ProgressTracker(stall_seconds=30)
+    sample = {'index': [(102, 'parcels', 'parcels_geom_geom_idx', 'building index: loading tuples in tree',
+                         50, 200, 0, 0)]}
+
+    lines, events = tracker.report(sample, 0.0)
+    assert lines == [' parcels: index parcels_geom_geom_idx building index: loading tuples in tree 25% ETA --:--:--']
+
+    tracker.report(sample, 20.0)
+    lines, events = tracker.report(sample, 40.0)
+    assert ' parcels: no progress for 40s (pid 102)' in lines
+    assert events == [('stall', 'parcels', 40.0)]
+
+    # reported once
+    lines, events = tracker.report(sample, 50.0)
+    assert events == []
+
+
+def test_lock_wait():
+    tracker = ProgressTracker()
+    query = 'ALTER TABLE "roads" SET SCHEMA "transport"'
+    sample = {'activity': [(103, 'Lock', 'relation', 12.5, query, [104], 'SELECT count(*) FROM roads')]}
+
+    lines, events = tracker.report(sample, 0.0)
+
+    assert lines == [' pid 103 waiting 12s for relation lock: {}'.format(query),
+                     '  blocked by pid 104: SELECT count(*) FROM roads']
+    assert events == [('lock_wait', query, 12.5)]
+    assert format_eta(3725) == '01:02:05'
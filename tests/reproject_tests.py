@@ -0,0 +1,74 @@
+import struct
+
+import pytest
+
+from fgdb2postgis.copy_loader import to_ewkb
+from fgdb2postgis.reproject import coordinate_runs, server_graph, transform_wkbs
+
+
+def polygon_wkb(x, y):
+    ring = [x, y, x + 10, y, x + 10, y + 10, x, y + 10, x, y]
+    return b'\x01' + struct.pack('<III10d', 3, 1, 5, *ring)
+
+
+def shift(xx, yy):
+    return xx + 1000, yy * 2
+
+
+def test_coordinate_runs():
+    point_z = b'\x00' + struct.pack('>I3d', 1001, 1, 2, 3)
+    assert coordinate_runs(point_z) == (29, [(5, 1, 3, '>')])
+
+    # polygon promoted to multi polygon (ewkb with srid)
+    multi = to_ewkb(polygon_wkb(0, 0), 3857)
+    assert [run[:3] for run in coordinate_runs(multi)[1]] == [(26, 5, 2)]
+
+    lines = b'\x01' + struct.pack('<II', 5, 2) + b''.join(
+        b'\x01' + struct.pack('<II4d', 2, 2, 0, 0, 1, 1) for part in range(2))
+    assert [run[:3] for run in coordinate_runs(lines)[1]] == [(18, 2, 2), (59, 2, 2)]
+
+
+def test_transform_wkbs():
+    point_z = b'\x00' + struct.pack('>I3d', 1001, 1, 2, 3)
+    wkbs = transform_wkbs([polygon_wkb(5, 5), None, point_z], shift)
+
+    assert wkbs[1] is None
+    assert struct.unpack('<10d', wkbs[0][13:]) == (1005, 10, 1015, 10, 1015, 30, 1005, 30, 1005, 10)
+    assert wkbs[2][:5] == point_z[:5]
+    assert struct.unpack('>3d', wkbs[2][5:]) == (1001, 4, 3)
+
+
+def test_transform_rows_with_pyproj():
+    pytest.importorskip('pyproj')
+    from fgdb2postgis.reproject import transform_rows
+
+    rows = transform_rows([(1, b'\x01' + struct.pack('<I2d', 1, 0, 0), 'a')], 1, 'EPSG:4326', 'EPSG:3857')
+    x, y = struct.unpack('<2d', rows[0][1][5:])
+    assert rows[0][0] == 1 and rows[0][2] == 'a'
+    assert abs(x) < 1e-6 and abs(y) < 1e-6
+
+
+def test_server_graph():
+    tables = [
+        ('roads', [('id', 'integer'), ('geom', 'geometry(MultiLineString,2100)'), ('NAME', 'character varying')],
+         'fgdb2postgis_reproject.roads_id_seq', 1, 25),
+        ('codes', [('id', 'integer'), ('CODE', 'integer')], 'fgdb2postgis_reproject.codes_id_seq', 1, 3)
+    ]
+    graph = server_graph(tables, 3857, chunk_rows=10)
+    kinds = [stmt.kind for stmt in graph.statements]
+    sql_texts = [stmt.sql for stmt in graph.statements]
+
+    chunks = [stmt for stmt in graph.statements if stmt.kind == 'transform']
+    assert len(chunks) == 3 and all(stmt.shared for stmt in chunks)
+    assert chunks[0].sql == (
+        'INSERT INTO "public"."roads" SELECT "id", '
+        'ST_Transform("geom", 3857)::geometry(MultiLineString,3857) AS "geom", "NAME" '
+        'FROM "fgdb2postgis_reproject"."roads" WHERE "id" >= 1 AND "id" < 11')
+
+    # primary key after all chunks, gist index last
+    pkey = next(stmt for stmt in graph.statements if 'PRIMARY KEY' in stmt.sql)
+    assert set(chunks) <= pkey.deps
+    assert 'CREATE INDEX "roads_geom_geom_idx" ON "public"."roads" USING GIST ("geom")' in sql_texts
+    assert 'ALTER TABLE "fgdb2postgis_reproject"."codes" SET SCHEMA "public"' in sql_texts
+    assert kinds.count('reproject') == len(kinds) - 3
+    assert sql_texts[-1] == 'DROP SCHEMA IF EXISTS "fgdb2postgis_reproject"'
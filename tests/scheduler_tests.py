@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from fgdb2postgis.scheduler import Scheduler
+from fgdb2postgis.telemetry import Metrics
+
+
+def test_dependencies_and_results():
+    order = []
+    scheduler = Scheduler()
+    scheduler.add('scan', order.append, 'scan')
+    scheduler.add('schemas', order.append, 'schemas', deps=['scan'])
+    scheduler.add('domains', order.append, 'domains', deps=['scan'])
+    scheduler.add('apply_sql', lambda: order.append('apply_sql') or len(order), deps=['schemas', 'domains', None])
+
+    results = scheduler.run()
+    assert order[0] == 'scan'
+    assert order[-1] == 'apply_sql'
+    assert results['apply_sql'] == 4
+
+
+def test_independent_tasks_overlap_and_groups_do_not():
+    loading = threading.Event()
+    running = []
+    overlaps = []
+
+    def load():
+        loading.set()
+        time.sleep(0.2)
+
+    def metadata(name):
+        assert loading.wait(5)
+        if running:
+            overlaps.append((running[0], name))
+        running.append(name)
+        time.sleep(0.05)
+        running.remove(name)
+
+    scheduler = Scheduler()
+    scheduler.add('load_database', load)
+    scheduler.add('process_domains', metadata, 'process_domains', group='filegdb')
+    scheduler.add('process_subtypes', metadata, 'process_subtypes', group='filegdb')
+    scheduler.run()
+
+    assert overlaps == []
+
+
+def test_failure_stops_dependents(capsys):
+    ran = []
+
+    def fail():
+        raise RuntimeError('connection refused')
+
+    metrics = Metrics()
+    scheduler = Scheduler(metrics=metrics)
+    scheduler.add('connect', fail)
+    scheduler.add('create_schemas', ran.append, 'create_schemas', deps=['connect'])
+    scheduler.add('scan', ran.append, 'scan')
+
+    with pytest.raises(RuntimeError):
+        scheduler.run()
+
+    assert 'create_schemas' not in ran
+    assert 'Task connect failed: connection refused' in capsys.readouterr().out
+    assert [event['phase'] for event in metrics.events if event['phase'] == 'connect'] == ['connect']
+
+
+def test_unknown_dependency():
+    scheduler = Scheduler()
+    scheduler.add('scan', print)
+    with pytest.raises(ValueError):
+        scheduler.add('apply_sql', print, deps=['load_database'])
+    with pytest.raises(ValueError):
+        scheduler.add('scan', print)
@@ -0,0 +1,87 @@
+import io
+
+import psycopg2
+
+from fgdb2postgis.sql_script import ScriptRunner, iter_statements
+
+
+def statements(text):
+    return list(iter_statements(io.StringIO(text)))
+
+
+def test_split_on_semicolons_with_lines():
+    assert statements("SELECT 1;\n\nSELECT 2;\nSELECT 3") == [
+        ('SELECT 1', 1), ('SELECT 2', 3), ('SELECT 3', 4)]
+
+
+def test_semicolons_in_strings_and_identifiers():
+    text = "INSERT INTO \"a;b\" VALUES ('x;y', 'it''s;');\nSELECT E'\\';';"
+    assert statements(text) == [
+        ("INSERT INTO \"a;b\" VALUES ('x;y', 'it''s;')", 1),
+        ("SELECT E'\\';'", 2)]
+
+
+def test_dollar_quoting():
+    text = ("CREATE FUNCTION f() RETURNS int AS $body$\nBEGIN\n  PERFORM 1; RETURN $$;$$;\n"
+            "END;\n$body$ LANGUAGE plpgsql;\nSELECT $1;")
+    result = statements(text)
+
+    assert len(result) == 2
+    assert result[0][0].endswith('$body$ LANGUAGE plpgsql')
+    assert 'RETURN $$;$$;' in result[0][0]
+    assert result[1] == ('SELECT $1', 6)
+
+
+def test_comments_and_meta_commands():
+    text = ("-- header; comment\n\\echo a;b\n/* block; /* nested; */ */ SELECT 1; -- tail;\n"
+            "SELECT '--not a comment';")
+    assert statements(text) == [('SELECT 1', 3), ("SELECT '--not a comment'", 4)]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, statement):
+        self.conn.round_trips += 1
+        if 'SELECT fail' in statement:
+            raise psycopg2.ProgrammingError('failed')
+        self.conn.executed.append(statement)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeConnection:
+    autocommit = False
+
+    def __init__(self):
+        self.round_trips = 0
+        self.commits = 0
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_runner_batches_and_isolates_failures(tmp_path):
+    sql_file = tmp_path / 'script.sql'
+    sql_file.write_text('SELECT 1;\nSELECT 2;\nSELECT fail;\nSELECT 4;\nSELECT 5;\n')
+
+    conn = FakeConnection()
+    runner = ScriptRunner(conn, batch_size=2)
+    failures = runner.run(str(sql_file))
+
+    assert failures == [(str(sql_file), 3, 'failed')]
+    assert runner.executed == 4
+    assert conn.commits == 3
+    assert 'SELECT 4' in conn.executed
@@ -0,0 +1,44 @@
+import json
+from fgdb2postgis.telemetry import Metrics
+
+class FakeCatalog:
+    arcpy_calls = 3
+
+    def scan(self):
+        self.arcpy_calls += 7
+
+
+def test_phase_accumulates_layer_events(tmp_path):
+    metrics_file = tmp_path / 'metrics.jsonl'
+    metrics = Metrics(str(metrics_file))
+
+    with metrics.phase('load_database'):
+        metrics.event('load_layer', 'roads', duration=1.5, rows=100, bytes=4096)
+        metrics.event('load_layer', 'parcels', duration=0.5, rows=20, bytes=None)
+        with metrics.phase('apply_sql:create_indexes.sql'):
+            metrics.add(statements=12, sql_time=0.25)
+    metrics.close()
+
+    events = [json.loads(line) for line in metrics_file.read_text().splitlines()]
+    assert [(e['phase'], e['layer']) for e in events] == [
+        ('load_layer', 'roads'), ('load_layer', 'parcels'),
+        ('apply_sql:create_indexes.sql', None), ('load_database', None)]
+
+    phase = events[-1]
+    assert phase['rows'] == 120
+    assert phase['bytes'] == 4096
+    assert phase['statements'] == 12
+    assert phase['sql_time'] == 0.25
+    assert phase['duration'] is not None
+    assert events[2]['rows'] is None
+
+
+def test_arcpy_calls_and_summary(capsys):
+    metrics = Metrics()
+    metrics.catalog = FakeCatalog()
+
+    metrics.run('process_domains', metrics.catalog.scan)
+    metrics.summary()
+
+    assert metrics.events[0]['arcpy_calls'] == 7
+    assert 'process_domains' in capsys.readouterr().out